@@ -0,0 +1,180 @@
+"""
+Benchmark of every phase of a merge, on synthetic original and new workbooks of a configurable size and overlap. Each
+merge runs in a fresh process, so that the peak memory of one merge is not hidden by the one before it. Results can be
+written as JSON to compare them across releases.
+
+Usage: python -m benchmarks.merge_phases [--rows ROWS] [--columns COLUMNS] [--overlap RATIO] [--new-rows RATIO]
+                                         [--shuffle-columns] [--header-row ROW] [--engines ENGINE [ENGINE ...]]
+                                         [--workers WORKERS] [--repeat REPEAT] [--seed SEED] [--output PATH]
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+
+import merger
+from merger.merger import Merger, MergeEngine
+from merger.metrics import PHASES, peak_rss_mib
+
+_COLUMN_KEY = "Key"
+
+
+def _cell_value(rng: random.Random, row_index: int, col_index: int):
+    """Value of a generated cell, alternating between the value types that spreadsheets usually hold"""
+    kind = col_index % 4
+    if kind == 0:
+        return rng.randrange(1_000_000)
+    elif kind == 1:
+        return round(rng.random() * 1000, 2)
+    elif kind == 2:
+        return f"text {row_index}-{rng.randrange(1000)}"
+    return None if rng.random() < 0.2 else f"status {rng.randrange(10)}"
+
+
+def generate_workbooks(original_path: Path, new_path: Path, rows: int, columns: int, overlap: float,
+                       new_rows: float, shuffle_columns: bool, header_row: int, seed: int):
+    """
+    Write a synthetic original workbook, along with a new workbook to merge into it.
+
+    Args:
+        original_path (Path): Path of the original workbook.
+        new_path (Path): Path of the new workbook.
+        rows (int): Amount of data rows of the original workbook.
+        columns (int): Amount of columns of both workbooks, including the key column.
+        overlap (float): Ratio of the original rows that are updated by the new workbook.
+        new_rows (float): Amount of new rows the new workbook adds, as a ratio of the original rows.
+        shuffle_columns (bool): Whether the columns of the new workbook are in a different order than the original's.
+        header_row (int): Row number of the header row of both workbooks.
+        seed (int): Seed of the generated values, so that the same arguments always generate the same workbooks.
+    """
+    rng = random.Random(seed)
+    labels = [_COLUMN_KEY, *(f"Column {col_index}" for col_index in range(1, columns))]
+
+    original_wb = Workbook(write_only=True)
+    original_sheet = original_wb.create_sheet("Main")
+    for _ in range(header_row - 1):
+        original_sheet.append([])
+    original_sheet.append(labels)
+    # Data cells are styled, so that inserted rows have styles to copy
+    font = Font(name="Calibri", size=10)
+    fill = PatternFill("solid", fgColor="DDEBF7")
+    for row_index in range(rows):
+        row = [f"KEY-{row_index:09d}", *(_cell_value(rng, row_index, col_index) for col_index in range(1, columns))]
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(original_sheet, value)
+            cell.font = font
+            cell.fill = fill
+            cells.append(cell)
+        original_sheet.append(cells)
+    original_wb.save(original_path)
+
+    updated_indices = rng.sample(range(rows), round(rows * overlap))
+    new_indices = range(rows, rows + round(rows * new_rows))
+    row_indices = [*updated_indices, *new_indices]
+    rng.shuffle(row_indices)
+
+    column_order = list(range(columns))
+    if shuffle_columns:
+        rng.shuffle(column_order)
+
+    new_wb = Workbook(write_only=True)
+    new_sheet = new_wb.create_sheet("New")
+    for _ in range(header_row - 1):
+        new_sheet.append([])
+    new_sheet.append([labels[col_index] for col_index in column_order])
+    for row_index in row_indices:
+        row = [f"KEY-{row_index:09d}", *(_cell_value(rng, row_index, col_index) for col_index in range(1, columns))]
+        new_sheet.append([row[col_index] for col_index in column_order])
+    new_wb.save(new_path)
+
+
+def _run_merge(original_path: Path, new_path: Path, engine: MergeEngine, workers: int) -> dict:
+    """Run a single merge, which is meant to run in a process of its own"""
+    start = time.perf_counter()
+    merge = Merger(original_path, new_path, _COLUMN_KEY, "merged", engine, use_key_index=False, parse_workers=workers)
+    merge.merge()
+    total = time.perf_counter() - start
+
+    phases = merge.metrics.phases
+    return {
+        "timings": {phase: round(phases[phase].wall_seconds, 4) if phase in phases else 0.0 for phase in PHASES},
+        "cpu_timings": {phase: round(phases[phase].cpu_seconds, 4) if phase in phases else 0.0 for phase in PHASES},
+        "total": round(total, 4),
+        "peak_rss_mib": peak_rss_mib(),
+        "rows": merge.result._asdict(),
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_path = Path(temp_dir).joinpath("main.xlsx")
+        new_path = Path(temp_dir).joinpath("new.xlsx")
+        start = time.perf_counter()
+        generate_workbooks(original_path, new_path, args.rows, args.columns, args.overlap, args.new_rows,
+                           args.shuffle_columns, args.header_row, args.seed)
+        print(f"Generated {original_path.stat().st_size / 1024 ** 2:.1f} MiB and "
+              f"{new_path.stat().st_size / 1024 ** 2:.1f} MiB workbooks in {time.perf_counter() - start:.1f}s")
+
+        results: List[dict] = []
+        # Worker processes of the merger can not be started from a daemon process, so each merge gets its own
+        # executor, which starts a fresh process
+        context = multiprocessing.get_context("spawn")
+        for engine in args.engines:
+            for repetition in range(args.repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    run = executor.submit(_run_merge, original_path, new_path, MergeEngine(engine),
+                                          args.workers).result()
+                results.append({"engine": engine, "repetition": repetition, **run})
+
+                phases = "  ".join(f"{phase} {seconds:7.3f}" for phase, seconds in run["timings"].items())
+                peak_rss = f"{run['peak_rss_mib']:8.1f} MiB" if run["peak_rss_mib"] is not None else "n/a"
+                print(f"{engine:>9} #{repetition}: {run['total']:7.3f}s total, {peak_rss} peak RSS | {phases}")
+
+    return {
+        "merger_version": merger.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {name: value for name, value in vars(args).items() if name != "output"},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000, help="data rows of the original workbook")
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--overlap", type=float, default=0.5, help="ratio of original rows that are updated")
+    parser.add_argument("--new-rows", type=float, default=0.1,
+                        help="new rows that are inserted, as a ratio of the original rows")
+    parser.add_argument("--shuffle-columns", action="store_true",
+                        help="put the columns of the new workbook in a different order")
+    parser.add_argument("--header-row", type=int, default=1)
+    parser.add_argument("--engines", nargs="+", choices=[MergeEngine.FULL.value, MergeEngine.STREAMING.value],
+                        default=[MergeEngine.FULL.value, MergeEngine.STREAMING.value])
+    parser.add_argument("--workers", type=int, default=0, help="parsing worker processes of each merge")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark of matching new rows against the main sheet's keys with `MergePlan`, on synthetic column tables that never
+touch openpyxl.
+
+Usage: python -m benchmarks.merge_plan [--rows ROWS] [--columns COLUMNS] [--inputs INPUTS] [--repeat REPEAT]
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from merger._table import ColumnTable, MergePlan
+
+
+def _create_table(rows: int, columns: int, key_offset: int) -> ColumnTable:
+    keys = [f"KEY-{key_offset + row_index}" for row_index in range(rows)]
+    return ColumnTable(keys, [[f"value {row_index}-{col_index}" for row_index in range(rows)]
+                              for col_index in range(columns)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the main sheet, and of each new table")
+    parser.add_argument("--columns", type=int, default=16)
+    parser.add_argument("--inputs", type=int, default=2, help="amount of new tables")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    key_positions = ColumnTable([f"KEY-{row_index}" for row_index in range(args.rows)]).key_positions()
+    # Each table overlaps half of the main sheet's rows, and half of the previous table's inserted rows
+    tables = [_create_table(args.rows, args.columns, (input_index + 1) * args.rows // 2)
+              for input_index in range(args.inputs)]
+
+    def plan_merge():
+        plan = MergePlan(key_positions)
+        for input_index, table in enumerate(tables):
+            plan.merge(input_index, table)
+        return plan
+
+    elapsed = min(timeit.repeat(plan_merge, number=1, repeat=args.repeat))
+
+    tracemalloc.start()
+    plan = plan_merge()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    new_rows = args.rows * args.inputs
+    print(f"{len(plan.updates)} rows updated and {len(plan.inserted)} rows inserted, from {new_rows} new rows")
+    print(f"{elapsed * 1e6 / new_rows:8.2f} us/new row, {peak / 1024 ** 2:8.1f} MiB peak allocations")
+
+
+if __name__ == "__main__":
+    main()
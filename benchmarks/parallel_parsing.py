@@ -0,0 +1,76 @@
+"""
+Benchmark of loading and merging the spreadsheets with parsing worker processes, against parsing every spreadsheet
+within a single process. The `samples/` spreadsheets are scaled up by repeating their rows with distinct keys.
+
+Usage: python -m benchmarks.parallel_parsing [--scale SCALE] [--workers WORKERS] [--engine {full,streaming}]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from openpyxl import Workbook, load_workbook
+
+from merger.merger import Merger, MergeEngine
+
+_SAMPLES_DIR = Path(__file__).resolve().parent.parent.joinpath("samples")
+_COLUMN_KEY = "Opportunity Id"
+
+
+def _scale_spreadsheet(source_path: Path, target_path: Path, scale: int):
+    """Write a copy of a spreadsheet with its data rows repeated, where each repetition gets its own keys"""
+    rows = list(load_workbook(source_path, read_only=True).active.iter_rows(values_only=True))
+    header_index = next(row_index for row_index, row in enumerate(rows) if _COLUMN_KEY in row)
+    key_index = rows[header_index].index(_COLUMN_KEY)
+
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    for row in rows[:header_index + 1]:
+        sheet.append(row)
+    for repetition in range(scale):
+        for row in rows[header_index + 1:]:
+            row = list(row)
+            if row[key_index] is not None:
+                row[key_index] = f"{row[key_index]}-{repetition}"
+            sheet.append(row)
+    wb.save(target_path)
+
+
+def _time_merge(original_path: Path, new_path: Path, engine: MergeEngine, workers: int):
+    start = time.perf_counter()
+    merger = Merger(original_path, new_path, _COLUMN_KEY, "merged", engine, parse_workers=workers)
+    loaded = time.perf_counter()
+    merger.merge()
+
+    return loaded - start, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20, help="how many times the sample rows are repeated")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--engine", choices=[MergeEngine.FULL.value, MergeEngine.STREAMING.value],
+                        default=MergeEngine.FULL.value)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        original_path = Path(temp_dir).joinpath("main.xlsx")
+        new_path = Path(temp_dir).joinpath("additions.xlsx")
+        _scale_spreadsheet(_SAMPLES_DIR.joinpath("main.xlsx"), original_path, args.scale)
+        _scale_spreadsheet(_SAMPLES_DIR.joinpath("additions.xlsx"), new_path, args.scale)
+        print(f"{args.engine} engine, main.xlsx and additions.xlsx scaled {args.scale}x "
+              f"({original_path.stat().st_size / 1024 ** 2:.1f} MiB and {new_path.stat().st_size / 1024 ** 2:.1f} MiB)")
+
+        results = {}
+        for workers in (0, args.workers):
+            results[workers] = _time_merge(original_path, new_path, MergeEngine(args.engine), workers)
+            load, total = results[workers]
+            print(f"{workers:>2} workers: {load:7.2f} s loading, {total:7.2f} s in total")
+
+    (sequential_load, sequential_total), (parallel_load, parallel_total) = results[0], results[args.workers]
+    print(f"   speedup: {sequential_load / parallel_load:7.2f}x loading, "
+          f"{sequential_total / parallel_total:7.2f}x in total")
+
+
+if __name__ == "__main__":
+    main()
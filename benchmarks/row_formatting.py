@@ -0,0 +1,106 @@
+"""
+Benchmark of styling newly inserted rows with `Merger._update_row_formatting`, comparing the shared style arrays of the
+format row against copying every style object of the format row for each cell.
+
+The gain is in time only. Either way every cell ends up with a style array of its own, and the workbook's style tables
+deduplicate the copied style objects, which are freed right away. The retained and peak memory are reported to show
+that neither differs between the two.
+
+Usage: python -m benchmarks.row_formatting [--rows ROWS] [--columns COLUMNS] [--memory-rows ROWS]
+"""
+import argparse
+import time
+import tracemalloc
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+
+from merger._probe import SheetProbe
+from merger.merger import Merger
+
+
+def _update_row_formatting_by_copy(main_sheet: Merger._MainSheet, row):
+    """Previous implementation of `Merger._update_row_formatting`, which copies every style object for each cell"""
+    for cell_index, cell in enumerate(row):
+        format_cell = main_sheet.format_row[cell_index]
+
+        cell.font = copy(format_cell.font)
+        cell.fill = copy(format_cell.fill)
+        cell.border = copy(format_cell.border)
+        cell.number_format = copy(format_cell.number_format)
+        cell.protection = copy(format_cell.protection)
+        cell.alignment = copy(format_cell.alignment)
+        cell.quotePrefix = copy(format_cell.quotePrefix)
+        cell.pivotButton = copy(format_cell.pivotButton)
+
+
+def _create_main_sheet(columns: int, rows: int) -> Merger._MainSheet:
+    """Create a main sheet with a styled format row, followed by a block of empty rows to style"""
+    # Skip loading any files, only the format row is needed by `_update_row_formatting`
+    sheet = Workbook().active
+    side = Side(style="thin")
+    for col_index in range(1, columns + 1):
+        cell = sheet.cell(row=1, column=col_index, value=col_index)
+        cell.font = Font(name="Calibri", bold=col_index % 2 == 0)
+        cell.fill = PatternFill("solid", fgColor="FFFF00")
+        cell.border = Border(left=side, right=side, top=side, bottom=side)
+        cell.alignment = Alignment(wrap_text=True)
+        cell.number_format = "0.00"
+
+    main_sheet = Merger._MainSheet(0, sheet.title, SheetProbe(1, 1, ()), [])
+    main_sheet.sheet = sheet
+    main_sheet.format_row = next(sheet.iter_rows(min_row=1, max_row=1))
+    main_sheet.format_styles = [format_cell._style for format_cell in main_sheet.format_row]
+    sheet.insert_rows(2, rows)
+
+    return main_sheet
+
+
+def _inserted_rows(main_sheet: Merger._MainSheet, rows: int, columns: int):
+    # Cells are created up front, so only the styling itself is measured
+    return list(main_sheet.sheet.iter_rows(min_row=2, max_row=rows + 1, max_col=columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--columns", type=int, default=16)
+    parser.add_argument("--memory-rows", type=int, default=5000,
+                        help="rows styled while tracing memory allocations, which is much slower")
+    args = parser.parse_args()
+
+    variants = {
+        "style copies": lambda main_sheet: lambda row: _update_row_formatting_by_copy(main_sheet, row),
+        "style arrays": lambda main_sheet: lambda row: Merger._update_row_formatting(row, main_sheet.format_styles),
+    }
+
+    elapsed = {}
+    for name, variant in variants.items():
+        # Every run styles the rows of a fresh sheet, like the rows inserted by a merge
+        main_sheet = _create_main_sheet(args.columns, args.rows)
+        update_row_formatting = variant(main_sheet)
+        rows = _inserted_rows(main_sheet, args.rows, args.columns)
+        start = time.perf_counter()
+        for row in rows:
+            update_row_formatting(row)
+        elapsed[name] = time.perf_counter() - start
+
+        main_sheet = _create_main_sheet(args.columns, args.memory_rows)
+        update_row_formatting = variant(main_sheet)
+        rows = _inserted_rows(main_sheet, args.memory_rows, args.columns)
+        tracemalloc.start()
+        for row in rows:
+            update_row_formatting(row)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{name:>13}: {elapsed[name]:7.2f} s, {retained / 1024:9.1f} KiB retained, {peak / 1024:9.1f} KiB peak "
+              f"allocations ({args.memory_rows} rows)")
+
+    print(f"{'speedup':>13}: {elapsed['style copies'] / elapsed['style arrays']:7.1f}x "
+          f"({args.rows} rows, {args.columns} columns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark of `Merger._update_row` on wide sheets, comparing the compiled copy plan against walking the label
+indices for every row.
+
+Usage: python -m benchmarks.update_row [--rows ROWS] [--columns COLUMNS] [--repeat REPEAT]
+"""
+import argparse
+import random
+import timeit
+
+from openpyxl import Workbook
+
+from merger.merger import Merger
+
+
+def _update_row_by_labels(label_indices, main_row, new_row):
+    """Previous implementation of `Merger._update_row`, which walks every label for every row"""
+    for indexes in label_indices.values():
+        if indexes.new_label_index is None:
+            continue
+
+        main_row[indexes.main_label_index].value = new_row[indexes.new_label_index]
+
+
+def _create_label_indices(columns: int):
+    new_positions = list(range(columns))
+    random.shuffle(new_positions)
+    label_indices = {}
+    for main_index, new_index in enumerate(new_positions):
+        # Leave every tenth label out of the new sheet
+        label_indices[f"Label {main_index}"] = Merger._LabelIndices(main_index, new_index if main_index % 10 else None)
+
+    return label_indices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--columns", type=int, default=250)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    label_indices = _create_label_indices(args.columns)
+    # Skip loading any files, only the column mapping is needed by `_update_row`
+    copy_plan = Merger.__new__(Merger)._compile_copy_plan(label_indices)
+
+    sheet = Workbook().active
+    for row_index in range(args.rows):
+        sheet.append([f"value {row_index}-{col_index}" for col_index in range(args.columns)])
+    new_rows = list(sheet.iter_rows(values_only=True))
+    # The merged columns of new rows are read in the order of the copy plan
+    new_rows_values = [tuple(new_row[new_index] for new_index in copy_plan.new_indices) for new_row in new_rows]
+    main_rows = list(sheet.iter_rows())
+    main_rows.reverse()
+
+    def by_labels():
+        for main_row, new_row in zip(main_rows, new_rows):
+            _update_row_by_labels(label_indices, main_row, new_row)
+
+    def by_copy_plan():
+        for main_row, new_values in zip(main_rows, new_rows_values):
+            Merger._update_row(main_row, new_values, copy_plan)
+
+    results = {}
+    for name, func in (("label indices", by_labels), ("copy plan", by_copy_plan)):
+        results[name] = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:>14}: {results[name] * 1e6 / args.rows:8.2f} us/row")
+
+    print(f"{'speedup':>14}: {results['label indices'] / results['copy plan']:8.2f}x "
+          f"({args.rows} rows, {args.columns} columns)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
-from merger import app
+import sys
 
 if __name__ == "__main__":
-    app.init()
+    # Only start the GUI without any arguments, so that the command-line interface never imports tkinter
+    if len(sys.argv) > 1:
+        from merger import cli
+        sys.exit(cli.main())
+    else:
+        from merger import app
+        app.init()
@@ -0,0 +1,151 @@
+"""
+Checkpoints of long-running merges, stored in a SQLite database next to the merged spreadsheet file as
+`<name>.merge-checkpoint`. Once the rows of a merge have been matched, the merge plan of every merged sheet is stored.
+A later merge of the same inputs continues from the stored merge plans, rather than reading the new spreadsheets and
+indexing the original spreadsheet again. The merged file is only ever saved as a whole, so the stored merge plans are
+always applied from the start. The checkpoint is removed once the merge has finished.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from datetime import datetime, date, time, timedelta
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+from merger._key_index import _file_digest
+from merger._table import MergePlan, RowChanges
+
+LOG = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = ".merge-checkpoint"
+
+_CHECKPOINT_VERSION = 1
+
+# Cell values that are not JSON values, by the name they are tagged with
+_VALUE_TYPES = {
+    datetime: ("datetime", datetime.isoformat, datetime.fromisoformat),
+    date: ("date", date.isoformat, date.fromisoformat),
+    time: ("time", time.isoformat, time.fromisoformat),
+    timedelta: ("timedelta", lambda value: value.total_seconds(), lambda seconds: timedelta(seconds=seconds)),
+}
+_VALUE_DECODERS = {name: decode for name, _, decode in _VALUE_TYPES.values()}
+
+
+def checkpoint_path(spreadsheet_path: Path) -> Path:
+    return spreadsheet_path.with_name(spreadsheet_path.name + CHECKPOINT_SUFFIX)
+
+
+def input_fingerprint(file_paths: Sequence[Path], settings: str) -> str:
+    """Identifies the contents of every input file, in their order, along with the settings they are merged with"""
+    fingerprint = hashlib.sha256(settings.encode())
+    for file_path in file_paths:
+        fingerprint.update(_file_digest(file_path).encode())
+
+    return fingerprint.hexdigest()
+
+
+def _encode_value(value) -> Any:
+    encoding = _VALUE_TYPES.get(type(value))
+    if encoding is None:
+        return value
+
+    name, encode, _ = encoding
+    return {name: encode(value)}
+
+
+def _decode_value(value) -> Any:
+    if isinstance(value, dict):
+        (name, encoded), = value.items()
+        return _VALUE_DECODERS[name](encoded)
+
+    return value
+
+
+def _encode_changes(changes: RowChanges) -> str:
+    return json.dumps([[input_index, [_encode_value(value) for value in values]]
+                       for input_index, values in changes.values_by_input.items()])
+
+
+def _decode_changes(merged_count: int, text: str) -> RowChanges:
+    changes = RowChanges()
+    changes.values_by_input = {input_index: tuple(_decode_value(value) for value in values)
+                               for input_index, values in json.loads(text)}
+    changes.merged_count = merged_count
+    return changes
+
+
+class MergeCheckpoint:
+    """Checkpoint of a single merge"""
+
+    def __init__(self, spreadsheet_path: Path, fingerprint: str):
+        """
+        Args:
+            spreadsheet_path (Path): Path of the merged spreadsheet file.
+            fingerprint (str): Fingerprint of the merge's inputs, from `input_fingerprint`.
+        """
+        self.path = checkpoint_path(spreadsheet_path)
+        self.fingerprint = fingerprint
+
+    def read(self) -> Optional[List[MergePlan]]:
+        """
+        Read the stored merge plan of each merged sheet, which only holds the updated and inserted rows, if a
+        checkpoint exists for the same inputs
+        """
+        if not self.path.is_file():
+            return None
+
+        try:
+            connection = sqlite3.connect(self.path)
+            try:
+                meta = dict(connection.execute("SELECT name, value FROM meta"))
+                if meta.get("version") != _CHECKPOINT_VERSION or meta.get("fingerprint") != self.fingerprint:
+                    return None
+
+                plans = [MergePlan({}) for _ in range(meta["sheet_count"])]
+                for sheet_index, inserted, position, merged_count, values in connection.execute(
+                        "SELECT sheet, inserted, position, merged_count, changes FROM changes "
+                        "ORDER BY sheet, inserted, position"):
+                    changes = _decode_changes(merged_count, values)
+                    if inserted:
+                        plans[sheet_index].inserted.append(changes)
+                    else:
+                        plans[sheet_index].updates[position] = changes
+
+                return plans
+            finally:
+                connection.close()
+        except (sqlite3.Error, KeyError, ValueError, TypeError):
+            LOG.warning(f"The merge checkpoint `{self.path}` could not be read, and will be replaced.", exc_info=True)
+            return None
+
+    def write_plans(self, plans: List[MergePlan]):
+        """Replace the checkpoint with the merge plans of every merged sheet, before any of them is applied"""
+        rows = [(sheet_index, False, position, changes.merged_count, _encode_changes(changes))
+                for sheet_index, plan in enumerate(plans) for position, changes in plan.updates.items()]
+        rows.extend((sheet_index, True, position, changes.merged_count, _encode_changes(changes))
+                    for sheet_index, plan in enumerate(plans) for position, changes in enumerate(plan.inserted))
+
+        # A checkpoint of other inputs, or one that can not be read, is replaced as a whole
+        self.path.unlink(missing_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value)")
+                connection.execute("CREATE TABLE changes (sheet INTEGER, inserted INTEGER, position INTEGER, "
+                                   "merged_count INTEGER, changes TEXT, PRIMARY KEY (sheet, inserted, position))")
+                connection.executemany("INSERT INTO meta VALUES (?, ?)", {
+                    "version": _CHECKPOINT_VERSION,
+                    "fingerprint": self.fingerprint,
+                    "sheet_count": len(plans),
+                }.items())
+                connection.executemany("INSERT INTO changes VALUES (?, ?, ?, ?, ?)", rows)
+        finally:
+            connection.close()
+
+    def remove(self):
+        """Remove the checkpoint of a merge that has finished"""
+        try:
+            self.path.unlink(missing_ok=True)
+        except OSError:
+            LOG.warning(f"The merge checkpoint `{self.path}` could not be removed.", exc_info=True)
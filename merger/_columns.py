@@ -0,0 +1,68 @@
+"""
+Extraction of whole columns from spreadsheet files as plain lists of values. Extracting columns is CPU-bound parsing,
+so several spreadsheet files can be read at the same time by worker processes.
+"""
+from concurrent.futures import Future, Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Sequence, Optional
+
+import openpyxl as pyxl
+
+from merger import _delimited
+
+
+def read_columns(file_path: Path, min_row: int, column_indices: Sequence[int], sheet_index: int = 0) -> List[list]:
+    """
+    Read the values of some of the columns of a worksheet in a spreadsheet file, from the given row until the end of the
+    sheet. Delimited files only have a single sheet.
+
+    Returns:
+        A list of values for each of the given column indices, in the same order.
+    """
+    if _delimited.is_delimited(file_path):
+        return _delimited.read_columns(file_path, min_row, column_indices)
+
+    wb = pyxl.load_workbook(file_path, read_only=True)
+    try:
+        sheet = wb.worksheets[sheet_index]
+        # The dimensions a sheet states can be too small, so its rows are read until the parser runs out of them
+        sheet.reset_dimensions()
+        columns = [[] for _ in column_indices]
+        # Columns are filled row by row, since read-only sheets can only be iterated by row
+        column_appends = [(column.append, column_index) for column, column_index in zip(columns, column_indices)]
+        # Rows are padded up to the last read column, since without dimensions rows are only as wide as their cells
+        for row in sheet.iter_rows(min_row=min_row, max_col=max(column_indices, default=-1) + 1, values_only=True):
+            for append, column_index in column_appends:
+                append(row[column_index])
+    finally:
+        wb.close()
+
+    return columns
+
+
+class ColumnReader:
+    """Reads columns of spreadsheet files either right away, or in the background with a pool of worker processes"""
+
+    def __init__(self, workers: int):
+        """
+        Args:
+            workers (int): Amount of worker processes. Columns are read within the calling process if there are none.
+        """
+        self._executor: Optional[Executor] = ProcessPoolExecutor(workers) if workers > 0 else None
+
+    def submit(self, file_path: Path, min_row: int, column_indices: Sequence[int], sheet_index: int = 0) -> Future:
+        """Read columns with `read_columns`, returning the future of the columns"""
+        if self._executor is not None:
+            return self._executor.submit(read_columns, file_path, min_row, tuple(column_indices), sheet_index)
+
+        future = Future()
+        future.set_result(read_columns(file_path, min_row, column_indices, sheet_index))
+        return future
+
+    def close(self, cancel: bool = False):
+        """
+        Stop accepting columns to read. Columns that have already been submitted are still read, unless they are
+        cancelled.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=cancel)
@@ -17,6 +17,22 @@ class ConfigProperty(Enum):
     MERGED_FILENAME = _ConfigPropValueWrapper("")
     INITIAL_DIR = _ConfigPropValueWrapper("./")
     MERGE_TIMESTAMP_CELL = _ConfigPropValueWrapper("B1")
+    HEADER_SCAN_ROWS = _ConfigPropValueWrapper(100)
+    STREAMING_THRESHOLD_MB = _ConfigPropValueWrapper(20)
+    USE_KEY_INDEX = _ConfigPropValueWrapper(False)
+    PARSE_WORKERS = _ConfigPropValueWrapper(0)
+    PROGRESS_INTERVAL_ROWS = _ConfigPropValueWrapper(250)
+    PROGRESS_INTERVAL_MS = _ConfigPropValueWrapper(50)
+    DUPLICATE_KEY_POLICY = _ConfigPropValueWrapper("last")
+    KEY_STRIP = _ConfigPropValueWrapper(False)
+    KEY_CASEFOLD = _ConfigPropValueWrapper(False)
+    KEY_COERCION = _ConfigPropValueWrapper("none")
+    COMPRESSION_LEVEL = _ConfigPropValueWrapper(6)
+    ROW_SAMPLE_INTERVAL = _ConfigPropValueWrapper(0)
+    CHECKPOINT_MIN_ROWS = _ConfigPropValueWrapper(0)
+    MERGE_PROCESSES = _ConfigPropValueWrapper(0)
+    DAEMON_PORT = _ConfigPropValueWrapper(8765)
+    CACHED_WORKBOOKS = _ConfigPropValueWrapper(2)
 
     def __str__(self):
         return self.name
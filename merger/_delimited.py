@@ -0,0 +1,148 @@
+"""
+Reading and writing of delimited text spreadsheets (CSV and TSV files), row by row with the `csv` module. Every value
+of a delimited file is text, so values are only converted to numbers if the number is written exactly the way Python
+would write it. That way, a value like an ID with leading zeros is kept as it is, and values that are written back out
+stay unchanged.
+"""
+import csv
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Optional, Iterator, List, Sequence, Tuple
+
+from merger._saving import atomic_path
+
+DELIMITERS = {".csv": ",", ".tsv": "\t"}
+"""Delimiter of each delimited file extension"""
+
+_READ_ENCODING = "utf-8-sig"
+"""Encoding of read files, which skips the byte order mark that spreadsheet applications add to exported files"""
+_WRITE_ENCODING = "utf-8"
+
+_SPOOL_SIZE = 16 * 1024 * 1024
+"""Size of written rows that is kept in memory, before they are spooled to a temporary file"""
+
+
+def delimiter_of(file_path: Path) -> Optional[str]:
+    """Delimiter of a delimited file, or `None` if the file is a workbook"""
+    return DELIMITERS.get(file_path.suffix.lower())
+
+
+def is_delimited(file_path: Path) -> bool:
+    return delimiter_of(file_path) is not None
+
+
+def parse_value(text: str):
+    """Convert the text of a delimited value to the value it represents"""
+    if text == "":
+        return None
+
+    # Only whole numbers and decimals that are written in their shortest form are converted
+    if text[-1].isdigit():
+        try:
+            number = int(text)
+        except ValueError:
+            try:
+                number = float(text)
+            except ValueError:
+                return text
+        if str(number) == text:
+            return number
+
+    return text
+
+
+def iter_rows(file_path: Path, width: int = 0) -> Iterator[list]:
+    """
+    Iterate over the values of each row in a delimited file.
+
+    Args:
+        file_path (Path): Path of the delimited file.
+        width (int): Minimum amount of values in each row. Shorter rows are padded with `None`.
+    """
+    with open(file_path, newline="", encoding=_READ_ENCODING) as file:
+        for row in csv.reader(file, delimiter=delimiter_of(file_path)):
+            values = [parse_value(text) for text in row]
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            yield values
+
+
+def probe(file_path: Path, column_key: str, header_scan_rows: int) -> Tuple[int, int, tuple]:
+    """
+    Find the size, header row and column labels of a delimited file. The rows after the header row are only counted by
+    their line breaks, so values that span several lines are counted as several rows.
+
+    Returns:
+        The last row, the header row (0 if the column key could not be found), and the header row's values.
+    """
+    header_row = 0
+    header = ()
+    for row_index, values in enumerate(iter_rows(file_path), start=1):
+        if row_index > header_scan_rows:
+            break
+        if column_key in values:
+            header_row = row_index
+            header = tuple(values)
+            break
+
+    line_count = 0
+    last_chunk = b""
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            line_count += chunk.count(b"\n")
+            last_chunk = chunk
+    # The last line might not end with a line break
+    if last_chunk and not last_chunk.endswith(b"\n"):
+        line_count += 1
+
+    return max(line_count, header_row), header_row, header
+
+
+def read_columns(file_path: Path, min_row: int, column_indices: Sequence[int]) -> List[list]:
+    """Read the values of some of the columns of a delimited file, from the given row until the end of the file"""
+    columns = [[] for _ in column_indices]
+    column_appends = [(column.append, column_index) for column, column_index in zip(columns, column_indices)]
+    width = max(column_indices, default=-1) + 1
+    for row_index, values in enumerate(iter_rows(file_path, width), start=1):
+        if row_index < min_row:
+            continue
+        for append, column_index in column_appends:
+            append(values[column_index])
+
+    return columns
+
+
+class DelimitedRowWriter:
+    """
+    Writes rows of values to a delimited file. Rows are buffered until the file is saved, so a file can be written while
+    it is still being read.
+    """
+
+    def __init__(self, delimiter: str):
+        self._buffer = SpooledTemporaryFile(_SPOOL_SIZE, mode="w+", newline="", encoding=_WRITE_ENCODING)
+        self._writer = csv.writer(self._buffer, delimiter=delimiter)
+        self.row_number = 1
+        """Row number of the next row that is appended"""
+
+    def append(self, values: Sequence, style_ids: Sequence[int] = (), row_dimension: Optional[Dict[str, str]] = None):
+        """Append a row of values. Delimited files have no styles, so any style IDs and row dimensions are ignored."""
+        self._writer.writerow(["" if value is None else value for value in values])
+        self.row_number += 1
+
+    def finish(self):
+        """Delimited files have no fixed cells, so there is nothing left to write"""
+
+    def save(self, file_path: Path):
+        """Write the buffered rows to the given file atomically, and release the buffer"""
+        try:
+            self._buffer.seek(0)
+            with atomic_path(file_path) as temp_path, \
+                    open(temp_path, "w", newline="", encoding=_WRITE_ENCODING) as file:
+                for chunk in iter(lambda: self._buffer.read(1024 * 1024), ""):
+                    file.write(chunk)
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the buffered rows, without writing them"""
+        self._buffer.close()
@@ -125,7 +125,8 @@ class SpreadsheetSelect:
 
     def _select_file(self):
         new_file_path = filedialog.askopenfilename(
-            filetypes=[("Excel Spreadsheet", ".xlsx")],
+            filetypes=[("Spreadsheet", ".xlsx .csv .tsv"), ("Excel Spreadsheet", ".xlsx"), ("CSV File", ".csv"),
+                       ("TSV File", ".tsv")],
             title=self.SELECT_SPREADSHEET_TITLE,
             initialdir=MergeConfig.initial_dir)
         if not new_file_path:
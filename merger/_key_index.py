@@ -0,0 +1,159 @@
+"""
+On-disk index of the key column of a spreadsheet file, stored in a SQLite database next to the spreadsheet file as
+`<name>.merge-index`. It maps each key to the position of its row, relative to the first data row, along with a hash of
+the row's contents. The index is only valid for the exact spreadsheet file it was written for, and is only written for
+spreadsheets where every key is unique.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import datetime, date, time, timedelta
+from pathlib import Path
+from typing import NamedTuple, Dict, Optional, Any, Sequence, Tuple
+
+LOG = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".merge-index"
+
+_INDEX_VERSION = 2
+
+# Key types that can not be stored in SQLite as-is, along with how they are converted to and from text
+_NATIVE_KEY_TYPE = 0
+_KEY_TYPES = {
+    type(None): (1, lambda key: "", lambda text: None),
+    bool: (2, lambda key: str(int(key)), lambda text: bool(int(text))),
+    datetime: (3, datetime.isoformat, datetime.fromisoformat),
+    date: (4, date.isoformat, date.fromisoformat),
+    time: (5, time.isoformat, time.fromisoformat),
+    timedelta: (6, lambda key: repr(key.total_seconds()), lambda text: timedelta(seconds=float(text))),
+    # Keys of several columns, which can only be indexed if each of their values is a JSON value
+    tuple: (7, lambda key: json.dumps(key), lambda text: tuple(json.loads(text))),
+}
+_KEY_DECODERS = {type_id: decode for type_id, _, decode in _KEY_TYPES.values()}
+
+
+class KeyIndexEntry(NamedTuple):
+    position: int
+    """Position of the row with the key, relative to the first data row"""
+    row_hash: str
+    """Hash of the values in the row"""
+
+
+class KeyIndexBuilder:
+    """Collects the index entries of a spreadsheet's rows, while the rows are written"""
+
+    def __init__(self):
+        self.entries: Dict[Any, KeyIndexEntry] = {}
+        self.unique = True
+        """Whether every key that was added so far is unique"""
+
+    def add(self, key, position: int, values: Sequence):
+        # Rows without a key are never matched, so they are not indexed
+        if key is None:
+            return
+        if key in self.entries:
+            self.unique = False
+        self.entries[key] = KeyIndexEntry(position, row_hash(values))
+
+
+def index_path(spreadsheet_path: Path) -> Path:
+    return spreadsheet_path.with_name(spreadsheet_path.name + INDEX_SUFFIX)
+
+
+def row_hash(values: Sequence) -> str:
+    return hashlib.blake2b(repr(tuple(values)).encode(), digest_size=8).hexdigest()
+
+
+def _file_digest(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _encode_key(key) -> Tuple[int, Any]:
+    if isinstance(key, (int, float, str)) and not isinstance(key, bool):
+        return _NATIVE_KEY_TYPE, key
+
+    type_id, encode, _ = _KEY_TYPES[type(key)]
+    return type_id, encode(key)
+
+
+def _decode_key(type_id: int, key):
+    if type_id == _NATIVE_KEY_TYPE:
+        return key
+
+    return _KEY_DECODERS[type_id](key)
+
+
+def read_key_index(spreadsheet_path: Path, key_signature: str, header_row: int) -> Optional[Dict[Any, KeyIndexEntry]]:
+    """
+    Read the index of a spreadsheet file, if one exists that is still valid for the file. The file is considered
+    unchanged if its size and modification time match the index. If only its modification time differs, the file's
+    contents are hashed to make sure.
+
+    Args:
+        spreadsheet_path (Path): Path of the spreadsheet file.
+        key_signature (str): Identifies the key columns and how their keys are normalized, which have to match the
+            ones the index was written with.
+        header_row (int): Header row of the spreadsheet's sheet.
+
+    Returns:
+        The index entries by key, or `None` if there is no valid index.
+    """
+    db_path = index_path(spreadsheet_path)
+    if not db_path.is_file():
+        return None
+
+    try:
+        with closing(sqlite3.connect(db_path)) as connection:
+            meta = dict(connection.execute("SELECT name, value FROM meta"))
+
+            stat = spreadsheet_path.stat()
+            if (meta.get("version") != _INDEX_VERSION or meta.get("column_key") != key_signature
+                    or meta.get("header_row") != header_row or meta.get("file_size") != stat.st_size):
+                return None
+            if (meta.get("file_mtime_ns") != stat.st_mtime_ns
+                    and meta.get("file_digest") != _file_digest(spreadsheet_path)):
+                return None
+
+            return {_decode_key(type_id, key): KeyIndexEntry(position, hash_value)
+                    for type_id, key, position, hash_value
+                    in connection.execute("SELECT key_type, key, position, row_hash FROM rows")}
+    except (sqlite3.Error, KeyError, ValueError):
+        LOG.warning(f"The merge index `{db_path}` could not be read, and will be rebuilt.", exc_info=True)
+        return None
+
+
+def write_key_index(spreadsheet_path: Path, key_signature: str, header_row: int, entries: Dict[Any, KeyIndexEntry]):
+    """Replace the index of a spreadsheet file with the given entries"""
+    db_path = index_path(spreadsheet_path)
+    stat = spreadsheet_path.stat()
+    meta = {
+        "version": _INDEX_VERSION,
+        "column_key": key_signature,
+        "header_row": header_row,
+        "file_size": stat.st_size,
+        "file_mtime_ns": stat.st_mtime_ns,
+        "file_digest": _file_digest(spreadsheet_path),
+    }
+
+    try:
+        rows = [(*_encode_key(key), entry.position, entry.row_hash) for key, entry in entries.items()]
+    except (KeyError, TypeError) as e:
+        LOG.warning(f"The merge index `{db_path}` was not written, since some of its keys can not be indexed: {e}")
+        db_path.unlink(missing_ok=True)
+        return
+
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.execute("DROP TABLE IF EXISTS meta")
+        connection.execute("DROP TABLE IF EXISTS rows")
+        connection.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value)")
+        connection.execute("CREATE TABLE rows (key_type INTEGER, key, position INTEGER, row_hash TEXT, "
+                           "PRIMARY KEY (key_type, key))")
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        connection.executemany("INSERT INTO rows VALUES (?, ?, ?, ?)", rows)
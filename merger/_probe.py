@@ -0,0 +1,125 @@
+"""
+Lightweight inspection of spreadsheet files, which reads only what is needed to describe a sheet of a workbook without
+loading the workbook itself.
+"""
+from pathlib import Path
+from typing import NamedTuple, List, Tuple
+from zipfile import ZipFile
+
+from openpyxl.cell.text import Text
+from openpyxl.packaging.manifest import Manifest
+from openpyxl.reader.excel import _find_workbook_part
+from openpyxl.reader.workbook import WorkbookParser
+from openpyxl.worksheet._reader import WorkSheetParser
+from openpyxl.xml.constants import ARC_CONTENT_TYPES, SHARED_STRINGS, SHEET_MAIN_NS
+from openpyxl.xml.functions import fromstring, iterparse
+
+from merger import _delimited
+
+_STRING_TAG = f"{{{SHEET_MAIN_NS}}}si"
+
+
+class SheetProbe(NamedTuple):
+    max_row: int
+    """Last row of the sheet"""
+    header_row: int
+    """Row containing the column key, or 0 if the column key could not be found"""
+    header: Tuple
+    """Values of the header row by column, where empty cells are `None`"""
+
+
+class _LazyStringTable:
+    """Shared strings table that is only parsed as far as the strings that have been requested"""
+
+    def __init__(self, archive: ZipFile, part_name: str):
+        self._source = archive.open(part_name)
+        self._nodes = iterparse(self._source)
+        self._strings: List[str] = []
+
+    def __getitem__(self, index: int) -> str:
+        while len(self._strings) <= index:
+            _, node = next(self._nodes)
+            if node.tag == _STRING_TAG:
+                self._strings.append(Text.from_tree(node).content.replace("x005F_", ""))
+                node.clear()
+
+        return self._strings[index]
+
+    def close(self):
+        self._source.close()
+
+
+def _worksheet_rels(archive: ZipFile, package: Manifest) -> list:
+    """Sheet elements and relationships of each worksheet in a workbook, in the order of the workbook's sheets"""
+    workbook_parser = WorkbookParser(archive, _find_workbook_part(package).PartName[1:])
+    workbook_parser.parse()
+    # Chartsheets have no cells, and are not among the worksheets of a loaded workbook either
+    return [(sheet, rel) for sheet, rel in workbook_parser.find_sheets() if "chartsheet" not in rel.Type]
+
+
+def sheet_names(file_path: Path) -> List[str]:
+    """Names of the worksheets in a spreadsheet file, in their order. Delimited files have a single sheet."""
+    if _delimited.is_delimited(file_path):
+        return [file_path.stem]
+
+    with ZipFile(file_path) as archive:
+        package = Manifest.from_tree(fromstring(archive.read(ARC_CONTENT_TYPES)))
+        return [sheet.name for sheet, _ in _worksheet_rels(archive, package)]
+
+
+def probe_sheet(file_path: Path, column_key: str, header_scan_rows: int, sheet_index: int = 0) -> SheetProbe:
+    """
+    Find the size, header row and column labels of a worksheet in a spreadsheet file, by its index among the
+    worksheets. The size is taken from the sheet's `<dimension>` element, and only the rows up to the header row are
+    parsed. The header row is only searched for within the first `header_scan_rows` rows of the sheet.
+
+    Delimited files are probed by `_delimited.probe` instead.
+    """
+    if _delimited.is_delimited(file_path):
+        return SheetProbe(*_delimited.probe(file_path, column_key, header_scan_rows))
+
+    with ZipFile(file_path) as archive:
+        package = Manifest.from_tree(fromstring(archive.read(ARC_CONTENT_TYPES)))
+        _, sheet_rel = _worksheet_rels(archive, package)[sheet_index]
+
+        strings_part = package.find(SHARED_STRINGS)
+        shared_strings = _LazyStringTable(archive, strings_part.PartName[1:]) if strings_part is not None else []
+
+        try:
+            with archive.open(sheet_rel.target) as sheet_source:
+                dimensions = WorkSheetParser(sheet_source, []).parse_dimensions()
+
+            with archive.open(sheet_rel.target) as sheet_source:
+                max_row = dimensions[3] if dimensions is not None else 0
+                header_row = 0
+                header = ()
+                for row_index, row in WorkSheetParser(sheet_source, shared_strings).parse():
+                    if not header_row:
+                        # Give up on the header row once the scanned rows have been exhausted
+                        if row_index > header_scan_rows:
+                            break
+                        if any(cell["value"] == column_key for cell in row):
+                            header_row = row_index
+                            header = _row_values(row)
+
+                    # The sheet only has to be read to the end if its dimensions are unknown
+                    if header_row and dimensions is not None:
+                        break
+                    max_row = max(max_row, row_index)
+        finally:
+            if isinstance(shared_strings, _LazyStringTable):
+                shared_strings.close()
+
+    return SheetProbe(max_row, header_row, header)
+
+
+def _row_values(row: List[dict]) -> Tuple:
+    """Values of a parsed row by column, since the parser leaves out empty cells"""
+    if not row:
+        return ()
+
+    values = [None] * max(cell["column"] for cell in row)
+    for cell in row:
+        values[cell["column"] - 1] = cell["value"]
+
+    return tuple(values)
@@ -0,0 +1,66 @@
+"""
+Saving of merged spreadsheet files. Files are written to a temporary file next to their target first, which then
+replaces the target in a single rename. A merge that is stopped or fails while saving leaves the target as it was.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from openpyxl import Workbook
+from openpyxl.writer.excel import ExcelWriter
+
+
+@contextmanager
+def atomic_path(file_path: Path) -> Iterator[Path]:
+    """
+    Provide a temporary path to write a file to, which replaces the given file once the context exits without an
+    exception. Otherwise, the temporary file is removed.
+    """
+    # The temporary file has to be on the same file system as the target for the rename to be atomic
+    fd, temp_name = tempfile.mkstemp(prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent)
+    os.close(fd)
+    temp_path = Path(temp_name)
+    try:
+        yield temp_path
+
+        # Replacing a file keeps its permissions. New files get the usual permissions, rather than the private ones of
+        # temporary files.
+        if file_path.exists():
+            shutil.copymode(file_path, temp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def save_workbook(workbook: Workbook, file_path: Path, compression_level: int):
+    """
+    Save a workbook atomically.
+
+    Args:
+        workbook (Workbook): Workbook to save. Write-only workbooks can only be saved once.
+        file_path (Path): Path the workbook is saved to.
+        compression_level (int): ZIP compression level from 0 to 9, where 0 stores the workbook's parts uncompressed.
+            Lower levels save faster, but make larger files.
+    """
+    if workbook.write_only and not workbook.worksheets:
+        workbook.create_sheet()
+
+    with atomic_path(file_path) as temp_path:
+        if compression_level == 0:
+            archive = ZipFile(temp_path, "w", ZIP_STORED, allowZip64=True)
+        else:
+            archive = ZipFile(temp_path, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=compression_level)
+        try:
+            ExcelWriter(workbook, archive).save()
+        finally:
+            # The archive is already closed if it was saved
+            archive.close()
@@ -0,0 +1,303 @@
+"""Helpers for reading spreadsheets in read-only mode, and writing them back out in write-only mode"""
+import os
+import re
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Any
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import Cell, WriteOnlyCell
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+from openpyxl.worksheet._reader import WorkSheetParser
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
+from openpyxl.worksheet.dimensions import ColumnDimension, RowDimension, SheetFormatProperties
+from openpyxl.worksheet.properties import WorksheetProperties
+from openpyxl.worksheet.views import SheetViewList
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+
+_COL_TAG = f"{{{SHEET_MAIN_NS}}}col"
+_VIEWS_TAG = f"{{{SHEET_MAIN_NS}}}sheetViews"
+_PROPERTIES_TAG = f"{{{SHEET_MAIN_NS}}}sheetPr"
+_FORMAT_TAG = f"{{{SHEET_MAIN_NS}}}sheetFormatPr"
+_DATA_TAG = f"{{{SHEET_MAIN_NS}}}sheetData"
+
+_REF_ROW = re.compile(r"(^|[\s:$A-Za-z])(\d+)")
+"""Row number of each cell reference within a reference to cells, ranges, or whole rows"""
+
+_UNSIZED_DIMENSION = "A1:XFD1048576"
+"""Reference that write-only sheets write as their dimension, until their size is known. It's the longest reference."""
+_DIMENSION_SEARCH_BYTES = 64 * 1024
+"""Amount of bytes at the start of a written sheet in which its dimension is found"""
+
+_STYLE_TABLES = ("_fonts", "_fills", "_borders", "_alignments", "_protections", "_number_formats", "_cell_styles",
+                 "_named_styles", "_differential_styles", "_table_styles", "_colors")
+"""Workbook attributes that make up the style table of a workbook"""
+
+
+def cell_style_id(cell) -> int:
+    """Index of the cell's style within the workbook's style table"""
+    # Cells that are missing in the read-only sheet are represented by a shared empty cell without any style
+    return getattr(cell, "_style_id", 0)
+
+
+def share_styles(source_wb: Workbook, target_wb: Workbook):
+    """
+    Reuse the style table of the source workbook in the target workbook, so the style IDs of read-only cells can be
+    assigned to written cells as-is.
+    """
+    for table in _STYLE_TABLES:
+        setattr(target_wb, table, getattr(source_wb, table))
+
+
+def copy_sheet_layout(source: ReadOnlyWorksheet, target: WriteOnlyWorksheet):
+    """
+    Copy the sheet properties (e.g. the tab color), sheet views (e.g. frozen panes), default row height and the column
+    dimensions of a read-only sheet. These are stored in front of the sheet data, so only the beginning of the sheet's
+    XML has to be parsed.
+    """
+    source_xml = source._get_source()
+    try:
+        for _, element in iterparse(source_xml):
+            if element.tag == _DATA_TAG:
+                break
+            elif element.tag == _PROPERTIES_TAG:
+                target.sheet_properties = WorksheetProperties.from_tree(element)
+            elif element.tag == _VIEWS_TAG:
+                target.views = SheetViewList.from_tree(element)
+            elif element.tag == _FORMAT_TAG:
+                target.sheet_format = SheetFormatProperties.from_tree(element)
+            elif element.tag == _COL_TAG:
+                attrs = dict(element.attrib)
+                attrs["index"] = get_column_letter(int(attrs["min"]))
+                if "style" in attrs:
+                    attrs["style"] = target.parent._cell_styles[int(attrs["style"])]
+                dimension = ColumnDimension(target, **attrs)
+                target.column_dimensions[dimension.index] = dimension
+    finally:
+        source_xml.close()
+
+
+def _move_rows(ref: str, row_number: int, amount: int) -> str:
+    """Move the rows of a cell reference down by the given amount, from the given row number on"""
+    def move(match) -> str:
+        row = int(match.group(2))
+        return match.group(1) + str(row + amount if row >= row_number else row)
+
+    return _REF_ROW.sub(move, ref)
+
+
+def copy_sheet_tail(rows: "SheetRows", target: WriteOnlyWorksheet, inserted_rows: Sequence[Tuple[int, int]] = ()):
+    """
+    Copy the parts of a read-only sheet that are stored behind its rows: its auto filter, merged cells, conditional
+    formatting, data validation and page setup. Their cell ranges are moved down along with the rows they cover, as if
+    the rows had been inserted in Excel. Formulas of conditional formatting rules are copied as they are.
+
+    Args:
+        rows (SheetRows): Rows of the read-only sheet, which have all been read.
+        target (WriteOnlyWorksheet): Sheet the rows were written to, which has not been saved yet.
+        inserted_rows (Sequence[Tuple[int, int]]): Row number within the read-only sheet and amount of each block of
+            rows that was inserted in front of that row.
+    """
+    parser = rows.parser
+    if parser is None:
+        raise ValueError("The rows of the sheet have not all been read.")
+
+    def move(ref: str) -> str:
+        # Blocks further down are moved first, so that the row numbers of the other blocks still apply
+        for row_number, amount in sorted(inserted_rows, reverse=True):
+            ref = _move_rows(ref, row_number, amount)
+        return ref
+
+    auto_filter = getattr(parser, "auto_filter", None)
+    if auto_filter is not None:
+        if auto_filter.ref:
+            auto_filter.ref = move(auto_filter.ref)
+        if auto_filter.sortState is not None:
+            auto_filter.sortState.ref = move(auto_filter.sortState.ref)
+            for condition in auto_filter.sortState.sortCondition:
+                condition.ref = move(condition.ref)
+        target.auto_filter = auto_filter
+
+    if parser.merged_cells is not None:
+        for merged_range in parser.merged_cells.mergeCell:
+            target.merged_cells.add(move(merged_range.ref))
+
+    # Differential styles keep their IDs, since the target workbook shares the style table of the read-only workbook
+    for formatting in parser.formatting:
+        for rule in formatting.rules:
+            target.conditional_formatting.add(move(str(formatting.sqref)), rule)
+
+    data_validations = getattr(parser, "data_validations", None)
+    if data_validations is not None:
+        for validation in data_validations.dataValidation:
+            validation.sqref = move(str(validation.sqref))
+        target.data_validations = data_validations
+
+    for name in ("print_options", "page_margins", "page_setup", "HeaderFooter"):
+        if hasattr(parser, name):
+            setattr(target, name, getattr(parser, name))
+
+
+def discard_sheet(sheet: WriteOnlyWorksheet):
+    """
+    Discard the rows written to a write-only sheet along with their temporary file, unless the sheet has been saved,
+    which already removed the file. The sheet can not be saved afterwards.
+    """
+    writer = sheet._writer
+    # Sheets only create their temporary file once the first row is written
+    if writer is None:
+        return
+
+    # The rows are closed first, since closing them writes the end of the sheet data to the file
+    if sheet._rows is not None:
+        sheet._rows.close()
+    writer.close()
+    if os.path.exists(writer.out):
+        writer.cleanup()
+
+
+def copy_sheet(source: ReadOnlyWorksheet, target: WriteOnlyWorksheet):
+    """Copy the layout, values, styles and row dimensions of a read-only sheet, row by row"""
+    copy_sheet_layout(source, target)
+
+    writer = RowWriter(target)
+    rows = SheetRows(source)
+    for row, row_dimension in rows:
+        writer.append([cell.value for cell in row], [cell_style_id(cell) for cell in row], row_dimension)
+    copy_sheet_tail(rows, target)
+    writer.close_sheet()
+
+
+class SheetRows:
+    """
+    Iterates over the rows of a read-only sheet like `iter_rows` does, along with the attributes of each row's dimension
+    (e.g. its height), which read-only sheets discard. Once every row has been read, the parts of the sheet that are
+    stored behind its rows are available from `parser`.
+
+    The dimensions that a sheet states can be too small, so rows are read until the parser runs out of them, and each
+    row is at least as wide as its own cells.
+    """
+
+    def __init__(self, sheet: ReadOnlyWorksheet):
+        self.sheet = sheet
+        """Sheet the rows are appended to"""
+        self.parser: Optional[WorkSheetParser] = None
+        """Parser of the sheet, once it has parsed the whole sheet"""
+
+    def __iter__(self) -> Iterator[Tuple[Tuple, Dict[str, str]]]:
+        sheet = self.sheet
+        # Rows are padded to the stated width, like `iter_rows` pads them
+        max_column = sheet.max_column or 0
+        empty_row = (EMPTY_CELL,) * max_column
+
+        source = sheet._get_source()
+        parser = WorkSheetParser(source, sheet._shared_strings, data_only=sheet.parent.data_only,
+                                 epoch=sheet.parent.epoch, date_formats=sheet.parent._date_formats)
+        row_count = 0
+        try:
+            for row_index, cells in parser.parse():
+                row_dimension = parser.row_dimensions.pop(str(row_index), {})
+                if row_index <= row_count:
+                    continue
+
+                # Rows that are missing from the sheet's XML are empty
+                for _ in range(row_count + 1, row_index):
+                    yield empty_row, {}
+                row_count = row_index
+                row_width = max(max_column, cells[-1]["column"]) if cells else max_column
+                yield sheet._get_row(cells, max_col=row_width), row_dimension
+        finally:
+            source.close()
+
+        self.parser = parser
+
+
+class RowWriter:
+    """
+    Appends rows of values and style IDs to a write-only sheet. Since write-only sheets cannot be modified after a row
+    has been appended, a single cell value can be given beforehand, which is placed into the row once it is written.
+
+    The sheet's `<dimension>` is written ahead of its rows, before its size is known. It's filled in by `close_sheet`
+    from the rows that were appended, so that the size of the written sheet can be read without parsing all of its rows.
+    """
+
+    def __init__(self, sheet: WriteOnlyWorksheet, fixed_cell: Optional[Tuple[int, int, Any]] = None):
+        """
+        Args:
+            sheet (WriteOnlyWorksheet): Sheet the rows are appended to.
+            fixed_cell (Optional[Tuple[int, int, Any]]): Row number, column number and value of a cell to overwrite.
+        """
+        self.sheet = sheet
+        """Sheet the rows are appended to"""
+        self._cell_styles = sheet.parent._cell_styles
+        self._fixed_cell = fixed_cell
+        self.row_number = 1
+        """Row number of the next row that is appended"""
+        self._max_column = 0
+
+        # Write-only sheets write their dimension ahead of the first row, if they are able to calculate it
+        sheet.calculate_dimension = lambda: _UNSIZED_DIMENSION
+
+    def append(self, values: Sequence, style_ids: Sequence[int] = (), row_dimension: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            values (Sequence): Values of the row's cells.
+            style_ids (Sequence[int]): Style ID of each cell, for as many cells as are styled.
+            row_dimension (Optional[Dict[str, str]]): Attributes of the row's dimension, as read by `SheetRows`.
+        """
+        row = list(values)
+        for col_index, style_id in enumerate(style_ids):
+            # Cells without a style can be written as plain values
+            if style_id == 0:
+                continue
+
+            cell = WriteOnlyCell(self.sheet, row[col_index])
+            cell._style = self._cell_styles[style_id]
+            row[col_index] = cell
+
+        if self._fixed_cell is not None and self._fixed_cell[0] == self.row_number:
+            _, fixed_col, fixed_value = self._fixed_cell
+            row.extend([None] * (fixed_col - len(row)))
+            if isinstance(row[fixed_col - 1], Cell):
+                row[fixed_col - 1].value = fixed_value
+            else:
+                row[fixed_col - 1] = fixed_value
+
+        self._max_column = max(self._max_column, len(row))
+        if row_dimension:
+            # Dimensions are written along with their row, so only the dimension of the current row is kept
+            attributes = {name: value for name, value in row_dimension.items() if name not in ("r", "spans")}
+            if "s" in attributes:
+                attributes["s"] = self._cell_styles[int(attributes["s"])]
+            self.sheet.row_dimensions[self.row_number] = RowDimension(self.sheet, index=self.row_number,
+                                                                       **attributes)
+            self.sheet.append(row)
+            del self.sheet.row_dimensions[self.row_number]
+        else:
+            self.sheet.append(row)
+        self.row_number += 1
+
+    def finish(self):
+        """Append empty rows until the fixed cell has been written"""
+        while self._fixed_cell is not None and self._fixed_cell[0] >= self.row_number:
+            self.append([])
+
+    def close_sheet(self):
+        """
+        Write the parts of the sheet that are stored behind its rows, after which no more rows can be appended, and fill
+        in the sheet's dimension. The sheet is saved along with its workbook.
+        """
+        self.sheet.close()
+
+        # The dimension is overwritten in place, padded with whitespace within its element to the same length
+        unsized = f'"{_UNSIZED_DIMENSION}"'.encode()
+        dimension = f'"A1:{get_column_letter(max(self._max_column, 1))}{max(self.row_number - 1, 1)}"'.encode()
+        with open(self.sheet._writer.out, "r+b") as sheet_xml:
+            position = sheet_xml.read(_DIMENSION_SEARCH_BYTES).index(unsized)
+            sheet_xml.seek(position)
+            sheet_xml.write(dimension.ljust(len(unsized)))
+
+    def close(self):
+        """Discard the appended rows, for a sheet that is never saved"""
+        discard_sheet(self.sheet)
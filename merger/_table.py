@@ -0,0 +1,139 @@
+"""
+Plain Python representation of the rows that are merged, which keeps openpyxl out of matching the rows of the new
+spreadsheets against the main sheet. The resulting merge plan is only written back to a worksheet once it is complete.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from merger.keys import DuplicateKeyPolicy
+
+
+class ColumnTable:
+    """Rows of a sheet, stored as the key column along with one list of values for each of the other columns"""
+
+    def __init__(self, keys: list, columns: Sequence[list] = ()):
+        """
+        Args:
+            keys (list): Values of the key column.
+            columns (Sequence[list]): Values of each of the other columns, with a value for every key.
+        """
+        self.keys = keys
+        self.columns = list(columns)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def rows(self) -> Iterator[Tuple[Any, tuple]]:
+        """Iterate over each row's key, along with the row's values of the other columns"""
+        if not self.columns:
+            return ((key, ()) for key in self.keys)
+
+        return zip(self.keys, zip(*self.columns))
+
+    def key_positions(self) -> Dict[Any, int]:
+        """Map each key to the position of its last row"""
+        return {key: position for position, key in enumerate(self.keys)}
+
+
+class RowChanges:
+    """Values that are merged into a single row of the main sheet"""
+    __slots__ = ("values_by_input", "merged_count")
+
+    def __init__(self):
+        self.values_by_input: Dict[int, tuple] = {}
+        """Merged values by the index of the table they came from, in the order the tables were merged"""
+        self.merged_count = 0
+        """Amount of new rows that were merged into the row"""
+
+    def merge(self, input_index: int, values: tuple):
+        # Of several rows with the same key in a single table, the last row wins
+        self.values_by_input[input_index] = values
+        self.merged_count += 1
+
+
+class MergePlan:
+    """
+    Matches the rows of new tables against the keys of the main sheet, to find which main sheet rows are updated and
+    which rows are inserted. Tables are merged one after another, so a row that is inserted for one table is updated by
+    the following tables. Rows without a key are skipped, just like the rows of the main sheet without a key are never
+    updated, so the blank rows at the end of a new sheet are not inserted.
+
+    Rows with the same key in a single table are each inserted, just like they would be by separate merges. The
+    following tables then update those rows by the duplicate key policy, as separate merges would find them in the
+    merged sheet, where the last inserted row is at the top.
+    """
+
+    def __init__(self, key_positions: Dict[Any, int], duplicate_positions: Optional[Dict[Any, List[int]]] = None,
+                 duplicate_keys: DuplicateKeyPolicy = DuplicateKeyPolicy.LAST):
+        """
+        Args:
+            key_positions (Dict[Any, int]): Position of the row that is updated for each key of the main sheet.
+            duplicate_positions (Optional[Dict[Any, List[int]]]): Positions of the other rows that are updated as well,
+                for keys that are used by more than one row of the main sheet.
+            duplicate_keys (DuplicateKeyPolicy): Which of the rows that were inserted for the same key are updated.
+        """
+        self.key_positions = key_positions
+        self.duplicate_positions = duplicate_positions or {}
+        self.duplicate_keys = duplicate_keys
+        self.updates: Dict[int, RowChanges] = {}
+        """Changes to the rows of the main sheet, by the position of the row"""
+        self.inserted: List[RowChanges] = []
+        """Changes that make up each inserted row, in the order the rows were inserted"""
+        self._inserted_keys: Dict[Any, List[RowChanges]] = {}
+        """Rows that were inserted for each key, in the order they were inserted"""
+
+    def merge(self, input_index: int, table: ColumnTable):
+        """Merge the rows of a new table, which is identified by the given index"""
+        key_positions = self.key_positions
+        duplicate_positions = self.duplicate_positions
+        updates = self.updates
+        # Rows inserted for this table are only matched by the following tables
+        table_inserted_keys: Dict[Any, List[RowChanges]] = {}
+
+        for key, values in table.rows():
+            # Rows without a key can not be matched, and would only be inserted as rows that can never be updated
+            if key is None:
+                continue
+
+            position = key_positions.get(key)
+            if position is not None:
+                changes = updates.get(position)
+                if changes is None:
+                    changes = updates[position] = RowChanges()
+                if duplicate_positions and key in duplicate_positions:
+                    self._merge_duplicates(input_index, values, duplicate_positions[key])
+                changes.merge(input_index, values)
+                continue
+
+            inserted_rows = self._inserted_keys.get(key)
+            if inserted_rows is None:
+                changes = RowChanges()
+                table_inserted_keys.setdefault(key, []).append(changes)
+                self.inserted.append(changes)
+                changes.merge(input_index, values)
+            else:
+                for changes in self._updated_inserted_rows(inserted_rows):
+                    changes.merge(input_index, values)
+
+        self._inserted_keys.update(table_inserted_keys)
+
+    def duplicate_inserted_keys(self) -> Dict[Any, int]:
+        """Keys that more than one row was inserted for, along with the index of the table that inserted the rows"""
+        # Every row of a key is inserted for the same table, which is the first one that the row was merged from
+        return {key: next(iter(inserted_rows[0].values_by_input)) for key, inserted_rows in self._inserted_keys.items()
+                if len(inserted_rows) > 1}
+
+    def _updated_inserted_rows(self, inserted_rows: List[RowChanges]) -> List[RowChanges]:
+        if len(inserted_rows) == 1 or self.duplicate_keys == DuplicateKeyPolicy.ALL:
+            return inserted_rows
+        # Rows are inserted from the bottom up, so the first row of the merged sheet is the last one inserted
+        elif self.duplicate_keys == DuplicateKeyPolicy.FIRST:
+            return inserted_rows[-1:]
+
+        return inserted_rows[:1]
+
+    def _merge_duplicates(self, input_index: int, values: tuple, positions: List[int]):
+        for position in positions:
+            changes = self.updates.get(position)
+            if changes is None:
+                changes = self.updates[position] = RowChanges()
+            changes.merge(input_index, values)
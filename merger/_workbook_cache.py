@@ -0,0 +1,71 @@
+"""
+Loaded workbooks that a long-running merge process keeps in memory, so that merging into the same spreadsheet again
+skips parsing it. A workbook is kept once a merge has saved it, and is only handed out again if its file has not
+changed since. Workbooks are never copied: the merge that takes a workbook owns it, and keeps it again once it has
+saved it.
+
+The cache is only enabled within the processes of the merge daemon, every other merge always parses its workbook.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from openpyxl import Workbook
+
+_process_cache: Optional["WorkbookCache"] = None
+
+
+def _file_signature(file_path: Path) -> Tuple[int, int]:
+    stat = file_path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class WorkbookCache:
+    """Least recently saved workbooks, by the path of their file"""
+
+    def __init__(self, max_workbooks: int):
+        """
+        Args:
+            max_workbooks (int): Amount of workbooks that are kept, where the least recently saved one is dropped first.
+        """
+        self.max_workbooks = max_workbooks
+        self._workbooks: "OrderedDict[Path, Tuple[Tuple[int, int], Workbook]]" = OrderedDict()
+
+    def take(self, file_path: Path) -> Optional[Workbook]:
+        """Take the workbook of a file out of the cache, if it is kept and its file is unchanged"""
+        entry = self._workbooks.pop(file_path, None)
+        if entry is None:
+            return None
+
+        signature, workbook = entry
+        try:
+            if _file_signature(file_path) != signature:
+                return None
+        except OSError:
+            return None
+        return workbook
+
+    def keep(self, file_path: Path, workbook: Workbook):
+        """Keep a workbook that has just been saved to the given file, or that matches the file otherwise"""
+        if self.max_workbooks <= 0:
+            return
+
+        try:
+            signature = _file_signature(file_path)
+        except OSError:
+            return
+        self._workbooks.pop(file_path, None)
+        self._workbooks[file_path] = (signature, workbook)
+        while len(self._workbooks) > self.max_workbooks:
+            self._workbooks.popitem(last=False)
+
+
+def enable(max_workbooks: int):
+    """Keep up to the given amount of workbooks in memory within the current process"""
+    global _process_cache
+    _process_cache = WorkbookCache(max_workbooks)
+
+
+def process_cache() -> Optional[WorkbookCache]:
+    """Cache of the current process, or `None` if workbooks are not kept"""
+    return _process_cache
@@ -0,0 +1,208 @@
+"""
+Merging from within asyncio applications, such as services that merge uploaded spreadsheets. Each merge runs in a
+process of a process pool, which caps how many merges run at once, while the event loop awaits the merge and iterates
+over its progress.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple, Union
+
+from merger._config import Config, ConfigProperty
+from merger.changes import MergeResult
+from merger.keys import KeyNormalization
+from merger.merger import MergeEngine, MergePrecedence, DuplicateKeyPolicy
+from merger.metrics import MergeMetrics
+from merger.nonblocking_merger import MergeMessage, MergeStatus, _ProgressMerger
+from merger.sheets import SheetMapping, SheetReference
+
+_shared_lock = threading.Lock()
+_shared_executor: Optional[ProcessPoolExecutor] = None
+_shared_manager: Optional[SyncManager] = None
+
+
+def _default_executor() -> ProcessPoolExecutor:
+    """Process pool of every merge that is not given an executor of its own"""
+    global _shared_executor
+    with _shared_lock:
+        if _shared_executor is None:
+            # Each process runs a single merge at a time, so further merges wait until a process is free
+            _shared_executor = ProcessPoolExecutor(Config.get(ConfigProperty.MERGE_PROCESSES) or None)
+        return _shared_executor
+
+
+def _manager() -> SyncManager:
+    """Manager of the queues and events that are shared with the merge processes, which is started once"""
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = SyncManager()
+            _shared_manager.start()
+        return _shared_manager
+
+
+class _MergeCancelled(Exception):
+    """Raised within a merge process once its merge has been cancelled"""
+
+
+class _PoolMerger(_ProgressMerger):
+    """Merger that runs the merge of an `AsyncMerger` within a process of its process pool"""
+
+    def __init__(self, settings: dict, updates, cancelled):
+        """
+        Args:
+            settings (dict): Arguments of `Merger._init_settings`.
+            updates (Queue): Receives the status, progress and merging new spreadsheet of each published update.
+            cancelled (Event): Set once the merge is cancelled.
+        """
+        self._init_settings(**settings)
+        self._probe_files()
+        self._init_progress()
+        self._updates = updates
+        self._cancelled = cancelled
+        self._saving = False
+
+    def _check_cancelled(self):
+        """Stop the merge if it has been cancelled, unless it is already saving the merged file"""
+        if self._cancelled.is_set() and not self._saving:
+            raise _MergeCancelled()
+
+    def _publish_progress(self, status: MergeStatus, progress: int):
+        # Checked along with each published update, so that a cancelled merge stops within a progress interval
+        self._check_cancelled()
+        self._updates.put((status, progress, self._input_index))
+
+    def _hook_initialization(self):
+        self._check_cancelled()
+        super()._hook_initialization()
+
+    def _hook_pre_saving(self):
+        # The merged file is either saved or left alone once saving has started, so a cancellation is too late
+        self._check_cancelled()
+        self._saving = True
+        super()._hook_pre_saving()
+
+
+def _merge_in_pool(settings: dict, updates, cancelled) -> Tuple[MergeResult, Dict[str, MergeResult], MergeMetrics]:
+    merge = _PoolMerger(settings, updates, cancelled)
+    merge._check_cancelled()
+    merge._start_reporting()
+    merge._run_phase("load", merge._load)
+    merge.merge()
+    return merge.result, merge.sheet_results, merge.metrics
+
+
+class AsyncMerger(_ProgressMerger):
+    def __init__(self, main_file_path: Path, new_file_path: Union[Path, Sequence[Path]],
+                 column_key: Union[str, Sequence[str]],
+                 merged_file_name: Optional[str] = None, engine: Union[MergeEngine, str] = MergeEngine.AUTO,
+                 use_key_index: Optional[bool] = None,
+                 precedence: Union[MergePrecedence, str] = MergePrecedence.LAST_WINS,
+                 duplicate_keys: Union[DuplicateKeyPolicy, str, None] = None,
+                 key_normalization: Optional[KeyNormalization] = None, compression_level: Optional[int] = None,
+                 profile_path: Optional[Path] = None,
+                 sheets: Optional[Sequence[Union[SheetMapping, SheetReference, tuple]]] = None,
+                 checkpoint_min_rows: Optional[int] = None, executor: Optional[Executor] = None):
+        """
+        Merger whose merge is awaited, for use within an asyncio event loop. Creating it only validates the settings.
+        The spreadsheet files are probed by `probe`, which validates the column key, within a thread of the event
+        loop's default executor, while loading and merging them happens within a process of the `executor`. Without an
+        `executor`, every merge shares a process pool of `ConfigProperty.MERGE_PROCESSES` processes, or one process for
+        each CPU if it is 0. Each merge takes up one of its processes for as long as it runs, so several merges run at
+        once up to the size of the pool.
+
+        The other arguments are those of `Merger`. Every spreadsheet is read within the merge process itself.
+        """
+        self._init_settings(main_file_path, new_file_path, column_key, merged_file_name, engine, use_key_index,
+                            precedence, parse_workers=0, duplicate_keys=duplicate_keys,
+                            key_normalization=key_normalization, compression_level=compression_level,
+                            profile_path=profile_path, sheets=sheets, checkpoint_min_rows=checkpoint_min_rows)
+        # The maximum progress is only known once the spreadsheet files have been probed
+        self._init_progress()
+
+        # The merge process validates the resolved settings again, and merges the new spreadsheets in the order they
+        # were resolved in here
+        self._pool_settings = dict(original_file_path=self.original_file_path, new_file_path=self.new_file_paths,
+                                   column_key=self.key_columns, merged_file_name=merged_file_name, engine=self.engine,
+                                   use_key_index=self.use_key_index, precedence=MergePrecedence.LAST_WINS,
+                                   parse_workers=0, duplicate_keys=self.duplicate_keys,
+                                   key_normalization=self.key_normalization, compression_level=self.compression_level,
+                                   profile_path=self.profile_path, sheets=self.sheets,
+                                   checkpoint_min_rows=self.checkpoint_min_rows)
+        self.executor = executor
+        """Executor that the merge runs in, or `None` to run it in the shared process pool"""
+        manager = _manager()
+        self._updates = manager.Queue()
+        self._cancelled = manager.Event()
+
+    async def probe(self):
+        """
+        Probe the spreadsheet files for their merged sheets and header rows, which validates the column key and
+        determines `max_progress`. The files are read by a thread of the event loop's default executor.
+
+        Raises:
+            MergeException: If a merged sheet or the column key can not be found.
+        """
+        def probe_files():
+            self._probe_files()
+            self._init_progress()
+
+        await asyncio.get_running_loop().run_in_executor(None, probe_files)
+
+    async def merge(self) -> MergeResult:
+        """
+        Probe the spreadsheet files, which picks up any changes since `probe` was awaited, then merge them within a
+        process of the executor, and wait for the merge to finish.
+
+        Cancelling the awaiting task cancels the merge. A merge that is running stops at the next boundary between its
+        phases or at its next progress update, and is waited for, so that it has removed any temporary files by the
+        time the `asyncio.CancelledError` is raised. Once a merge has started saving the merged file it is no longer
+        cancelled, and its outcome is returned instead.
+
+        Returns:
+            The outcome of the merge, which is also stored as `result`, along with `sheet_results` and `metrics`.
+        """
+        try:
+            await self.probe()
+            executor = self.executor if self.executor is not None else _default_executor()
+            pool_future = executor.submit(_merge_in_pool, self._pool_settings, self._updates, self._cancelled)
+            try:
+                outcome = await asyncio.wrap_future(pool_future)
+            except asyncio.CancelledError:
+                # A merge that has not started yet is removed from the executor's queue instead
+                self._cancelled.set()
+                outcome, = await asyncio.gather(asyncio.wrap_future(pool_future), return_exceptions=True)
+                if isinstance(outcome, BaseException):
+                    raise
+
+                # The merge was already saving the merged file, so the cancellation is withdrawn
+                task = asyncio.current_task()
+                if task is not None and hasattr(task, "uncancel"):
+                    task.uncancel()
+
+            self.result, self.sheet_results, self.metrics = outcome
+            return self.result
+        finally:
+            # Ends the iteration of the progress, after every update that the merge process published
+            self._updates.put(None)
+
+    def _publish_progress(self, status: MergeStatus, progress: int):
+        # The merge itself runs in a merge process, whose updates are put onto the same queue
+        self._updates.put((status, progress, self._input_index))
+
+    async def progress(self) -> AsyncIterator[MergeMessage]:
+        """
+        Iterate over the progress of the merge until it has finished, whether it succeeded or not. Updates are
+        published as often as `ConfigProperty.PROGRESS_INTERVAL_ROWS` and `ConfigProperty.PROGRESS_INTERVAL_MS` allow.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            # Waiting for an update blocks, so it's waited for by a thread of the event loop's default executor
+            update = await loop.run_in_executor(None, self._updates.get)
+            if update is None:
+                return
+
+            status, progress, input_index = update
+            yield MergeMessage(status, progress, self._format_progress(status, progress, input_index))
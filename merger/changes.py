@@ -0,0 +1,116 @@
+"""
+Outcomes of merges, along with the change sets of dry-run merges, which describe what a merge would change in the
+original spreadsheet without writing it.
+"""
+import csv
+import json
+from datetime import date, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+class MergeResult(NamedTuple):
+    inserted_rows: int
+    updated_rows: int
+    """Rows of the original spreadsheet that had at least one of their cells changed"""
+    unchanged_rows: int
+    """Rows of the original spreadsheet that new rows were merged into, which already held the merged values"""
+    saved: bool
+    """Whether the merged file was written. Merging into the original file without any changes leaves it untouched."""
+
+
+class CellChange(NamedTuple):
+    row: Optional[int]
+    """Row number in the original spreadsheet, or `None` if the row is inserted"""
+    key: Any
+    """Key of the row"""
+    column: str
+    """Label of the column"""
+    old_value: Any
+    new_value: Any
+    sheet: Optional[str] = None
+    """Title of the sheet of the original spreadsheet"""
+
+
+class ChangeSet:
+    """Rows and cells that a merge changes in the original spreadsheet"""
+
+    def __init__(self):
+        self.inserted_rows = 0
+        self.updated_rows = 0
+        """Rows of the original spreadsheet that have at least one changed cell"""
+        self.unchanged_rows = 0
+        """Rows of the original spreadsheet that new rows were merged into, without changing any of their cells"""
+        self.changed_cells: Dict[str, int] = {}
+        """Amount of changed cells by the label of their column, including the cells of inserted rows"""
+        self.cell_changes: List[CellChange] = []
+
+    def add_row(self, row: Optional[int], key, cell_changes: List[CellChange]):
+        """
+        Add the changes to a single row.
+
+        Args:
+            row (Optional[int]): Row number in the original spreadsheet, or `None` if the row is inserted.
+            key: Key of the row.
+            cell_changes (List[CellChange]): Every cell of the row that is changed.
+        """
+        if row is None:
+            self.inserted_rows += 1
+        elif cell_changes:
+            self.updated_rows += 1
+        else:
+            self.unchanged_rows += 1
+
+        changed_cells = self.changed_cells
+        for cell_change in cell_changes:
+            changed_cells[cell_change.column] = changed_cells.get(cell_change.column, 0) + 1
+        self.cell_changes.extend(cell_changes)
+
+    def summary(self) -> str:
+        lines = [f"{self.inserted_rows} rows inserted, {self.updated_rows} rows updated, "
+                 f"{self.unchanged_rows} rows unchanged"]
+        lines.extend(f"  {column}: {count} cells changed" for column, count in self.changed_cells.items())
+        return "\n".join(lines)
+
+    def to_dict(self, include_cells: bool = True) -> dict:
+        """JSON serializable form of the change set, optionally without the changes to each cell"""
+        change_dict = {
+            "inserted_rows": self.inserted_rows,
+            "updated_rows": self.updated_rows,
+            "unchanged_rows": self.unchanged_rows,
+            "changed_cells": dict(self.changed_cells),
+        }
+        if include_cells:
+            change_dict["cells"] = [{"sheet": cell_change.sheet, "row": cell_change.row,
+                                     "key": _json_value(cell_change.key), "column": cell_change.column,
+                                     "old": _json_value(cell_change.old_value),
+                                     "new": _json_value(cell_change.new_value)}
+                                    for cell_change in self.cell_changes]
+
+        return change_dict
+
+    def write(self, file_path: Path):
+        """Write the changes to each cell to a CSV file, or to a JSON file along with the summary"""
+        if file_path.suffix.lower() == ".json":
+            with open(file_path, "w", encoding="utf-8") as file:
+                json.dump(self.to_dict(), file, indent=2)
+            return
+
+        with open(file_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(("change", "sheet", "row", "key", "column", "old", "new"))
+            for cell_change in self.cell_changes:
+                writer.writerow(("insert" if cell_change.row is None else "update", cell_change.sheet, cell_change.row,
+                                 _json_value(cell_change.key), cell_change.column, cell_change.old_value,
+                                 cell_change.new_value))
+
+
+def _json_value(value):
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    elif isinstance(value, timedelta):
+        return value.total_seconds()
+    elif isinstance(value, tuple):
+        return [_json_value(item) for item in value]
+
+    return value
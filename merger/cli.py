@@ -0,0 +1,304 @@
+"""
+Headless command-line interface of the spreadsheet merger, for running merges without a display.
+
+Usage: python -m merger merge ORIGINAL NEW [NEW ...] [--key KEY [--key KEY ...]] [--out NAME]
+                              [--engine {full,streaming,auto}] [--precedence {last,first,mtime}]
+                              [--duplicates {first,last,all,error}] [--strip-keys] [--casefold-keys]
+                              [--key-coercion {none,number,text}] [--compression-level LEVEL] [--dry-run]
+                              [--diff PATH] [--json]
+       python -m merger serve [--host HOST] [--port PORT] [--workers WORKERS] [--cached-workbooks COUNT]
+
+Nothing in this module may import tkinter, directly or through the GUI modules.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional, List
+
+import merger
+from merger._config import Config, ConfigProperty
+from merger.exceptions import MergeException
+from merger.keys import KeyCoercion, KeyNormalization
+from merger.merger import Merger, MergeEngine, MergePrecedence, DuplicateKeyPolicy
+from merger.nonblocking_merger import MergeStatus
+from merger.progress import ProgressReporter
+from merger.sheets import SheetMapping
+
+LOG = logging.getLogger(__name__)
+
+EXIT_SUCCESS = 0
+"""The merged spreadsheet was saved"""
+EXIT_FAILURE = 1
+"""The merge failed with an unexpected error"""
+EXIT_USAGE = 2
+"""The command-line arguments were invalid"""
+EXIT_MERGE_ERROR = 3
+"""The spreadsheets could not be merged, such as when the column key is missing"""
+EXIT_FILE_ERROR = 4
+"""A spreadsheet file could not be found, read or written"""
+EXIT_INTERRUPTED = 130
+"""The merge was interrupted"""
+
+
+class ReportingMerger(Merger):
+    """Merger that reports its progress as events"""
+
+    def __init__(self, emit: Callable[[dict], None], *args, **kwargs):
+        """
+        Args:
+            emit (Callable[[dict], None]): Called with every event, as a JSON serializable dictionary.
+        """
+        self._emit = emit
+        self._reporter = ProgressReporter(self._publish_progress,
+                                          Config.get(ConfigProperty.PROGRESS_INTERVAL_ROWS),
+                                          Config.get(ConfigProperty.PROGRESS_INTERVAL_MS) / 1000)
+        self.rows_indexed = 0
+        self.rows_merged = 0
+        self.duplicate_key_count = 0
+        """Amount of keys that are used by more than one row of the original spreadsheet"""
+
+        self._reporter.status(MergeStatus.INIT)
+        super().__init__(*args, **kwargs)
+
+    def _publish_progress(self, status: MergeStatus, progress: int):
+        self._emit({"event": "progress", "phase": status.name.lower(), "rows": progress})
+
+    def _hook_initialization(self):
+        self._reporter.status(MergeStatus.INDEXING)
+
+    def _hook_row_indexed(self, row_index):
+        self.rows_indexed = row_index + 1
+        self._reporter.update(self.rows_indexed)
+
+    def _hook_duplicate_keys(self, duplicate_key_count, duplicate_row_count):
+        # Every merged sheet is indexed on its own
+        self.duplicate_key_count += duplicate_key_count
+        self._emit({"event": "duplicates", "keys": duplicate_key_count, "rows": duplicate_row_count})
+
+    def _hook_input_merging(self, input_index, file_path):
+        self._emit({"event": "input", "index": input_index, "file": str(file_path)})
+
+    def _hook_row_merged(self, row_index):
+        self.rows_merged = row_index + 1
+        if self._reporter.current_status != MergeStatus.MERGING:
+            self._reporter.status(MergeStatus.MERGING, self.rows_merged)
+        else:
+            self._reporter.update(self.rows_merged)
+
+    def _hook_pre_saving(self):
+        self._reporter.status(MergeStatus.SAVING)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m merger",
+                                     description=f"Spreadsheet Merger (v{merger.__version__}). Without any arguments, "
+                                                 f"the graphical interface is started instead.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge_parser = commands.add_parser("merge", help="merge spreadsheets into an original spreadsheet",
+                                       description="Merge the rows of new spreadsheets into an original spreadsheet, "
+                                                   "matching rows by the values of their key column.")
+    merge_parser.add_argument("original", type=Path, help="original spreadsheet, which the rows are merged into")
+    merge_parser.add_argument("new", type=Path, nargs="+", help="spreadsheets with the rows to merge")
+    merge_parser.add_argument("-k", "--key", action="append",
+                              help="label of the column that identifies each row. Repeat it to identify rows by "
+                                   f"several columns at once (default: {Config.get(ConfigProperty.COLUMN_KEY)})")
+    merge_parser.add_argument("-o", "--out", metavar="NAME",
+                              help="name of the merged spreadsheet, which is saved next to the original spreadsheet. "
+                                   "The original spreadsheet is replaced if no name is given. A .xlsx, .csv or .tsv "
+                                   "extension selects the format of the merged spreadsheet")
+    merge_parser.add_argument("-s", "--sheet", action="append", type=SheetMapping.parse, metavar="MAIN[=NEW]",
+                              help="sheet of the original spreadsheet to merge into, along with the sheet of the new "
+                                   "spreadsheets that is merged into it if it has another name. A number selects a "
+                                   "sheet by its index, starting at 0. Repeat it to merge several sheets at once "
+                                   "(default: the first sheets)")
+    merge_parser.add_argument("-e", "--engine", choices=[engine.value for engine in MergeEngine],
+                              default=MergeEngine.AUTO.value,
+                              help="how the original spreadsheet is read (default: %(default)s)")
+    merge_parser.add_argument("-p", "--precedence", choices=[precedence.value for precedence in MergePrecedence],
+                              default=MergePrecedence.LAST_WINS.value,
+                              help="which new spreadsheet wins when several of them contain the same key: the last "
+                                   "given, the first given, or the most recently modified (default: %(default)s)")
+    merge_parser.add_argument("-d", "--duplicates", choices=[policy.value for policy in DuplicateKeyPolicy],
+                              default=None,
+                              help="which rows of the original spreadsheet are updated when several of them have the "
+                                   "same key, or error to refuse the merge (default: the configured policy)")
+    merge_parser.add_argument("--strip-keys", action=argparse.BooleanOptionalAction, default=None,
+                              help="ignore whitespace around keys (default: the configured setting)")
+    merge_parser.add_argument("--casefold-keys", action=argparse.BooleanOptionalAction, default=None,
+                              help="ignore the case of keys (default: the configured setting)")
+    merge_parser.add_argument("--key-coercion", choices=[coercion.value for coercion in KeyCoercion], default=None,
+                              help="match keys that are numbers against keys that are text, by converting text to "
+                                   "numbers or numbers to text (default: the configured setting)")
+    merge_parser.add_argument("-w", "--workers", type=int, default=None,
+                              help="worker processes that read the spreadsheets in parallel, or 0 to read them all "
+                                   "within this process (default: the configured amount)")
+    merge_parser.add_argument("--key-index", action=argparse.BooleanOptionalAction, default=None,
+                              help="reuse and write the .merge-index file of the original spreadsheet")
+    merge_parser.add_argument("-z", "--compression-level", type=int, choices=range(10), metavar="LEVEL",
+                              help="ZIP compression level of merged workbooks from 0 to 9, where lower levels save "
+                                   "faster but make larger files (default: the configured level)")
+    merge_parser.add_argument("--checkpoint", type=int, metavar="ROWS",
+                              help="store the matched rows in a .merge-checkpoint file if at least ROWS rows are "
+                                   "merged, so that an interrupted merge of the same files continues from it when run "
+                                   "again, or 0 to write no checkpoint (default: the configured minimum)")
+    merge_parser.add_argument("-n", "--dry-run", action="store_true",
+                              help="only report what the merge would change, without writing any file")
+    merge_parser.add_argument("--diff", type=Path, metavar="PATH",
+                              help="write every changed cell to a .csv or .json file. Implies --dry-run")
+    merge_parser.add_argument("--profile", type=Path, metavar="PATH",
+                              help="write the timings and memory usage of each merge phase to a .json file, or the "
+                                   "cProfile statistics of the merge to any other file")
+    merge_parser.add_argument("--json", action="store_true",
+                              help="print progress, timing and result events to stdout as JSON lines")
+
+    serve_parser = commands.add_parser("serve", help="run a merge daemon that takes merge jobs over HTTP",
+                                       description="Run a long-running merge daemon, which takes merge jobs as JSON "
+                                                   "at /jobs and runs them in a pool of merge processes. Merges into "
+                                                   "the same spreadsheet run one after another.")
+    serve_parser.add_argument("--host", default="127.0.0.1",
+                              help="address to listen on, which only takes jobs from this machine by default "
+                                   "(default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=Config.get(ConfigProperty.DAEMON_PORT),
+                              help="port to listen on (default: %(default)s)")
+    serve_parser.add_argument("-w", "--workers", type=int, default=None,
+                              help="merge processes, which is how many jobs run at once (default: the configured "
+                                   "amount, or one for each CPU)")
+    serve_parser.add_argument("--cached-workbooks", type=int, default=Config.get(ConfigProperty.CACHED_WORKBOOKS),
+                              metavar="COUNT",
+                              help="recently saved workbooks that each merge process keeps in memory, to merge into "
+                                   "them again without parsing them (default: %(default)s)")
+
+    return parser
+
+
+def _run_serve(args: argparse.Namespace) -> int:
+    # The daemon is only imported to serve, so that merging from the command line does not load it
+    from merger import daemon
+
+    workers = args.workers or Config.get(ConfigProperty.MERGE_PROCESSES) or os.cpu_count() or 1
+    logging.getLogger().setLevel(logging.INFO)
+    try:
+        asyncio.run(daemon.serve(args.host, args.port, workers, args.cached_workbooks))
+    except KeyboardInterrupt:
+        return EXIT_SUCCESS
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FILE_ERROR
+    return EXIT_SUCCESS
+
+
+def _run_merge(args: argparse.Namespace) -> int:
+    def emit(event: dict):
+        if args.json:
+            print(json.dumps(event), flush=True)
+
+    def fail(exit_code: int, message: str) -> int:
+        if args.json:
+            emit({"event": "error", "exit_code": exit_code, "message": message})
+        else:
+            print(f"error: {message}", file=sys.stderr)
+        return exit_code
+
+    for file_path in (args.original, *args.new):
+        if not file_path.is_file():
+            return fail(EXIT_FILE_ERROR, f"The file path `{file_path}` is not a valid spreadsheet path.")
+
+    # Key normalization options that are not given fall back to the configured settings
+    normalization_overrides = {}
+    if args.strip_keys is not None:
+        normalization_overrides["strip"] = args.strip_keys
+    if args.casefold_keys is not None:
+        normalization_overrides["casefold"] = args.casefold_keys
+    if args.key_coercion is not None:
+        normalization_overrides["coercion"] = KeyCoercion(args.key_coercion)
+    key_normalization = dataclasses.replace(KeyNormalization.from_config(), **normalization_overrides)
+    column_key = args.key or Config.get(ConfigProperty.COLUMN_KEY)
+    dry_run = args.dry_run or args.diff is not None
+
+    start = time.perf_counter()
+    try:
+        merge = ReportingMerger(emit, args.original, args.new, column_key, args.out, args.engine, args.key_index,
+                                args.precedence, args.workers, args.duplicates, key_normalization, dry_run,
+                                args.compression_level, args.profile, args.sheet, args.checkpoint)
+        merge.merge()
+        if args.diff:
+            merge.change_set.write(args.diff)
+    except MergeException as e:
+        return fail(EXIT_MERGE_ERROR, str(e))
+    except OSError as e:
+        return fail(EXIT_FILE_ERROR, str(e))
+    except KeyboardInterrupt:
+        return fail(EXIT_INTERRUPTED, "The merge was interrupted.")
+    except Exception as e:
+        LOG.error("Unexpected merge failure", exc_info=True)
+        return fail(EXIT_FAILURE, f"{type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - start
+
+    if dry_run:
+        if args.json:
+            emit({"event": "dry_run", **merge.change_set.to_dict(include_cells=False),
+                  "diff_file": str(args.diff) if args.diff else None, "elapsed": round(elapsed, 4)})
+        else:
+            print(merge.change_set.summary())
+            print(f"Dry run of merging into {merge.merged_file_path} took {elapsed:.2f}s, nothing was written")
+        return EXIT_SUCCESS
+
+    if args.json:
+        emit({
+            "event": "complete",
+            "merged_file": str(merge.merged_file_path),
+            "engine": merge.engine.value,
+            "rows_indexed": merge.rows_indexed,
+            "rows_merged": merge.rows_merged,
+            "duplicate_keys": merge.duplicate_key_count,
+            "inserted_rows": merge.result.inserted_rows,
+            "updated_rows": merge.result.updated_rows,
+            "unchanged_rows": merge.result.unchanged_rows,
+            "saved": merge.result.saved,
+            "sheets": {title: result._asdict() for title, result in merge.sheet_results.items()},
+            # Wall time of each phase, from the merge's own metrics
+            "timings": {**{phase: phase_metrics["wall_seconds"]
+                           for phase, phase_metrics in merge.metrics.to_dict(include_samples=False)["phases"].items()},
+                        "total": round(elapsed, 4)},
+            "metrics": merge.metrics.to_dict(include_samples=False),
+        })
+    elif merge.result.saved:
+        print(f"Merged {merge.rows_merged} rows into {merge.merged_file_path} in {elapsed:.2f}s "
+              f"({merge.result.inserted_rows} inserted, {merge.result.updated_rows} updated, "
+              f"{merge.result.unchanged_rows} unchanged)")
+        if len(merge.sheet_results) > 1:
+            for title, result in merge.sheet_results.items():
+                print(f"  {title}: {result.inserted_rows} inserted, {result.updated_rows} updated, "
+                      f"{result.unchanged_rows} unchanged")
+    else:
+        print(f"Nothing changed, {merge.merged_file_path} was left untouched ({elapsed:.2f}s)")
+
+    return EXIT_SUCCESS
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the command-line interface.
+
+    Returns:
+        The exit code of the command.
+    """
+    logging.basicConfig(format="%(levelname)s: %(message)s", stream=sys.stderr)
+
+    parser = _build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        # Help and usage errors exit through argparse
+        return e.code
+
+    if args.command == "serve":
+        return _run_serve(args)
+    return _run_merge(args)
@@ -0,0 +1,394 @@
+"""
+Long-running merge daemon, which takes merge jobs over a local HTTP interface. Merges skip the startup of a new merger
+process, and merges into the same spreadsheet never run at the same time.
+
+Jobs run in a bounded pool of merge processes, one job per process at a time. Jobs that merge into the same file wait
+for each other in the order they were submitted. Each process keeps the workbooks it has recently saved in memory, and
+a job is preferably run by the process that holds the workbook it merges into.
+
+Endpoints, which all respond with JSON:
+    POST /jobs          Submit a job, given as a JSON object with the fields of `MergeJob`. Responds with the job.
+    GET /jobs           List the jobs that are queued, running or recently finished.
+    GET /jobs/<id>      Status, progress and result of a job.
+    DELETE /jobs/<id>   Cancel a job that has not finished yet.
+
+Nothing in this module may import tkinter, directly or through the GUI modules.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from http import HTTPStatus
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple, Union, get_args, get_origin
+from urllib.parse import urlsplit
+
+from merger import _workbook_cache
+from merger._config import Config, ConfigProperty
+from merger.async_merger import AsyncMerger
+from merger.exceptions import MergeException
+from merger.keys import KeyCoercion, KeyNormalization
+from merger.merger import MergeEngine, MergePrecedence
+from merger.nonblocking_merger import MergeMessage
+from merger.sheets import SheetMapping
+
+LOG = logging.getLogger(__name__)
+
+_FINISHED_JOB_LIMIT = 100
+"""Amount of finished jobs that are still listed, where the oldest ones are forgotten first"""
+_MAX_REQUEST_BYTES = 1024 * 1024
+_REQUEST_TIMEOUT_SECONDS = 30
+"""Time a client has to send its whole request, before its connection is closed"""
+
+_TYPE_NAMES = {str: "a string", int: "an integer", bool: "true or false", type(None): "null"}
+
+
+def _matches_type(value, annotation) -> bool:
+    """Whether a JSON value matches the type annotation of a merge job field"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        return any(_matches_type(value, arg) for arg in get_args(annotation))
+    if origin is list:
+        item_annotation, = get_args(annotation)
+        return isinstance(value, list) and all(_matches_type(item, item_annotation) for item in value)
+    if annotation is int:
+        # JSON booleans are not integers
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, annotation)
+
+
+def _describe_type(annotation) -> str:
+    origin = get_origin(annotation)
+    if origin is Union:
+        return " or ".join(_describe_type(arg) for arg in get_args(annotation))
+    if origin is list:
+        item_annotation, = get_args(annotation)
+        return f"a list of {_describe_type(item_annotation).split(' ', 1)[1]}s"
+    return _TYPE_NAMES[annotation]
+
+
+@dataclass
+class MergeJob:
+    """
+    Definition of a merge job, with the settings of `Merger`. Settings that are not given fall back to the configured
+    settings, just like they do for the command-line interface.
+    """
+    original: str
+    """Original spreadsheet, which the rows are merged into"""
+    new: List[str]
+    """Spreadsheets with the rows to merge"""
+    key: Union[str, List[str], None] = None
+    """Label of the column that identifies each row, or the labels of several columns"""
+    out: Optional[str] = None
+    """
+    File name of the merged spreadsheet, which is placed next to the original spreadsheet, or replaces the original
+    spreadsheet if it is not given
+    """
+    sheets: Optional[List[str]] = None
+    """Sheets to merge, each of the form `MAIN[=NEW]`"""
+    engine: str = MergeEngine.AUTO.value
+    precedence: str = MergePrecedence.LAST_WINS.value
+    duplicates: Optional[str] = None
+    strip_keys: Optional[bool] = None
+    casefold_keys: Optional[bool] = None
+    key_coercion: Optional[str] = None
+    compression_level: Optional[int] = None
+    checkpoint: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, definition) -> "MergeJob":
+        if not isinstance(definition, dict):
+            raise MergeException("A merge job has to be a JSON object.")
+        unknown_fields = definition.keys() - {field.name for field in dataclasses.fields(cls)}
+        if unknown_fields:
+            raise MergeException(f"Unknown merge job fields: {', '.join(sorted(unknown_fields))}.")
+        try:
+            job = cls(**definition)
+        except TypeError:
+            raise MergeException("A merge job needs both the `original` and the `new` spreadsheets.")
+        if isinstance(job.new, str):
+            job.new = [job.new]
+
+        for field in dataclasses.fields(cls):
+            if not _matches_type(getattr(job, field.name), field.type):
+                raise MergeException(f"The merge job field `{field.name}` has to be {_describe_type(field.type)}.")
+        # The merged spreadsheet is always placed next to the original spreadsheet
+        if job.out is not None and (Path(job.out).name != job.out or job.out in ("", "..")):
+            raise MergeException(f"The merge job field `out` has to be a file name without any directories, "
+                                 f"not `{job.out}`.")
+        return job
+
+    def create_merger(self) -> AsyncMerger:
+        """Create the merger of the job, without probing its spreadsheet files yet"""
+        normalization_overrides = {}
+        if self.strip_keys is not None:
+            normalization_overrides["strip"] = self.strip_keys
+        if self.casefold_keys is not None:
+            normalization_overrides["casefold"] = self.casefold_keys
+        if self.key_coercion is not None:
+            normalization_overrides["coercion"] = KeyCoercion(self.key_coercion)
+        key_normalization = dataclasses.replace(KeyNormalization.from_config(), **normalization_overrides)
+
+        for file_path in (self.original, *self.new):
+            if not Path(file_path).is_file():
+                raise MergeException(f"The file path `{file_path}` is not a valid spreadsheet path.")
+
+        return AsyncMerger(Path(self.original), [Path(file_path) for file_path in self.new],
+                           self.key or Config.get(ConfigProperty.COLUMN_KEY), self.out, self.engine,
+                           precedence=self.precedence, duplicate_keys=self.duplicates,
+                           key_normalization=key_normalization, compression_level=self.compression_level,
+                           sheets=[SheetMapping.parse(sheet) for sheet in self.sheets] if self.sheets else None,
+                           checkpoint_min_rows=self.checkpoint)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    """Waiting for an earlier job that merges into the same file, or for a free merge process"""
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class _Job:
+    def __init__(self, definition: MergeJob, merge: AsyncMerger):
+        self.id = uuid.uuid4().hex
+        self.definition = definition
+        self.merge = merge
+        self.status = JobStatus.QUEUED
+        self.message: Optional[MergeMessage] = None
+        """Latest progress of the merge"""
+        self.error: Optional[str] = None
+        self.submitted = datetime.now()
+        self.started: Optional[datetime] = None
+        self.finished: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.finished is not None
+
+    def to_dict(self) -> dict:
+        job_dict = {
+            "id": self.id,
+            "status": self.status.value,
+            "original_file": str(self.merge.original_file_path),
+            "merged_file": str(self.merge.merged_file_path),
+            "submitted": self.submitted.isoformat(timespec="seconds"),
+            "started": self.started.isoformat(timespec="seconds") if self.started else None,
+            "finished": self.finished.isoformat(timespec="seconds") if self.finished else None,
+        }
+        if self.message is not None:
+            job_dict["progress"] = {"status": self.message.status.name.lower(), "value": self.message.progress,
+                                    "max": self.merge.max_progress}
+        if self.status == JobStatus.SUCCEEDED:
+            job_dict["result"] = self.merge.result._asdict()
+            job_dict["sheets"] = {title: result._asdict() for title, result in self.merge.sheet_results.items()}
+        if self.error is not None:
+            job_dict["error"] = self.error
+        return job_dict
+
+
+class _Worker:
+    """Single merge process of the pool, along with the files of the workbooks it keeps in memory"""
+
+    def __init__(self, cached_workbooks: int):
+        self.cached_workbooks = cached_workbooks
+        self.recent_files: Deque[Path] = deque(maxlen=cached_workbooks)
+        self.executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(1, initializer=_workbook_cache.enable, initargs=(self.cached_workbooks,))
+
+    def restart(self):
+        """Replace a merge process that has exited unexpectedly, along with the workbooks it kept"""
+        self.executor.shutdown(wait=False)
+        self.recent_files.clear()
+        self.executor = self._start()
+
+
+class MergeDaemon:
+    def __init__(self, workers: int, cached_workbooks: int):
+        """
+        Args:
+            workers (int): Amount of merge processes, which is the amount of jobs that run at once.
+            cached_workbooks (int): Amount of recently saved workbooks that each merge process keeps in memory.
+        """
+        self._workers = [_Worker(cached_workbooks) for _ in range(workers)]
+        self._idle_workers = list(self._workers)
+        self._worker_idle = asyncio.Condition()
+        # Each job holds the lock of its merged file while it waits and runs, so a lock is dropped once no job uses it
+        self._file_locks: "weakref.WeakValueDictionary[Path, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self.jobs: Dict[str, _Job] = {}
+        """Jobs by their ID, in the order they were submitted"""
+
+    async def submit(self, job: MergeJob) -> _Job:
+        """Validate and queue a merge job, which raises a `MergeException` if the job is invalid"""
+        merge = await asyncio.get_running_loop().run_in_executor(None, job.create_merger)
+        # Validates the column key. The files are probed again once the job starts, since earlier jobs may change them.
+        await merge.probe()
+        queued_job = _Job(job, merge)
+        self.jobs[queued_job.id] = queued_job
+        queued_job.task = asyncio.create_task(self._run(queued_job))
+        LOG.info(f"Queued job {queued_job.id}, merging into `{merge.merged_file_path}`.")
+        return queued_job
+
+    def cancel(self, job: _Job):
+        job.task.cancel()
+
+    async def _run(self, job: _Job):
+        file_lock = self._file_locks.setdefault(job.merge.merged_file_path, asyncio.Lock())
+        try:
+            async with file_lock:
+                worker = await self._acquire_worker(job.merge.original_file_path)
+                try:
+                    job.status = JobStatus.RUNNING
+                    job.started = datetime.now()
+                    merge = job.merge
+                    merge.executor = worker.executor
+                    tracking = asyncio.create_task(self._track_progress(job))
+                    await merge.merge()
+                    await tracking
+                    # Only fully loaded workbooks are kept by the merge process
+                    if merge.engine == MergeEngine.FULL:
+                        if merge.merged_file_path in worker.recent_files:
+                            worker.recent_files.remove(merge.merged_file_path)
+                        worker.recent_files.append(merge.merged_file_path)
+                except BrokenProcessPool:
+                    worker.restart()
+                    raise
+                finally:
+                    await self._release_worker(worker)
+            job.status = JobStatus.SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+        except MergeException as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        except Exception as e:
+            LOG.error(f"Job {job.id} failed unexpectedly", exc_info=True)
+            job.status = JobStatus.FAILED
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished = datetime.now()
+            LOG.info(f"Job {job.id} {job.status.value}.")
+            self._forget_finished_jobs()
+
+    async def _track_progress(self, job: _Job):
+        async for message in job.merge.progress():
+            job.message = message
+
+    async def _acquire_worker(self, original_file_path: Path) -> _Worker:
+        """Wait for an idle merge process, preferring one that keeps the workbook of the original spreadsheet"""
+        async with self._worker_idle:
+            await self._worker_idle.wait_for(lambda: self._idle_workers)
+            worker = next((worker for worker in self._idle_workers if original_file_path in worker.recent_files),
+                          self._idle_workers[0])
+            self._idle_workers.remove(worker)
+            return worker
+
+    async def _release_worker(self, worker: _Worker):
+        async with self._worker_idle:
+            self._idle_workers.append(worker)
+            self._worker_idle.notify()
+
+    def _forget_finished_jobs(self):
+        finished_ids = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished_ids[:max(len(finished_ids) - _FINISHED_JOB_LIMIT, 0)]:
+            del self.jobs[job_id]
+
+    def close(self):
+        for worker in self._workers:
+            worker.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer a single HTTP request, and close its connection"""
+        try:
+            method, path, body = await asyncio.wait_for(self._read_request(reader), _REQUEST_TIMEOUT_SECONDS)
+            status, response = await self._respond(method, path, body)
+        except asyncio.TimeoutError:
+            status, response = HTTPStatus.REQUEST_TIMEOUT, {"error": "The request was not received in time."}
+        except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            status, response = HTTPStatus.BAD_REQUEST, {"error": "The request is not a valid HTTP request."}
+
+        payload = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        content_length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                content_length = int(value)
+        if not 0 <= content_length <= _MAX_REQUEST_BYTES:
+            raise ValueError(f"Invalid content length {content_length}")
+
+        body = await reader.readexactly(content_length) if content_length else b""
+        return method.upper(), urlsplit(target).path.rstrip("/"), body
+
+    async def _respond(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, dict]:
+        if path == "/jobs":
+            if method == "GET":
+                return HTTPStatus.OK, {"jobs": [job.to_dict() for job in self.jobs.values()]}
+            elif method == "POST":
+                try:
+                    job = await self.submit(MergeJob.from_dict(json.loads(body)))
+                except json.JSONDecodeError:
+                    return HTTPStatus.BAD_REQUEST, {"error": "A merge job has to be a JSON object."}
+                except (MergeException, ValueError, TypeError, OSError) as e:
+                    return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+                return HTTPStatus.ACCEPTED, job.to_dict()
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} is not supported for {path}."}
+
+        job_prefix, _, job_id = path.rpartition("/")
+        job = self.jobs.get(job_id) if job_prefix == "/jobs" else None
+        if job is None:
+            return HTTPStatus.NOT_FOUND, {"error": f"There is no job at {path}."}
+        if method == "GET":
+            return HTTPStatus.OK, job.to_dict()
+        elif method == "DELETE":
+            if job.is_finished:
+                return HTTPStatus.CONFLICT, {"error": "The job has already finished."}
+            self.cancel(job)
+            return HTTPStatus.ACCEPTED, job.to_dict()
+        return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} is not supported for {path}."}
+
+
+async def serve(host: str, port: int, workers: int, cached_workbooks: int):
+    """
+    Run the merge daemon until it is stopped.
+
+    Args:
+        host (str): Address to listen on, where `127.0.0.1` only takes jobs from the local machine.
+        port (int): Port to listen on.
+        workers (int): Amount of merge processes, which is the amount of jobs that run at once.
+        cached_workbooks (int): Amount of recently saved workbooks that each merge process keeps in memory.
+    """
+    daemon = MergeDaemon(workers, cached_workbooks)
+    server = await asyncio.start_server(daemon.handle_connection, host, port)
+    LOG.info(f"Taking merge jobs on http://{host}:{port}/jobs with {workers} merge processes.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        daemon.close()
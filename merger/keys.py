@@ -0,0 +1,139 @@
+"""
+Normalization of the keys that rows are matched by. Keys are normalized once for each row when the sheets are indexed,
+so that matching rows only ever compares the normalized keys.
+"""
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, List, Optional, Sequence
+
+from merger._config import Config, ConfigProperty
+
+
+class KeyCoercion(str, Enum):
+    NONE = "none"
+    """Keys only match if they have the same type"""
+    NUMBER = "number"
+    """Text that is a number is matched as that number, so that `"0061234"` matches `61234`"""
+    TEXT = "text"
+    """Numbers are matched as their text, so that `61234` matches `"61234"`"""
+
+
+class DuplicateKeyPolicy(str, Enum):
+    FIRST = "first"
+    """Merge into the first row of the original spreadsheet with a duplicated key"""
+    LAST = "last"
+    """Merge into the last row of the original spreadsheet with a duplicated key"""
+    ALL = "all"
+    """Merge into every row of the original spreadsheet with a duplicated key"""
+    ERROR = "error"
+    """Refuse to merge if a key is used by more than one row of the original spreadsheet"""
+
+
+@dataclass(frozen=True)
+class KeyNormalization:
+    strip: bool = False
+    """Ignore any whitespace around text keys"""
+    casefold: bool = False
+    """Ignore the case of text keys"""
+    coercion: KeyCoercion = KeyCoercion.NONE
+    """How numbers and text are matched against each other"""
+
+    @classmethod
+    def from_config(cls) -> "KeyNormalization":
+        return cls(Config.get(ConfigProperty.KEY_STRIP), Config.get(ConfigProperty.KEY_CASEFOLD),
+                   KeyCoercion(Config.get(ConfigProperty.KEY_COERCION)))
+
+    def normalizer(self) -> Optional[Callable[[Any], Any]]:
+        """Create a function that normalizes a single key value, or `None` if keys are used as they are"""
+        steps = []
+        if self.strip:
+            steps.append(_strip)
+        if self.coercion == KeyCoercion.NUMBER:
+            steps.append(_to_number)
+        elif self.coercion == KeyCoercion.TEXT:
+            steps.append(_to_text)
+        if self.casefold:
+            steps.append(_casefold)
+
+        if not steps:
+            return None
+        elif len(steps) == 1:
+            return steps[0]
+
+        def normalize(key):
+            for step in steps:
+                key = step(key)
+            return key
+
+        return normalize
+
+
+def _strip(key):
+    if isinstance(key, str):
+        # Keys that are only whitespace are as good as blank
+        return key.strip() or None
+    return key
+
+
+def _casefold(key):
+    return key.casefold() if isinstance(key, str) else key
+
+
+def _integral(number):
+    """Whole floats are matched as integers, since spreadsheets don't tell them apart"""
+    if isinstance(number, float) and number.is_integer():
+        return int(number)
+    return number
+
+
+def _to_number(key):
+    if isinstance(key, str):
+        try:
+            return int(key)
+        except ValueError:
+            try:
+                return _integral(float(key))
+            except ValueError:
+                return key
+    elif isinstance(key, float):
+        return _integral(key)
+
+    return key
+
+
+def _to_text(key):
+    if isinstance(key, (int, float)) and not isinstance(key, bool):
+        return str(_integral(key))
+    return key
+
+
+class KeyBuilder:
+    """Builds the normalized keys of rows, from the values of their key columns"""
+
+    def __init__(self, normalization: KeyNormalization, key_column_count: int = 1):
+        """
+        Args:
+            normalization (KeyNormalization): How the values of the key columns are normalized.
+            key_column_count (int): Amount of key columns. Keys of several columns are tuples of their values.
+        """
+        self._normalize = normalization.normalizer()
+        self._composite = key_column_count > 1
+
+    def row_key(self, key_values: Sequence) -> Any:
+        """Key of a single row, from the values of its key columns"""
+        normalize = self._normalize
+        if not self._composite:
+            return key_values[0] if normalize is None else normalize(key_values[0])
+
+        key = tuple(key_values) if normalize is None else tuple(normalize(value) for value in key_values)
+        # Rows without a value in any of their key columns have no key at all
+        return None if all(value is None for value in key) else key
+
+    def column_keys(self, key_columns: Sequence[list]) -> List:
+        """Keys of each row, from the values of each key column"""
+        if not self._composite:
+            if self._normalize is None:
+                return key_columns[0]
+            return [self._normalize(value) for value in key_columns[0]]
+
+        return [self.row_key(key_values) for key_values in zip(*key_columns)]
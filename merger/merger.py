@@ -1,34 +1,196 @@
+import cProfile
+import logging
+import os
+import sqlite3
+from concurrent.futures import Future
 from copy import copy
 from datetime import datetime
+from enum import Enum
 from pathlib import Path
-from typing import Optional, NamedTuple, Tuple
+from operator import itemgetter
+from typing import Optional, NamedTuple, Tuple, List, Union, Callable, Sequence, Dict, Any, Iterable, Iterator
 
 import openpyxl as pyxl
-import openpyxl.writer.excel
 from openpyxl import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from openpyxl.cell.cell import Cell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
 
+from merger import _streaming, _delimited, _saving, _workbook_cache
+from merger._checkpoint import MergeCheckpoint, input_fingerprint
+from merger._columns import ColumnReader
+from merger._table import ColumnTable, MergePlan, RowChanges
+from merger._probe import probe_sheet, sheet_names, SheetProbe
+from merger._key_index import KeyIndexBuilder, KeyIndexEntry, index_path, read_key_index, write_key_index
 from merger._config import ConfigProperty, Config
+from merger.changes import CellChange, ChangeSet, MergeResult
+from merger.keys import DuplicateKeyPolicy, KeyBuilder, KeyNormalization
+from merger.metrics import MergeMetrics
+from merger.sheets import FIRST_SHEET, SheetMapping, SheetReference, resolve_sheet
 from merger.exceptions import MergeException
 
+LOG = logging.getLogger(__name__)
+
+
+class MergeEngine(str, Enum):
+    FULL = "full"
+    """Load the original workbook completely into memory, and update it in place"""
+    STREAMING = "streaming"
+    """Read the original workbook row by row, and write the merged workbook in a single pass"""
+    AUTO = "auto"
+    """Use the streaming engine if the spreadsheet files are larger than the configured threshold"""
+
+
+class MergePrecedence(str, Enum):
+    LAST_WINS = "last"
+    """Merge the appending spreadsheets in the given order, so later spreadsheets overwrite earlier ones"""
+    FIRST_WINS = "first"
+    """Merge the appending spreadsheets in reverse order, so earlier spreadsheets overwrite later ones"""
+    NEWEST_WINS = "mtime"
+    """Merge the appending spreadsheets from the least to the most recently modified file"""
+
+
+_MERGED_FILE_EXTENSIONS = {".xlsx", ".xlsm", *_delimited.DELIMITERS}
+"""Extensions of the spreadsheet formats that merged files can be saved as"""
+
+
+def _items_getter(indices: Tuple[int, ...]) -> Callable[[Sequence], tuple]:
+    """Create a function that extracts the items at the given indices from a sequence, always as a tuple"""
+    if len(indices) == 0:
+        return lambda sequence: ()
+    elif len(indices) == 1:
+        index = indices[0]
+        return lambda sequence: (sequence[index],)
+
+    return itemgetter(*indices)
+
+
+def _fold_label(label) -> str:
+    """Form of a column label that is used to compare labels regardless of their case"""
+    return str(label).casefold()
+
+
+def _insert_rows(sheet: Worksheet, row_number: int, amount: int = 1):
+    """Insert empty rows into a loaded sheet, moving the dimensions of the rows below down along with the rows"""
+    sheet.insert_rows(row_number, amount)
+
+    # Sheets only move the cells of the rows, so rows would otherwise take on the heights of the rows above them
+    row_dimensions = sheet.row_dimensions
+    for index in sorted((index for index in row_dimensions if index >= row_number), reverse=True):
+        dimension = row_dimensions.pop(index)
+        dimension.index = index + amount
+        row_dimensions[index + amount] = dimension
+
 
 class Merger:
 
-    def __init__(self, original_file_path: Path, new_file_path: Path, column_key: str,
-                 merged_file_name: Optional[str] = None):
+    def __init__(self, original_file_path: Path, new_file_path: Union[Path, Sequence[Path]],
+                 column_key: Union[str, Sequence[str]], merged_file_name: Optional[str] = None,
+                 engine: Union[MergeEngine, str] = MergeEngine.AUTO,
+                 use_key_index: Optional[bool] = None,
+                 precedence: Union[MergePrecedence, str] = MergePrecedence.LAST_WINS,
+                 parse_workers: Optional[int] = None,
+                 duplicate_keys: Union[DuplicateKeyPolicy, str, None] = None,
+                 key_normalization: Optional[KeyNormalization] = None, dry_run: bool = False,
+                 compression_level: Optional[int] = None, profile_path: Optional[Path] = None,
+                 sheets: Optional[Sequence[Union[SheetMapping, SheetReference, tuple]]] = None,
+                 checkpoint_min_rows: Optional[int] = None):
         """
         Given two spreadsheet files, and a column name that is used to identify each row, merge the two spreadsheet
         files together. If there are any rows that are shared between both spreadsheets, the new the original
         spreadsheet's cells will be updated based on the information contained in the new spreadsheet. If there are
         rows in the new spreadsheet that do not exist in the original, they will also be added to the original sheet.
         Then, these merged sheet is either saved/overwritten to the original file, or is saved to a different file.
+
+        Several new spreadsheet files can be merged at once. The original spreadsheet is then only loaded, indexed and
+        saved once, and the new spreadsheets are merged into it one after another, in the order given by `precedence`.
+        A row that is added by one new spreadsheet is updated by the following ones, just like merging each of them
+        separately would.
+
+        The `engine` determines how the original spreadsheet is loaded. The full engine keeps every cell of the original
+        workbook in memory, while the streaming engine only keeps its key column. Of the new spreadsheets, only the
+        merged columns are kept in either case. By default, the streaming engine is only used when the combined size of
+        all files exceeds `ConfigProperty.STREAMING_THRESHOLD_MB`.
+
+        If `use_key_index` is enabled, the rows of the original spreadsheet's keys are read from a `.merge-index` file
+        next to it, as long as that index is still valid for the file. The index of the merged spreadsheet is written
+        after each merge, so merging into the same spreadsheet again can skip indexing it. Defaults to
+        `ConfigProperty.USE_KEY_INDEX`.
+
+        With `parse_workers`, the merged columns of the new spreadsheets are read by that many worker processes while
+        the original spreadsheet is loaded, along with the key column of the original spreadsheet for the streaming
+        engine. Defaults to `ConfigProperty.PARSE_WORKERS`, where 0 reads every spreadsheet within the current process.
+
+        The `duplicate_keys` policy determines which rows of the original spreadsheet are updated when several of its
+        rows have the same key. Rows without a key are never updated. Defaults to `ConfigProperty.DUPLICATE_KEY_POLICY`.
+
+        Rows can also be identified by several columns at once, by giving a sequence of column labels as `column_key`.
+        Keys are compared after `key_normalization`, which defaults to the `ConfigProperty.KEY_STRIP`,
+        `ConfigProperty.KEY_CASEFOLD` and `ConfigProperty.KEY_COERCION` settings. Cells are always written with their
+        original values.
+
+        With `dry_run`, merging only determines what would change in the original spreadsheet, and stores it as the
+        `change_set`. The original workbook is never loaded, only its key columns and the merged columns are read, and
+        nothing is written.
+
+        The merged file is written to a temporary file first, which only replaces the target file once it is complete.
+        Its `compression_level` ranges from 0 to 9, where lower levels save faster but make larger files. Defaults to
+        `ConfigProperty.COMPRESSION_LEVEL`.
+
+        The wall time, CPU time and peak memory of each phase of loading and merging are recorded in `metrics`, along
+        with samples of the time each row takes to merge every `ConfigProperty.ROW_SAMPLE_INTERVAL` rows. If a
+        `profile_path` is given, or the `MERGER_PROFILE` environment variable is set, the metrics are written to it once
+        the merge has finished when it is a `.json` file. Any other file receives the `cProfile` statistics of loading
+        and merging instead.
+
+        Only the first sheet of each spreadsheet is merged, unless other `sheets` are given. Each of them maps a sheet
+        of the original spreadsheet to the sheet of the new spreadsheets that is merged into it, by the name or the
+        index of either sheet, where a single name or index selects the same sheet in every spreadsheet. All sheets are
+        merged within a single load and save of the original spreadsheet, and the other sheets are kept as they are.
+        With `parse_workers`, the columns of every pair of sheets are read by the worker processes at the same time,
+        while each sheet is indexed and matched within the current process.
+
+        With `checkpoint_min_rows`, the matched rows of every sheet are stored in a `.merge-checkpoint` file next to
+        the merged file before any of them is merged, as long as at least `checkpoint_min_rows` rows are merged. If the
+        merge fails or is stopped, merging the same spreadsheet files with the same settings again continues from the
+        checkpoint, without reading the new spreadsheets or indexing the original spreadsheet. The checkpoint is
+        removed once the merge has finished. Defaults to `ConfigProperty.CHECKPOINT_MIN_ROWS`, where 0 writes no
+        checkpoint.
         """
+        self._init_settings(original_file_path, new_file_path, column_key, merged_file_name, engine, use_key_index,
+                            precedence, parse_workers, duplicate_keys, key_normalization, dry_run, compression_level,
+                            profile_path, sheets, checkpoint_min_rows)
+        self._run_phase("load", self._load)
+
+    def _init_settings(self, original_file_path: Path, new_file_path: Union[Path, Sequence[Path]],
+                       column_key: Union[str, Sequence[str]], merged_file_name: Optional[str],
+                       engine: Union[MergeEngine, str], use_key_index: Optional[bool],
+                       precedence: Union[MergePrecedence, str], parse_workers: Optional[int],
+                       duplicate_keys: Union[DuplicateKeyPolicy, str, None],
+                       key_normalization: Optional[KeyNormalization], dry_run: bool = False,
+                       compression_level: Optional[int] = None, profile_path: Optional[Path] = None,
+                       sheets: Optional[Sequence[Union[SheetMapping, SheetReference, tuple]]] = None,
+                       checkpoint_min_rows: Optional[int] = None):
+        """Validate and store the merge settings, without opening any of the spreadsheet files"""
         self.original_file_path = original_file_path.resolve()
-        self.new_file_path = new_file_path.resolve()
-        self.column_key = column_key
+        new_file_paths = [new_file_path] if isinstance(new_file_path, Path) else list(new_file_path)
+        self.new_file_paths: List[Path] = self._order_new_files([path.resolve() for path in new_file_paths],
+                                                                MergePrecedence(precedence))
+        """New spreadsheet files, in the order they are merged"""
+        self.key_columns: Tuple[str, ...] = (column_key,) if isinstance(column_key, str) else tuple(column_key)
+        """Labels of the columns that identify each row"""
+        if not self.key_columns:
+            raise MergeException("At least one key column has to be given.")
+        # Header rows are located by the first key column
+        self.column_key = self.key_columns[0]
+        self.key_normalization = key_normalization if key_normalization is not None else KeyNormalization.from_config()
+        self._key_builder = KeyBuilder(self.key_normalization, len(self.key_columns))
 
-        if self.new_file_path == self.original_file_path:
+        if not self.new_file_paths:
+            raise MergeException("At least one spreadsheet file has to be merged.")
+        if self.original_file_path in self.new_file_paths:
             raise MergeException("Spreadsheet file paths cannot be identical.")
 
         # If the merged file name is blank, assume that the main file will be used instead
@@ -36,171 +198,1021 @@ class Merger:
             self.merged_file_path = self.original_file_path
         else:
             merged_file_dir = self.original_file_path.parent
-            merged_file_ext = self.original_file_path.suffix
+            # A merged file name with a spreadsheet extension selects the format of the merged file
+            merged_file_ext = "" if Path(merged_file_name).suffix.lower() in _MERGED_FILE_EXTENSIONS \
+                else self.original_file_path.suffix
             self.merged_file_path = merged_file_dir.joinpath(f"{merged_file_name}{merged_file_ext}").resolve()
 
-        self._original_wb: Workbook = pyxl.load_workbook(self.original_file_path)
-        self._original_wb.active = 0
-        self._original_sheet: Worksheet = self._original_wb.active
-        self._original_max_row: int = self._original_sheet.max_row
-
-        self._new_wb: Workbook = pyxl.load_workbook(self.new_file_path)
-        self._new_wb.active = 0
-        self._new_sheet: Worksheet = self._new_wb.active
-        self._new_max_row: int = self._new_sheet.max_row
-
-        # Close workbooks, the files no longer need to stay open
-        self._clean_stop()
-
-        # Locate header rows
-        self.original_header_row = self._locate_header_row(self._original_sheet)
-        self._original_first_data_row = self.original_header_row + 1
-        self.new_header_row = self._locate_header_row(self._new_sheet)
-        self._new_first_data_row = self.new_header_row + 1
-        if not (self.original_header_row and self.new_header_row):
-            raise MergeException(f"The key '{self.column_key}' is not a column label in either of the spreadsheets.")
-        elif not self.original_header_row:
-            raise MergeException(f"The key '{self.column_key}' is not a column label in `{self.original_file_path}`.")
-        elif not self.new_header_row:
-            raise MergeException(f"The key '{self.column_key}' is not a column label in `{self.new_file_path}`.")
+        self.sheets: List[SheetMapping] = [SheetMapping(*sheet) if isinstance(sheet, tuple) else SheetMapping(sheet)
+                                           for sheet in sheets] if sheets else [FIRST_SHEET]
+        """Sheets of the original spreadsheet that are merged into, each along with the sheet of the new spreadsheets"""
+        if len(self.sheets) > 1 and (_delimited.is_delimited(self.original_file_path)
+                                     or _delimited.is_delimited(self.merged_file_path)):
+            raise MergeException("CSV and TSV spreadsheets only have a single sheet to merge.")
 
-        # Locate column label positions
-        self._label_indices = self._locate_labels()
+        self.engine = self._resolve_engine(MergeEngine(engine))
+        self.use_key_index = use_key_index if use_key_index is not None else Config.get(ConfigProperty.USE_KEY_INDEX)
+        self.parse_workers = parse_workers if parse_workers is not None else Config.get(ConfigProperty.PARSE_WORKERS)
+        self.duplicate_keys = DuplicateKeyPolicy(duplicate_keys if duplicate_keys is not None
+                                                 else Config.get(ConfigProperty.DUPLICATE_KEY_POLICY))
 
-        # Locate first row of data to use for formatting later
-        self._format_row: Tuple[Cell] = next(self._original_sheet.iter_rows(min_row=self._original_first_data_row,
-                                                                            max_row=self._original_first_data_row))
+        self.dry_run = dry_run
+        self.compression_level = compression_level if compression_level is not None \
+            else Config.get(ConfigProperty.COMPRESSION_LEVEL)
+        if not 0 <= self.compression_level <= 9:
+            raise MergeException(f"The compression level has to be between 0 and 9, not {self.compression_level}.")
+        self.change_set: Optional[ChangeSet] = None
+        """Changes of the last dry-run merge"""
+        self.result: Optional[MergeResult] = None
+        """Outcome of the last merge"""
+        self.metrics = MergeMetrics(Config.get(ConfigProperty.ROW_SAMPLE_INTERVAL))
+        """Timings and memory usage of each phase of loading and merging"""
+        if profile_path is None and os.environ.get("MERGER_PROFILE"):
+            profile_path = Path(os.environ["MERGER_PROFILE"])
+        self.profile_path: Optional[Path] = profile_path
+        # Created once loading starts, since profilers can not be passed to a merge process
+        self._profiler: Optional[cProfile.Profile] = None
 
-    def merge(self):
-        try:
-            self._hook_initialization()
-            key_col_indices = self._label_indices[self.column_key]
+        self.sheet_results: Dict[str, MergeResult] = {}
+        """Outcome of the last merge for each sheet it merged into, by the title of the sheet"""
+
+        self.checkpoint_min_rows = checkpoint_min_rows if checkpoint_min_rows is not None \
+            else Config.get(ConfigProperty.CHECKPOINT_MIN_ROWS)
+        if self.checkpoint_min_rows < 0:
+            raise MergeException(f"The minimum rows of a checkpoint can not be negative, not "
+                                 f"{self.checkpoint_min_rows}.")
+        # Opened once loading starts, since database connections can not be passed to a merge process
+        self._checkpoint: Optional[MergeCheckpoint] = None
+        self._resumed_plans: Optional[List[MergePlan]] = None
+
+        self._original_wb: Optional[Workbook] = None
+        self._main_sheets: List[Merger._MainSheet] = []
+        self._column_reader: Optional[ColumnReader] = None
+
+    def _load(self):
+        """
+        Load the original workbook, read the merged columns of the new spreadsheets, and locate the column labels of
+        their sheets
+        """
+        read_only = self.engine == MergeEngine.STREAMING
+        original_delimited = _delimited.is_delimited(self.original_file_path)
+
+        # Locate header rows and column labels before any workbook is parsed, so that an invalid key fails right away
+        with self.metrics.phase("header_detection"):
+            self._probe_files()
+
+        # Locate column label positions
+        with self.metrics.phase("label_mapping"):
+            for main_sheet in self._main_sheets:
+                for appending in main_sheet.appending_sheets:
+                    appending.label_indices = self._locate_labels(main_sheet, appending)
+                    appending.key_label_indices = self._locate_key_labels(main_sheet, appending)
+                    appending.copy_plan = self._compile_copy_plan(appending.label_indices)
+                # The key columns are at the same positions for every appending sheet, since they're columns of the
+                # main sheet
+                main_sheet.key_main_indices = tuple(index.main_label_index
+                                                    for index in main_sheet.appending_sheets[0].key_label_indices)
+                main_sheet.get_key_values = _items_getter(main_sheet.key_main_indices)
 
-            key_rows = self._map_main_keys(key_col_indices)
+        if self.checkpoint_min_rows > 0 and not self.dry_run:
+            self._open_checkpoint()
 
-            # Find all rows in the main sheet based on the current key value in the new sheet
-            new_rows = self._new_sheet.iter_rows(min_row=self._new_first_data_row, max_row=self._new_max_row)
-            for new_key_row_index, new_key_row in enumerate(new_rows):
-                new_key_val = new_key_row[key_col_indices.new_label_index].value
+        if self._uses_key_index() and self._resumed_plans is None:
+            first_sheet = self._main_sheets[0]
+            first_sheet.stored_key_index = read_key_index(self.original_file_path, self._key_signature(),
+                                                          first_sheet.header_row)
 
-                # If a row wasn't found for this key in the main sheet, it must be new and inserted into the sheet
-                if new_key_val not in key_rows:
-                    self._original_sheet.insert_rows(self._original_first_data_row)
-                    main_key_row = next(self._original_sheet.iter_rows(min_row=self._original_first_data_row,
-                                                                       max_row=self._original_first_data_row))
+        # Only the key column and the merged columns of the new sheets are read. With worker processes, they are read
+        # while the original workbook is being loaded, and the columns of every pair of sheets are read at once.
+        self._column_reader = ColumnReader(self.parse_workers)
+        appending_futures = []
+        # A resumed merge already knows which rows are merged, so it reads none of the columns
+        for main_sheet in self._main_sheets if self._resumed_plans is None else ():
+            for appending in main_sheet.appending_sheets:
+                new_key_indices = tuple(index.new_label_index for index in appending.key_label_indices)
+                appending_futures.append((appending, self._column_reader.submit(
+                    appending.file_path, appending.first_data_row, (*new_key_indices, *appending.copy_plan.new_indices),
+                    appending.sheet_index)))
 
-                    self._update_row_formatting(main_key_row)
+            # The streaming engine indexes the main sheet by reading its key column, which a worker can do just as
+            # well. A delimited main sheet is never loaded as a workbook, so its key column is always read this way.
+            # Dry runs read the merged columns of the main sheet along with its key columns, to compare them.
+            if self.dry_run:
+                main_sheet.dry_run_main_indices = tuple(sorted({main_index
+                                                                for appending in main_sheet.appending_sheets
+                                                                for main_index in appending.copy_plan.main_indices}))
+                main_sheet.main_keys_future = self._column_reader.submit(
+                    self.original_file_path, main_sheet.first_data_row,
+                    (*main_sheet.key_main_indices, *main_sheet.dry_run_main_indices), main_sheet.index)
+            elif read_only and (self.parse_workers > 0 or original_delimited) and main_sheet.stored_key_index is None:
+                main_sheet.main_keys_future = self._column_reader.submit(
+                    self.original_file_path, main_sheet.first_data_row, main_sheet.key_main_indices, main_sheet.index)
+        self._column_reader.close()
+
+        if original_delimited or self.dry_run:
+            self._original_wb = None
+        else:
+            # Read-only workbooks read their file on demand, so only fully loaded workbooks are ever kept in memory
+            cache = _workbook_cache.process_cache()
+            cached_wb = cache.take(self.original_file_path) if cache is not None and not read_only else None
+            self._original_wb: Workbook = cached_wb if cached_wb is not None \
+                else pyxl.load_workbook(self.original_file_path, read_only=read_only)
+            self._original_wb.active = 0
+            for main_sheet in self._main_sheets:
+                main_sheet.sheet = self._original_wb.worksheets[main_sheet.index]
+                if read_only:
+                    # The dimensions a sheet states can be too small, so its rows are read until the parser runs out
+                    # of them. The probed size is only an estimate of the progress, until the main sheet is indexed.
+                    main_sheet.sheet.reset_dimensions()
                 else:
-                    main_key_row = key_rows[new_key_val]
+                    main_sheet.max_row = main_sheet.sheet.max_row
 
-                # Update all previous keys in the main sheet with new sheet data
-                self._update_row(main_key_row, new_key_row)
+        # Close the workbook, the file no longer needs to stay open.
+        # Read-only workbooks are read on demand, so they are only closed once the merge has finished.
+        if not read_only and self._original_wb is not None:
+            self._original_wb.close()
 
-                self._hook_row_merged(new_key_row_index)
+        # Keys are normalized once for each row, before any of them are matched
+        key_column_count = len(self.key_columns)
+        for appending, future in appending_futures:
+            columns = future.result()
+            appending.table = ColumnTable(self._key_builder.column_keys(columns[:key_column_count]),
+                                          columns[key_column_count:])
 
-            self._hook_pre_saving()
+        for main_sheet in self._main_sheets:
+            # Locate first row of data to use for formatting later. Delimited files have no formatting, and new rows of
+            # a sheet without any data rows keep the default style.
+            if main_sheet.sheet is not None:
+                main_sheet.format_row = next(main_sheet.sheet.iter_rows(min_row=main_sheet.first_data_row,
+                                                                        max_row=main_sheet.first_data_row), ())
 
-            self._add_timestamp()
+            # Resolve the format row's styles once, so new rows can be styled without creating any style objects.
+            # Read-only cells are styled through their style IDs by the streaming engine instead.
+            if not read_only:
+                main_sheet.format_styles = [format_cell._style for format_cell in main_sheet.format_row]
 
-            # Creates a copy
-            openpyxl.writer.excel.save_workbook(self._original_wb, str(self.merged_file_path))
+    def merge(self):
+        try:
+            self._hook_initialization()
+            self.metrics.start_row_sampling()
+
+            if self.dry_run:
+                self._run_phase("merge", self._merge_dry_run)
+            elif self.engine == MergeEngine.STREAMING:
+                self._run_phase("merge", self._merge_streaming)
+            else:
+                self._run_phase("merge", self._merge_full)
+
+            if self._checkpoint is not None:
+                self._checkpoint.remove()
             self._hook_success()
         except BaseException as e:
             self._hook_exception()
             raise e from e
         finally:
             self._clean_stop()
+            if self.profile_path is not None:
+                self._write_profile()
+
+    def _run_phase(self, phase: str, function: Callable[[], None]):
+        """Run one of the outermost phases of a merge, which are profiled if a profile is written"""
+        with self.metrics.phase(phase):
+            if self.profile_path is None or self.profile_path.suffix.lower() == ".json":
+                function()
+                return
+
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            try:
+                function()
+            finally:
+                self._profiler.disable()
+
+    def _write_profile(self):
+        try:
+            if self._profiler is not None:
+                self._profiler.dump_stats(self.profile_path)
+            else:
+                self.metrics.write(self.profile_path)
+        except OSError as e:
+            LOG.warning(f"The profile could not be written to {self.profile_path}: {e}")
+
+    def _merge_full(self):
+        # Every sheet is matched before any of them is changed
+        plans = self._plan_merges()
+
+        merged_row_count = 0
+        sheet_results: Dict[str, MergeResult] = {}
+        for main_sheet, plan in zip(self._main_sheets, plans):
+            sheet_results[main_sheet.title], merged_row_count = self._merge_sheet_full(main_sheet, plan,
+                                                                                       merged_row_count)
+
+        self._hook_pre_saving()
+
+        saved = self._needs_saving(sheet_results)
+        if saved:
+            with self.metrics.phase("timestamp"):
+                for main_sheet in self._main_sheets:
+                    self._add_timestamp(main_sheet)
+
+            with self.metrics.phase("save"):
+                # Creates a copy
+                _saving.save_workbook(self._original_wb, self.merged_file_path, self.compression_level)
+
+                if self._uses_key_index():
+                    first_sheet = self._main_sheets[0]
+                    merged_rows = first_sheet.sheet.iter_rows(min_row=self._merged_header_row(first_sheet) + 1,
+                                                              values_only=True)
+                    key_index = KeyIndexBuilder()
+                    for position, values in enumerate(merged_rows):
+                        key_index.add(self._main_key_of(first_sheet, values), position, values)
+                    self._write_key_index(key_index)
+
+        # The workbook matches the merged file either way, since nothing is saved only if nothing changed
+        cache = _workbook_cache.process_cache()
+        if cache is not None:
+            cache.keep(self.merged_file_path, self._original_wb)
+
+        self._report_results(sheet_results, saved)
+
+    def _merge_sheet_full(self, main_sheet: "Merger._MainSheet", plan: MergePlan,
+                          merged_row_count: int) -> Tuple[MergeResult, int]:
+        """
+        Apply the merge plan of a main sheet to its loaded sheet.
+
+        Returns:
+            The outcome for the sheet, which is not saved yet, along with the amount of rows merged so far.
+        """
+        # All new rows are inserted with a single shift. They fill the inserted block from the bottom up, so the last
+        # new row ends up at the top.
+        inserted_rows = self._insert_new_rows(main_sheet, len(plan.inserted))
+        inserted_rows.reverse()
+
+        # Formatted in a single run of the phase, since timing every row would cost more than formatting it
+        with self.metrics.phase("formatting"):
+            for inserted_row in inserted_rows:
+                self._update_row_formatting(inserted_row, main_sheet.format_styles)
+
+        for inserted_row, changes in zip(inserted_rows, plan.inserted):
+            self._apply_changes(main_sheet, inserted_row, changes)
+
+            merged_row_count += changes.merged_count
+            self._row_merged(merged_row_count)
+
+        # Computed once, since the sheet recounts its dimensions from all of its cells on every access
+        max_column = main_sheet.sheet.max_column
+        # Rows of the main sheet have been moved down by the inserted rows
+        first_data_row = main_sheet.first_data_row + len(inserted_rows)
+        updated_row_count = 0
+        for main_key_position, changes in plan.updates.items():
+            main_row_number = first_data_row + main_key_position
+            main_key_row = next(main_sheet.sheet.iter_rows(min_row=main_row_number, max_row=main_row_number,
+                                                           max_col=max_column))
+
+            # Update all previous keys in the main sheet with new sheet data
+            if self._apply_changes(main_sheet, main_key_row, changes):
+                updated_row_count += 1
+
+            merged_row_count += changes.merged_count
+            self._row_merged(merged_row_count)
+
+        return MergeResult(len(inserted_rows), updated_row_count, len(plan.updates) - updated_row_count,
+                           saved=False), merged_row_count
+
+    def _merge_streaming(self):
+        # Only the key columns of the main sheets are indexed
+        plans = self._plan_merges()
+
+        merged_delimiter = _delimited.delimiter_of(self.merged_file_path)
+        merged_wb = None
+        merged_sheets: List[WriteOnlyWorksheet] = []
+        if merged_delimiter is None:
+            merged_wb = Workbook(write_only=True)
+            if self._original_wb is not None:
+                _streaming.share_styles(self._original_wb, merged_wb)
+                # Sheets keep their order. The sheets that are not merged are only copied once it's clear that the
+                # merged file is saved.
+                merged_sheets = [merged_wb.create_sheet(sheet.title) for sheet in self._original_wb.worksheets]
+            else:
+                merged_sheets = [merged_wb.create_sheet(self.original_file_path.stem)]
+
+        # The key index of the merged sheet is collected while its rows are written
+        key_index = KeyIndexBuilder() if self._uses_key_index() else None
+        merged_row_count = 0
+        sheet_results: Dict[str, MergeResult] = {}
+        writers = []
+        try:
+            for main_sheet, plan in zip(self._main_sheets, plans):
+                if merged_delimiter is not None:
+                    # Delimited files have no cells outside of their rows, so the merged file gets no timestamp
+                    writer = _delimited.DelimitedRowWriter(merged_delimiter)
+                else:
+                    merged_sheet = merged_sheets[main_sheet.index]
+                    if main_sheet.sheet is not None:
+                        _streaming.copy_sheet_layout(main_sheet.sheet, merged_sheet)
+
+                    timestamp_row, timestamp_col = self._timestamp_position()
+                    writer = _streaming.RowWriter(merged_sheet, (timestamp_row, timestamp_col, self._timestamp_str()))
+                    # Add a row in case the header row and timestamp cell might overlap
+                    if timestamp_row == main_sheet.header_row:
+                        writer.append([])
+                writers.append(writer)
+
+                sheet_results[main_sheet.title], merged_row_count = self._merge_sheet_streaming(
+                    main_sheet, plan, writer, key_index, merged_row_count)
+
+            self._hook_pre_saving()
+
+            # The merged rows were only written to temporary storage so far, which is discarded if nothing changed
+            saved = self._needs_saving(sheet_results)
+            if saved:
+                # The remaining sheets are copied over unchanged, as long as the merged file is a workbook as well
+                if merged_wb is not None and self._original_wb is not None:
+                    merged_indices = {main_sheet.index for main_sheet in self._main_sheets}
+                    for sheet_index, sheet in enumerate(self._original_wb.worksheets):
+                        if sheet_index not in merged_indices:
+                            _streaming.copy_sheet(sheet, merged_sheets[sheet_index])
+
+                # Every row has been read, so the original file can be closed before it might be overwritten
+                self._clean_stop()
+                with self.metrics.phase("save"):
+                    if merged_wb is not None:
+                        _saving.save_workbook(merged_wb, self.merged_file_path, self.compression_level)
+                    else:
+                        writers[0].save(self.merged_file_path)
+
+                    if key_index is not None:
+                        self._write_key_index(key_index)
+        finally:
+            # Whatever was not saved, because nothing changed or the merge failed, is discarded along with its
+            # temporary files
+            for writer in writers:
+                writer.close()
+            for merged_sheet in merged_sheets:
+                _streaming.discard_sheet(merged_sheet)
+
+        self._report_results(sheet_results, saved)
+
+    def _merge_sheet_streaming(self, main_sheet: "Merger._MainSheet", plan: MergePlan, writer,
+                               key_index: Optional[KeyIndexBuilder], merged_row_count: int) -> Tuple[MergeResult, int]:
+        """
+        Write the rows of a main sheet along with the rows merged into them.
+
+        Args:
+            main_sheet (Merger._MainSheet): Main sheet that is merged into.
+            plan (MergePlan): Merge plan of the main sheet.
+            writer (RowWriter | DelimitedRowWriter): Writer of the merged sheet.
+            key_index (Optional[KeyIndexBuilder]): Collects the keys of the merged sheet, if its index is written.
+            merged_row_count (int): Amount of rows merged by any previous sheets.
+
+        Returns:
+            The outcome for the sheet, which is not saved yet, along with the amount of rows merged so far.
+        """
+        format_style_ids = [_streaming.cell_style_id(cell) for cell in main_sheet.format_row]
+        # Rows of a delimited main sheet, or of a sheet without a format row, are as wide as its header
+        inserted_width = max(len(format_style_ids), len(main_sheet.header))
+        sheet_rows = _streaming.SheetRows(main_sheet.sheet) if main_sheet.sheet is not None else None
+        updated_row_count = 0
+        for row_number, (values, style_ids, row_dimension) in enumerate(self._original_rows(main_sheet, sheet_rows),
+                                                                        start=1):
+            if row_number > main_sheet.header_row:
+                main_key_position = row_number - main_sheet.first_data_row
+                changes = plan.updates.get(main_key_position)
+                if changes is not None:
+                    if self._apply_changes_to_values(main_sheet, values, changes):
+                        updated_row_count += 1
+
+                    merged_row_count += changes.merged_count
+                    self._row_merged(merged_row_count)
+
+                if key_index is not None:
+                    key_index.add(self._main_key_of(main_sheet, values), main_key_position + len(plan.inserted),
+                                  values)
+
+            writer.append(values, style_ids, row_dimension)
+
+            # New rows are placed directly below the header, with the last new row at the top
+            if row_number == main_sheet.header_row:
+                for position, changes in enumerate(reversed(plan.inserted)):
+                    inserted_values = [None] * inserted_width
+                    self._apply_changes_to_values(main_sheet, inserted_values, changes)
+                    # New rows only get the format row's styles, not its height, just like with the full engine
+                    writer.append(inserted_values, format_style_ids)
+
+                    if key_index is not None:
+                        key_index.add(self._main_key_of(main_sheet, inserted_values), position, inserted_values)
+
+                    merged_row_count += changes.merged_count
+                    self._row_merged(merged_row_count)
+
+        writer.finish()
+
+        # Ranges behind the rows move down along with the rows, past any row added for the timestamp and the new rows
+        if sheet_rows is not None and isinstance(writer, _streaming.RowWriter):
+            _streaming.copy_sheet_tail(sheet_rows, writer.sheet,
+                                       [(1, self._merged_header_row(main_sheet) - main_sheet.header_row),
+                                        (main_sheet.first_data_row, len(plan.inserted))])
+            writer.close_sheet()
+
+        return MergeResult(len(plan.inserted), updated_row_count, len(plan.updates) - updated_row_count,
+                           saved=False), merged_row_count
+
+    def _merge_dry_run(self):
+        plans = self._plan_merges()
+        change_set = ChangeSet()
+        merged_row_count = 0
+        sheet_results: Dict[str, MergeResult] = {}
+        for main_sheet, plan in zip(self._main_sheets, plans):
+            counts = (change_set.inserted_rows, change_set.updated_rows, change_set.unchanged_rows)
+            merged_row_count = self._collect_sheet_changes(main_sheet, plan, change_set, merged_row_count)
+            sheet_results[main_sheet.title] = MergeResult(change_set.inserted_rows - counts[0],
+                                                          change_set.updated_rows - counts[1],
+                                                          change_set.unchanged_rows - counts[2], saved=False)
+
+        self.change_set = change_set
+        self._report_results(sheet_results, saved=False)
+
+    def _collect_sheet_changes(self, main_sheet: "Merger._MainSheet", plan: MergePlan, change_set: ChangeSet,
+                               merged_row_count: int) -> int:
+        """
+        Add the changes that the merge plan of a main sheet would make to a change set.
+
+        Returns:
+            The amount of rows merged so far.
+        """
+        main_columns = dict(zip(main_sheet.dry_run_main_indices,
+                                main_sheet.main_keys_future.result()[len(self.key_columns):]))
+        labels = main_sheet.header
+        width = len(labels)
+        title = main_sheet.title
+
+        for changes in reversed(plan.inserted):
+            values = [None] * width
+            self._apply_changes_to_values(main_sheet, values, changes)
+            main_key = self._main_key_of(main_sheet, values)
+            change_set.add_row(None, main_key, [CellChange(None, main_key, labels[main_index], None, values[main_index],
+                                                           title)
+                                                for main_index in main_sheet.dry_run_main_indices
+                                                if values[main_index] is not None])
+
+            merged_row_count += changes.merged_count
+            self._row_merged(merged_row_count)
+
+        for main_key_position, changes in sorted(plan.updates.items()):
+            old_values = [None] * width
+            for main_index, column in main_columns.items():
+                old_values[main_index] = column[main_key_position]
+            values = list(old_values)
+            self._apply_changes_to_values(main_sheet, values, changes)
+
+            row = main_sheet.first_data_row + main_key_position
+            main_key = self._main_key_of(main_sheet, old_values)
+            change_set.add_row(row, main_key, [CellChange(row, main_key, labels[main_index], old_values[main_index],
+                                                          values[main_index], title)
+                                               for main_index in main_sheet.dry_run_main_indices
+                                               if values[main_index] != old_values[main_index]])
+
+            merged_row_count += changes.merged_count
+            self._row_merged(merged_row_count)
+
+        return merged_row_count
+
+    def _needs_saving(self, sheet_results: Dict[str, MergeResult]) -> bool:
+        """Whether the merged file is saved. Merging into the original file without any changes leaves it untouched."""
+        changed_row_count = sum(result.inserted_rows + result.updated_rows for result in sheet_results.values())
+        return changed_row_count > 0 or self.merged_file_path != self.original_file_path
+
+    def _row_merged(self, merged_row_count: int):
+        if self.metrics.row_sample_interval > 0:
+            self.metrics.row_merged(merged_row_count)
+        self._hook_row_merged(merged_row_count - 1)
+
+    def _report_results(self, sheet_results: Dict[str, MergeResult], saved: bool):
+        self.sheet_results = {title: result._replace(saved=saved) for title, result in sheet_results.items()}
+        self.result = MergeResult(sum(result.inserted_rows for result in sheet_results.values()),
+                                  sum(result.updated_rows for result in sheet_results.values()),
+                                  sum(result.unchanged_rows for result in sheet_results.values()), saved)
+        self._hook_merge_result(self.result)
+
+    def _original_rows(self, main_sheet: "Merger._MainSheet", sheet_rows: Optional[_streaming.SheetRows]
+                       ) -> Iterator[Tuple[List, Sequence[int], Dict[str, str]]]:
+        """
+        Iterate over the values of each row of a main sheet, along with the style ID of each of its cells and the
+        attributes of its row dimension. Rows of a loaded sheet are read through `sheet_rows`.
+        """
+        if sheet_rows is None:
+            # Rows are padded to the header's width, so that any of its columns can be updated
+            width = len(main_sheet.header)
+            return ((values, (), {}) for values in _delimited.iter_rows(self.original_file_path, width))
+
+        # Rows are at least as wide as the header, so that any of its columns can be updated
+        padding = [None] * len(main_sheet.header)
+        return (([cell.value for cell in row] + padding[len(row):], [_streaming.cell_style_id(cell) for cell in row],
+                 row_dimension)
+                for row, row_dimension in sheet_rows)
+
+    def _plan_merges(self) -> List[MergePlan]:
+        """
+        Match the rows of every new sheet against the keys of their main sheet, without modifying any main sheet.
+
+        Returns:
+            The merge plan of each main sheet, in the same order as the main sheets.
+        """
+        if self._resumed_plans is not None:
+            return self._resumed_plans
+
+        plans = []
+        # Rows are indexed across all main sheets, so that the indexing progress keeps counting up between sheets
+        row_offset = 0
+        for main_sheet in self._main_sheets:
+            with self.metrics.phase("indexing"):
+                plan = MergePlan(*self._index_main_keys(main_sheet, row_offset), duplicate_keys=self.duplicate_keys)
+            for input_index, appending in enumerate(main_sheet.appending_sheets):
+                if self.duplicate_keys == DuplicateKeyPolicy.ERROR:
+                    self._check_inserted_keys(main_sheet, plan)
+                self._hook_input_merging(input_index, appending.file_path)
+                plan.merge(input_index, appending.table)
+
+            plans.append(plan)
+            row_offset += main_sheet.max_row - main_sheet.header_row
+
+        if self._checkpoint is not None:
+            self._write_checkpoint(plans)
+
+        return plans
+
+    def _check_inserted_keys(self, main_sheet: "Merger._MainSheet", plan: MergePlan):
+        """
+        Refuse to merge any further new sheet once a key has been inserted more than once, like a separate merge would
+        refuse to, since the key is then used by more than one row of the main sheet
+        """
+        for key, input_index in plan.duplicate_inserted_keys().items():
+            appending = main_sheet.appending_sheets[input_index]
+            raise MergeException(f"The key '{key}' is used by more than one new row of "
+                                 f"{self._describe_sheet(appending.file_path, appending.sheet_title)}, so the "
+                                 f"following new spreadsheets can not be merged into "
+                                 f"{self._describe_sheet(self.original_file_path, main_sheet.title)}.")
+
+    def _resolve_engine(self, engine: MergeEngine) -> MergeEngine:
+        # Delimited files are only ever read row by row, and written in a single pass
+        if _delimited.is_delimited(self.original_file_path) or _delimited.is_delimited(self.merged_file_path):
+            if engine == MergeEngine.FULL:
+                raise MergeException("Only the streaming engine can merge CSV and TSV spreadsheets.")
+            return MergeEngine.STREAMING
+
+        if engine != MergeEngine.AUTO:
+            return engine
+
+        threshold_bytes = Config.get(ConfigProperty.STREAMING_THRESHOLD_MB) * 1024 * 1024
+        files_size = sum(path.stat().st_size for path in (self.original_file_path, *self.new_file_paths))
+        return MergeEngine.STREAMING if files_size > threshold_bytes else MergeEngine.FULL
+
+    @staticmethod
+    def _order_new_files(new_file_paths: List[Path], precedence: MergePrecedence) -> List[Path]:
+        """Order the new spreadsheet files by how they are merged, where the last file takes precedence"""
+        if precedence == MergePrecedence.FIRST_WINS:
+            return new_file_paths[::-1]
+        elif precedence == MergePrecedence.NEWEST_WINS:
+            # Files with the same modification time keep their given order
+            return sorted(new_file_paths, key=lambda path: path.stat().st_mtime_ns)
+
+        return new_file_paths
 
     def _clean_stop(self):
-        # Close workbook files
-        self._original_wb.close()
-        self._new_wb.close()
+        # Close the workbook file, if it has been loaded
+        if self._original_wb is not None:
+            self._original_wb.close()
+        # Stop any columns that are still waiting to be read
+        if self._column_reader is not None:
+            self._column_reader.close(cancel=True)
 
     class _LabelIndices(NamedTuple):
         main_label_index: int
         new_label_index: Optional[int]
 
-    def _locate_header_row(self, sheet) -> int:
-        # Iterate over all columns in the main sheet to find the header column (based on where the column key is)
-        for row in sheet.rows:
-            for cell in row:
-                if cell.value == self.column_key:
-                    return cell.row
+    class _CopyPlan(NamedTuple):
+        main_indices: Tuple[int, ...]
+        """Indices of the main sheet's columns that are updated"""
+        new_indices: Tuple[int, ...]
+        """Indices of the new sheet's columns that each main sheet column is updated from"""
+        get_main: Callable[[Sequence], tuple]
+        """Extracts the updated columns from a main sheet row"""
+
+    class _AppendingSheet:
+        """A new spreadsheet that is merged into the main sheet, along with how its columns map to the main sheet"""
 
-        return 0
+        def __init__(self, file_path: Path, sheet_index: int, sheet_title: str, probe: SheetProbe):
+            self.file_path = file_path
+            self.sheet_index = sheet_index
+            """Index of the merged sheet among the worksheets of the new spreadsheet"""
+            self.sheet_title = sheet_title
+            self.header_row = probe.header_row
+            self.first_data_row = probe.header_row + 1
+            self.header = probe.header
+            self.max_row = probe.max_row
+            self.label_indices: Dict[str, Merger._LabelIndices] = {}
+            self.key_label_indices: Tuple[Merger._LabelIndices, ...] = ()
+            """Label indices of each key column, in the order of the key columns"""
+            self.copy_plan: Optional[Merger._CopyPlan] = None
+            self.table = ColumnTable([])
+            """Normalized keys, along with the columns in the copy plan in the same order as the copy plan"""
 
-    def _locate_labels(self):
-        """Map column label indexes used in new sheet to the main sheet indexes"""
+    class _MainSheet:
+        """A sheet of the original spreadsheet, along with the sheets of the new spreadsheets that are merged into it"""
+
+        def __init__(self, index: int, title: str, probe: SheetProbe,
+                     appending_sheets: List["Merger._AppendingSheet"]):
+            self.index = index
+            """Index of the sheet among the worksheets of the original spreadsheet"""
+            self.title = title
+            self.header_row = probe.header_row
+            self.first_data_row = probe.header_row + 1
+            self.header = probe.header
+            self.max_row = probe.max_row
+            self.appending_sheets = appending_sheets
+            """Sheets of the new spreadsheets, in the order they are merged"""
+            self.key_main_indices: Tuple[int, ...] = ()
+            self.get_key_values: Callable[[Sequence], tuple] = _items_getter(())
+            """Extracts the key columns from a row of the sheet"""
+            self.stored_key_index: Optional[Dict[Any, KeyIndexEntry]] = None
+            self.main_keys_future: Optional[Future] = None
+            """Key columns of the sheet followed by its `dry_run_main_indices` columns, if they are read as columns"""
+            self.dry_run_main_indices: Tuple[int, ...] = ()
+            self.sheet: Optional[Worksheet] = None
+            """Loaded sheet, or `None` if the original spreadsheet is not loaded as a workbook"""
+            self.format_row: Tuple[Cell] = ()
+            self.format_styles: List[StyleArray] = []
+
+    def _probe_files(self):
+        """
+        Locate the merged sheets of all spreadsheets and the header row of each of them, by only reading the beginning
+        of each spreadsheet file
+        """
+        header_scan_rows = Config.get(ConfigProperty.HEADER_SCAN_ROWS)
+        original_sheet_names = self._sheet_names(self.original_file_path)
+        new_sheet_names = [self._sheet_names(path) for path in self.new_file_paths]
+
+        main_sheets: List[Merger._MainSheet] = []
+        for mapping in self.sheets:
+            main_index = self._resolve_sheet(self.original_file_path, original_sheet_names, mapping.main_sheet)
+            main_title = original_sheet_names[main_index]
+            if any(main_sheet.index == main_index for main_sheet in main_sheets):
+                raise MergeException(f"The sheet '{main_title}' of `{self.original_file_path}` is merged into more "
+                                     f"than once.")
+            original_probe = probe_sheet(self.original_file_path, self.column_key, header_scan_rows, main_index)
+
+            appending_sheets = []
+            for path, names in zip(self.new_file_paths, new_sheet_names):
+                new_index = self._resolve_sheet(path, names, mapping.new_reference)
+                appending_sheets.append(self._AppendingSheet(path, new_index, names[new_index],
+                                                             probe_sheet(path, self.column_key, header_scan_rows,
+                                                                         new_index)))
+
+            header_rows = [(self.original_file_path, main_title, original_probe.header_row),
+                           *((appending.file_path, appending.sheet_title, appending.header_row)
+                             for appending in appending_sheets)]
+            missing_sheets = [self._describe_sheet(path, title) for path, title, header_row in header_rows
+                              if not header_row]
+            if len(missing_sheets) == 1:
+                raise MergeException(f"The key '{self.column_key}' is not a column label within the first "
+                                     f"{header_scan_rows} rows of {missing_sheets[0]}.")
+            elif missing_sheets:
+                spreadsheets_str = "either of the spreadsheets" if len(appending_sheets) == 1 \
+                    else "several of the spreadsheets"
+                sheet_str = f" for the sheet '{main_title}'" if self.sheets != [FIRST_SHEET] else ""
+                raise MergeException(f"The key '{self.column_key}' is not a column label within the first "
+                                     f"{header_scan_rows} rows of {spreadsheets_str}{sheet_str}.")
+
+            main_sheets.append(self._MainSheet(main_index, main_title, original_probe, appending_sheets))
+
+        self._main_sheets = main_sheets
+        # Header row of the first merged sheet
+        self.original_header_row = main_sheets[0].header_row
+
+    @staticmethod
+    def _sheet_names(file_path: Path) -> List[str]:
+        # Delimited files have a single sheet, which any sheet of the mapping refers to
+        return [file_path.stem] if _delimited.is_delimited(file_path) else sheet_names(file_path)
+
+    @staticmethod
+    def _resolve_sheet(file_path: Path, names: List[str], sheet: SheetReference) -> int:
+        if _delimited.is_delimited(file_path):
+            return 0
+        return resolve_sheet(names, sheet, file_path)
+
+    def _describe_sheet(self, file_path: Path, sheet_title: str) -> str:
+        """Describe a sheet for messages, which only names the sheet if other sheets than the first ones are merged"""
+        if self.sheets == [FIRST_SHEET]:
+            return f"`{file_path}`"
+        return f"the sheet '{sheet_title}' of `{file_path}`"
+
+    def _locate_labels(self, main_sheet: _MainSheet, appending: _AppendingSheet) -> Dict[str, _LabelIndices]:
+        """Map column label indexes used in an appending sheet to the main sheet indexes"""
         label_indices: dict[str, Merger._LabelIndices] = {}
 
+        # The header rows were already read when the spreadsheet files were probed.
+        # Labels are matched regardless of their case, so the new sheet's labels are indexed by their case-folded form.
+        new_label_positions = {}
+        for new_label_index, new_label in enumerate(appending.header):
+            # if the new column label is empty, skip it
+            if new_label is None:
+                continue
+
+            folded_label = _fold_label(new_label)
+            if folded_label in new_label_positions:
+                self._report_duplicate_label(new_label, self._describe_sheet(appending.file_path,
+                                                                             appending.sheet_title))
+                continue
+            new_label_positions[folded_label] = new_label_index
+
         # Iterate over all the column labels in the main sheet
-        for (main_label_cell,) in self._original_sheet.iter_cols(min_row=self.original_header_row,
-                                                                 max_row=self.original_header_row):
+        main_labels = set()
+        for main_label_index, main_label in enumerate(main_sheet.header):
             # if the main column label is empty, skip it
-            if main_label_cell.value is None:
+            if main_label is None:
                 continue
 
-            # Find new sheet position of current column label being examined in the main sheet
-            for (new_label_cell,) in self._new_sheet.iter_cols(min_row=self.new_header_row,
-                                                               max_row=self.new_header_row):
+            folded_label = _fold_label(main_label)
+            if folded_label in main_labels:
+                self._report_duplicate_label(main_label, self._describe_sheet(self.original_file_path,
+                                                                              main_sheet.title))
+                continue
+            main_labels.add(folded_label)
 
-                # if the new column label is empty, skip it
-                if new_label_cell.value is None:
-                    continue
+            # Column labels in main that do not exist in new have no index, and are ignored later on
+            label_indices[main_label] = self._LabelIndices(main_label_index, new_label_positions.get(folded_label))
 
-                # Keep track of where the label exists in each
-                if main_label_cell.value.lower() == new_label_cell.value.lower():
-                    label_indices[main_label_cell.value] = self._LabelIndices(main_label_cell.column - 1,
-                                                                              new_label_cell.column - 1)
-                    break
+        return label_indices
 
-            # Column label in main does not exist in new, and should be ignored later on
-            if main_label_cell.value not in label_indices:
-                label_indices[main_label_cell.value] = self._LabelIndices(main_label_cell.column, None)
+    def _locate_key_labels(self, main_sheet: _MainSheet, appending: _AppendingSheet) -> Tuple[_LabelIndices, ...]:
+        """Find the label indices of each key column, which have to exist in both the main sheet and the new sheet"""
+        folded_label_indices = {_fold_label(label): indices for label, indices in appending.label_indices.items()}
+        key_label_indices = []
+        for key_label in self.key_columns:
+            indices = folded_label_indices.get(_fold_label(key_label))
+            if indices is None or indices.new_label_index is None:
+                sheet_str = self._describe_sheet(self.original_file_path, main_sheet.title) if indices is None \
+                    else self._describe_sheet(appending.file_path, appending.sheet_title)
+                raise MergeException(f"The key '{key_label}' is not a column label of {sheet_str}.")
+            key_label_indices.append(indices)
 
-        return label_indices
+        return tuple(key_label_indices)
 
-    def _map_main_keys(self, key_col_indices):
-        main_key_rows = {}
-        for key_row_index, key_row in enumerate(self._original_sheet.iter_rows(min_row=self._original_first_data_row)):
-            main_key_val = key_row[key_col_indices.main_label_index].value
-            main_key_rows[main_key_val] = key_row
+    def _report_duplicate_label(self, label, sheet_str: str):
+        # Rows can not be matched reliably if it is unclear which column holds the key
+        if any(_fold_label(label) == _fold_label(key_label) for key_label in self.key_columns):
+            raise MergeException(f"The key '{label}' is the label of more than one column in {sheet_str}.")
 
-            self._hook_row_indexed(key_row_index)
+        LOG.warning(f"The column label '{label}' is used more than once in {sheet_str}. Only the first column "
+                    f"with this label is merged.")
 
-        return main_key_rows
+    def _index_main_keys(self, main_sheet: _MainSheet, row_offset: int = 0) -> Tuple[Dict[Any, int],
+                                                                                     Dict[Any, List[int]]]:
+        """
+        Map each key of a main sheet to the position of the row that is updated, relative to the first data row.
 
-    def _update_row(self, main_row: Tuple[Cell], new_row: Tuple[Cell]):
-        for indexes in self._label_indices.values():
-            # If label does not exist in the new sheet, just ignore this label
-            if indexes.new_label_index is None:
+        Args:
+            main_sheet (Merger._MainSheet): Main sheet to index.
+            row_offset (int): Amount of rows indexed in any previous main sheets.
+
+        Returns:
+            The position of each key, along with the positions of the other rows that are updated for each duplicated
+            key, which is only filled by the `DuplicateKeyPolicy.ALL` policy.
+        """
+        if main_sheet.stored_key_index is not None:
+            # Stored indexes are only ever written for unique keys
+            return {main_key_val: entry.position for main_key_val, entry in main_sheet.stored_key_index.items()}, {}
+
+        if main_sheet.main_keys_future is not None:
+            main_keys = self._key_builder.column_keys(main_sheet.main_keys_future.result()[:len(self.key_columns)])
+        else:
+            # Only the key columns are read, along with any columns between them
+            min_col = min(main_sheet.key_main_indices)
+            key_rows = main_sheet.sheet.iter_rows(min_row=main_sheet.first_data_row,
+                                                  min_col=min_col + 1,
+                                                  max_col=max(main_sheet.key_main_indices) + 1,
+                                                  values_only=True)
+            get_key_values = _items_getter(tuple(index - min_col for index in main_sheet.key_main_indices))
+            row_key = self._key_builder.row_key
+            main_keys = (row_key(get_key_values(key_row)) for key_row in key_rows)
+
+        return self._map_main_keys(main_sheet, main_keys, row_offset)
+
+    def _map_main_keys(self, main_sheet: _MainSheet, main_keys: Iterable,
+                       row_offset: int = 0) -> Tuple[Dict[Any, int], Dict[Any, List[int]]]:
+        main_key_positions = {}
+        # Every position of each duplicated key. Only duplicated keys are tracked, so unique keys cost a single lookup.
+        duplicate_positions: Dict[Any, List[int]] = {}
+        key_row_index = -1
+        for key_row_index, main_key_val in enumerate(main_keys):
+            self._hook_row_indexed(row_offset + key_row_index)
+
+            # Rows without a key can not be told apart, so they are never updated
+            if main_key_val is None:
                 continue
 
-            main_row[indexes.main_label_index].value = new_row[indexes.new_label_index].value
+            first_position = main_key_positions.setdefault(main_key_val, key_row_index)
+            if first_position != key_row_index:
+                positions = duplicate_positions.get(main_key_val)
+                if positions is None:
+                    if self.duplicate_keys == DuplicateKeyPolicy.ERROR:
+                        raise MergeException(f"The key '{main_key_val}' is used by more than one row of "
+                                             f"{self._describe_sheet(self.original_file_path, main_sheet.title)}, on "
+                                             f"rows {main_sheet.first_data_row + first_position} and "
+                                             f"{main_sheet.first_data_row + key_row_index}.")
+                    positions = duplicate_positions[main_key_val] = [first_position]
+                positions.append(key_row_index)
+
+        # Every row below the header has a key, if only an empty one, so the size of a sheet that was probed from its
+        # stated dimensions is corrected here
+        main_sheet.max_row = main_sheet.header_row + key_row_index + 1
 
-    def _update_row_formatting(self, row: Tuple[Cell]):
-        for cell_index, cell in enumerate(row):
-            format_cell: Cell = self._format_row[cell_index]
+        if duplicate_positions:
+            duplicate_row_count = sum(len(positions) for positions in duplicate_positions.values())
+            LOG.warning(f"{len(duplicate_positions)} keys are used by more than one row of "
+                        f"{self._describe_sheet(self.original_file_path, main_sheet.title)}, {duplicate_row_count} "
+                        f"rows in total. They are merged by the "
+                        f"'{self.duplicate_keys.value}' duplicate key policy.")
+            self._hook_duplicate_keys(len(duplicate_positions), duplicate_row_count)
 
-            cell.font = copy(format_cell.font)
-            cell.fill = copy(format_cell.fill)
-            cell.border = copy(format_cell.border)
-            cell.number_format = copy(format_cell.number_format)
-            cell.protection = copy(format_cell.protection)
-            cell.alignment = copy(format_cell.alignment)
-            cell.quotePrefix = copy(format_cell.quotePrefix)
-            cell.pivotButton = copy(format_cell.pivotButton)
+        if self.duplicate_keys == DuplicateKeyPolicy.LAST:
+            for main_key_val, positions in duplicate_positions.items():
+                main_key_positions[main_key_val] = positions[-1]
+        elif self.duplicate_keys == DuplicateKeyPolicy.ALL:
+            # The first position is already in the main key positions
+            return main_key_positions, {main_key_val: positions[1:]
+                                        for main_key_val, positions in duplicate_positions.items()}
 
-    def _add_timestamp(self):
+        return main_key_positions, {}
+
+    def _write_key_index(self, key_index: KeyIndexBuilder):
+        # The merge itself has already succeeded, so failing to write the index only means it gets rebuilt next time
+        try:
+            # An index can only hold a single row for each key, so duplicated keys are always indexed from the sheet
+            if not key_index.unique:
+                index_path(self.merged_file_path).unlink(missing_ok=True)
+                LOG.info(f"The merge index of `{self.merged_file_path}` was not written, since its keys are not "
+                         f"unique.")
+                return
+
+            write_key_index(self.merged_file_path, self._key_signature(), self._merged_header_row(self._main_sheets[0]),
+                            key_index.entries)
+        except (OSError, sqlite3.Error):
+            LOG.warning(f"The merge index of `{self.merged_file_path}` could not be written.", exc_info=True)
+
+    def _open_checkpoint(self):
+        """Open the checkpoint of the merge, and continue from the merge plans it holds if it has any"""
+        # The settings that decide which rows are matched, since the content of the files is identified separately
+        settings = repr((self._key_signature(), self.duplicate_keys.value,
+                         [(main_sheet.index, [appending.sheet_index for appending in main_sheet.appending_sheets])
+                          for main_sheet in self._main_sheets]))
+        try:
+            fingerprint = input_fingerprint([self.original_file_path, *self.new_file_paths], settings)
+        except OSError:
+            LOG.warning("The merge checkpoint is not used, since the merged files could not be read.", exc_info=True)
+            return
+
+        self._checkpoint = MergeCheckpoint(self.merged_file_path, fingerprint)
+        stored_plans = self._checkpoint.read()
+        if stored_plans is not None and len(stored_plans) == len(self._main_sheets):
+            self._resumed_plans = stored_plans
+            LOG.info(f"Resuming the merge into `{self.merged_file_path}` from its checkpoint, which holds "
+                     f"{self._merged_row_count(stored_plans)} matched rows.")
+
+    @staticmethod
+    def _merged_row_count(plans: List[MergePlan]) -> int:
+        return sum(changes.merged_count for plan in plans for changes in (*plan.updates.values(), *plan.inserted))
+
+    def _write_checkpoint(self, plans: List[MergePlan]):
+        # Matching the rows of a small merge again costs less than writing its checkpoint. Any stale checkpoint is
+        # still removed once the merge has finished.
+        if self._merged_row_count(plans) < self.checkpoint_min_rows:
+            return
+
+        # Merging goes on without a checkpoint if it can not be written, it can only not be resumed then
+        try:
+            self._checkpoint.write_plans(plans)
+        except (OSError, sqlite3.Error, TypeError, ValueError):
+            LOG.warning(f"The merge checkpoint `{self._checkpoint.path}` could not be written.", exc_info=True)
+            self._checkpoint = None
+
+    def _uses_key_index(self) -> bool:
+        # The key index of a spreadsheet only ever describes its first sheet
+        return self.use_key_index and len(self._main_sheets) == 1 and self._main_sheets[0].index == 0
+
+    def _key_signature(self) -> str:
+        """Identifies the key columns and their normalization, which a stored key index is only valid for"""
+        if len(self.key_columns) == 1 and self.key_normalization == KeyNormalization():
+            return self.column_key
+
+        return repr((self.key_columns, self.key_normalization))
+
+    def _main_key_of(self, main_sheet: _MainSheet, values: Sequence) -> Any:
+        """Normalized key of a main sheet row"""
+        return self._key_builder.row_key(main_sheet.get_key_values(values))
+
+    @staticmethod
+    def _insert_new_rows(main_sheet: _MainSheet, amount: int) -> List[Tuple[Cell]]:
+        """Insert a block of empty rows above the first data row of a main sheet, and return the inserted rows"""
+        if amount == 0:
+            return []
+
+        _insert_rows(main_sheet.sheet, main_sheet.first_data_row, amount)
+        return list(main_sheet.sheet.iter_rows(min_row=main_sheet.first_data_row,
+                                               max_row=main_sheet.first_data_row + amount - 1))
+
+    def _compile_copy_plan(self, label_indices: Dict[str, _LabelIndices]) -> _CopyPlan:
+        """Determine which columns are copied from a new sheet to the main sheet, so rows can be updated in bulk"""
+        # Labels that do not exist in the new sheet are ignored
+        copied_labels = [indexes for indexes in label_indices.values() if indexes.new_label_index is not None]
+        main_indices = tuple(indexes.main_label_index for indexes in copied_labels)
+        new_indices = tuple(indexes.new_label_index for indexes in copied_labels)
+
+        return self._CopyPlan(main_indices, new_indices, _items_getter(main_indices))
+
+    @staticmethod
+    def _update_row(main_row: Tuple[Cell], new_values: Sequence, copy_plan: _CopyPlan) -> bool:
+        """
+        Update a main sheet row with the values of the columns in the copy plan. Cells that already hold their new
+        value are left alone.
+
+        Returns:
+            Whether any cell of the row was changed.
+        """
+        changed = False
+        for main_cell, new_value in zip(copy_plan.get_main(main_row), new_values):
+            if main_cell.value != new_value:
+                main_cell.value = new_value
+                changed = True
+
+        return changed
+
+    def _apply_changes(self, main_sheet: _MainSheet, main_row: Tuple[Cell], changes: RowChanges) -> bool:
+        """
+        Update a main sheet row with the values merged into it from each new sheet.
+
+        Returns:
+            Whether any cell of the row was changed.
+        """
+        changed = False
+        for input_index, new_values in changes.values_by_input.items():
+            if self._update_row(main_row, new_values, main_sheet.appending_sheets[input_index].copy_plan):
+                changed = True
+
+        return changed
+
+    @staticmethod
+    def _apply_changes_to_values(main_sheet: _MainSheet, values: List, changes: RowChanges) -> bool:
+        """
+        Update the values of a main sheet row with the values merged into it from each new sheet.
+
+        Returns:
+            Whether any of the values was changed.
+        """
+        changed = False
+        for input_index, new_values in changes.values_by_input.items():
+            for main_index, new_value in zip(main_sheet.appending_sheets[input_index].copy_plan.main_indices,
+                                             new_values):
+                if values[main_index] != new_value:
+                    values[main_index] = new_value
+                    changed = True
+
+        return changed
+
+    @staticmethod
+    def _update_row_formatting(row: Tuple[Cell], format_styles: List[StyleArray]):
+        # Every cell gets its own copy of the style array, since setting a style attribute modifies it in place.
+        # The style IDs it refers to are shared through the workbook's style table.
+        for cell, format_style in zip(row, format_styles):
+            cell._style = copy(format_style)
+
+    def _add_timestamp(self, main_sheet: _MainSheet):
         timestamp_cell_str = Config.get(ConfigProperty.MERGE_TIMESTAMP_CELL)
 
         # Add a row in case the header row and timestamp cell might overlap
-        if self._original_sheet[timestamp_cell_str].row == self.original_header_row:
-            self._original_sheet.insert_rows(1)
+        if main_sheet.sheet[timestamp_cell_str].row == main_sheet.header_row:
+            _insert_rows(main_sheet.sheet, 1)
 
         # Update cell to indicate the date the sheet was modified
-        modified_time_str = datetime.now().strftime("%A %B %d %Y, %I:%M%p")
-        self._original_sheet[Config.get(ConfigProperty.MERGE_TIMESTAMP_CELL)].value = modified_time_str
+        main_sheet.sheet[Config.get(ConfigProperty.MERGE_TIMESTAMP_CELL)].value = self._timestamp_str()
+
+    def _merged_header_row(self, main_sheet: _MainSheet) -> int:
+        """Header row of a merged sheet, which is moved down if a row was added for the timestamp"""
+        if _delimited.is_delimited(self.merged_file_path):
+            return main_sheet.header_row
+
+        timestamp_row, _ = self._timestamp_position()
+        return main_sheet.header_row + 1 if timestamp_row == main_sheet.header_row else main_sheet.header_row
+
+    @staticmethod
+    def _timestamp_position() -> Tuple[int, int]:
+        column_letter, row = coordinate_from_string(Config.get(ConfigProperty.MERGE_TIMESTAMP_CELL))
+        return row, column_index_from_string(column_letter)
+
+    @staticmethod
+    def _timestamp_str() -> str:
+        return datetime.now().strftime("%A %B %d %Y, %I:%M%p")
 
 
     def _hook_initialization(self):
@@ -216,6 +1228,25 @@ class Merger:
             row_index (int): Index of the row that was just indexed pre-merge.
         """
 
+    def _hook_duplicate_keys(self, duplicate_key_count, duplicate_row_count):
+        """
+        Hook that runs once the main sheet has been indexed, if any of its keys are used by more than one row.
+
+        Args:
+            duplicate_key_count (int): Amount of keys that are used by more than one row.
+            duplicate_row_count (int): Amount of rows that have any of these keys.
+        """
+
+    def _hook_input_merging(self, input_index, file_path):
+        """
+        Hook that runs when the rows of the next new spreadsheet are about to be merged. The streaming engine merges
+        the rows of every new spreadsheet while writing the merged file, so it runs when each new spreadsheet is read.
+
+        Args:
+            input_index (int): Index of the new spreadsheet, in the order the new spreadsheets are merged.
+            file_path (Path): Path of the new spreadsheet.
+        """
+
     def _hook_row_merged(self, row_index):
         """
         Hook that runs immediately after a row in the spreadsheet has been merged.
@@ -229,6 +1260,15 @@ class Merger:
         Hook that runs right before saving the merged rows to a new file.
         """
 
+    def _hook_merge_result(self, result):
+        """
+        Hook that runs once the merged file has been saved, or once it's clear that it doesn't need to be saved.
+
+        Args:
+            result (MergeResult): How many rows were inserted, updated or left unchanged, and whether the merged file
+                was saved.
+        """
+
     def _hook_success(self):
         """
         Hook that runs when the merge process completes successfully.
@@ -0,0 +1,135 @@
+"""
+Instrumentation of merges, which records how long each phase of a merge takes and how much memory it needs. Phases can
+contain other phases, where the time of an inner phase is only counted towards the inner phase.
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak memory is not recorded
+    resource = None
+
+PHASES = ("load", "header_detection", "label_mapping", "indexing", "merge", "formatting", "timestamp", "save")
+"""Phases of a merge, in the order they start"""
+
+
+def peak_rss_mib() -> Optional[float]:
+    """Peak resident memory of the current process so far, or `None` if it can not be determined"""
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, while macOS reports bytes
+    return peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+class PhaseMetrics:
+    """Totals of every run of a single phase"""
+    __slots__ = ("wall_seconds", "cpu_seconds", "calls", "peak_rss_mib")
+
+    def __init__(self):
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.calls = 0
+        self.peak_rss_mib: Optional[float] = None
+        """Peak resident memory of the process by the end of the phase's last run"""
+
+    def to_dict(self) -> dict:
+        return {"wall_seconds": round(self.wall_seconds, 6), "cpu_seconds": round(self.cpu_seconds, 6),
+                "calls": self.calls, "peak_rss_mib": self.peak_rss_mib}
+
+
+class _PhaseRun:
+    """Context manager for a single run of a phase"""
+    __slots__ = ("_metrics", "_name", "_wall_start", "_cpu_start", "_inner_wall", "_inner_cpu")
+
+    def __init__(self, metrics: "MergeMetrics", name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._inner_wall = 0.0
+        self._inner_cpu = 0.0
+        self._metrics._running.append(self)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *_):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        running = self._metrics._running
+        running.pop()
+        if running:
+            running[-1]._inner_wall += wall
+            running[-1]._inner_cpu += cpu
+
+        phase = self._metrics.phases.get(self._name)
+        if phase is None:
+            phase = self._metrics.phases[self._name] = PhaseMetrics()
+        phase.wall_seconds += wall - self._inner_wall
+        phase.cpu_seconds += cpu - self._inner_cpu
+        phase.calls += 1
+        phase.peak_rss_mib = peak_rss_mib()
+
+
+class MergeMetrics:
+    """Wall time, CPU time and peak memory of each phase of a merge, along with samples of the per-row latency"""
+
+    def __init__(self, row_sample_interval: int = 0):
+        """
+        Args:
+            row_sample_interval (int): Amount of merged rows between latency samples, or 0 to take no samples.
+        """
+        self.phases: Dict[str, PhaseMetrics] = {}
+        """Metrics of each phase that has run, by the name of the phase"""
+        self.row_sample_interval = row_sample_interval
+        self.row_latency_samples: List[Tuple[int, float]] = []
+        """Amount of merged rows, along with the average seconds per row since the previous sample"""
+        self._running: List[_PhaseRun] = []
+        self._last_sample: Tuple[int, float] = (0, 0.0)
+
+    def phase(self, name: str) -> _PhaseRun:
+        """Measure a run of a phase, as a context manager"""
+        return _PhaseRun(self, name)
+
+    def start_row_sampling(self):
+        self._last_sample = (0, time.perf_counter())
+
+    def row_merged(self, merged_row_count: int):
+        """Take a latency sample, if enough rows have been merged since the previous sample"""
+        last_count, last_time = self._last_sample
+        if merged_row_count - last_count >= self.row_sample_interval:
+            now = time.perf_counter()
+            self.row_latency_samples.append((merged_row_count, (now - last_time) / (merged_row_count - last_count)))
+            self._last_sample = (merged_row_count, now)
+
+    def to_dict(self, include_samples: bool = True) -> dict:
+        metrics_dict = {
+            # Phases are recorded as they finish, so they are listed in the order they start instead
+            "phases": {name: self.phases[name].to_dict()
+                       for name in sorted(self.phases, key=lambda name: PHASES.index(name) if name in PHASES
+                                          else len(PHASES))},
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+        latencies = sorted(latency for _, latency in self.row_latency_samples)
+        if latencies:
+            metrics_dict["row_latency_seconds"] = {
+                "samples": len(latencies),
+                "median": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1],
+            }
+            if include_samples:
+                metrics_dict["row_latency_samples"] = [[count, latency] for count, latency in self.row_latency_samples]
+
+        return metrics_dict
+
+    def write(self, file_path: Path):
+        file_path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
@@ -1,14 +1,19 @@
 import logging
 import signal
+from abc import ABC, abstractmethod
 import sys
 import traceback
 from dataclasses import dataclass
 from enum import Enum, auto
-from multiprocessing import Pipe, Process
+from multiprocessing import Array, Pipe, Process
 from pathlib import Path
-from typing import Optional, get_args, Union
+from typing import Optional, Union, Sequence
 
-from merger.merger import Merger
+from merger._config import Config, ConfigProperty
+from merger.keys import KeyNormalization
+from merger.merger import Merger, MergeEngine, MergePrecedence, DuplicateKeyPolicy
+from merger.progress import ProgressReporter
+from merger.sheets import SheetMapping, SheetReference
 
 LOG = logging.getLogger(__name__)
 
@@ -34,61 +39,55 @@ class MergeMessage:
     """Current merging progress string representation"""
 
 
-MessageType = Union[MergeMessage, tuple]
+_STATUSES = list(MergeStatus)
+"""Statuses by the index they are shared between processes with"""
+
+MessageType = tuple
 """
-Tuple only used if an exception is raised. It follows the structure of sys.exc_info() 
+Only sent if an exception is raised. It follows the structure of sys.exc_info() 
 (https://docs.python.org/3/library/sys.html#sys.exc_info), except that the traceback has been converted to a formatted
 string
 """
 
 
-class NonblockingMerger(Merger):
-    def __init__(self, main_file_path: Path, new_file_path: Path, column_key: str,
-                 merged_file_name: Optional[str] = None):
-        super().__init__(main_file_path, new_file_path, column_key, merged_file_name)
-
-        # Used for passing around data about the progress
-        self._nonblock_conn, self._merger_conn = Pipe()
-        self._merge_proc = Process(target=self._start_merge, daemon=True)
+class _ProgressMerger(Merger, ABC):
+    """
+    Merger that loads and merges the spreadsheets in another process than the one that tracks its progress. Only the
+    merge process publishes the progress, which subclasses pass along to the tracking process.
+    """
 
+    def _init_progress(self):
+        """Determine the maximum progress from the probed sheets, before the merge process is started"""
+        self._input_index = -1
         # Maximum progress is subtracted to account for the header rows on each sheet.
-        # The maximum row count for the original sheet is used to determine the indexing progress.
-        self._max_indexing_progress = self._original_max_row - self.original_header_row
-        # The maximum row count for the new sheet is used to determine the merging progress.
-        self._max_merging_progress = self._new_max_row - self.new_header_row
-
-    def merge(self):
-        self._merge_proc.start()
+        # The maximum row counts for the merged sheets of the original are used to determine the indexing progress.
+        self._max_indexing_progress = sum(main_sheet.max_row - main_sheet.header_row
+                                          for main_sheet in self._main_sheets)
+        # The maximum row counts for the new sheets are used to determine the merging progress.
+        self._max_merging_progress = sum(appending.max_row - appending.header_row
+                                         for main_sheet in self._main_sheets
+                                         for appending in main_sheet.appending_sheets)
 
     @property
     def max_progress(self):
         return self._max_indexing_progress + self._max_merging_progress
 
-    def _start_merge(self):
-        # Set up a termination handler for the new process in the case it needs to be cancelled
-        def termination_handler(*_):
-            LOG.error("STOPPING MERGE PROCESS")
-            self._clean_stop()
-            exit(1)
-
-        signal.signal(signal.SIGTERM, termination_handler)
-
-        # Send initialization status before merging
-        self._update_status(
-            MergeMessage(MergeStatus.INIT, 0, "Initializing merging processing..."))
-
-        # Begin the blocking merge process on the new process
-        super().merge()
+    def _start_reporting(self):
+        """Start publishing the progress, from within the merge process"""
+        self._reporter = ProgressReporter(self._publish_progress,
+                                          Config.get(ConfigProperty.PROGRESS_INTERVAL_ROWS),
+                                          Config.get(ConfigProperty.PROGRESS_INTERVAL_MS) / 1000)
+        self._reporter.status(MergeStatus.INIT)
 
-    def _update_status(self, message: MessageType):
-        self._merger_conn.send(message)
+    @abstractmethod
+    def _publish_progress(self, status: MergeStatus, progress: int):
+        """Pass an update of the status and progress along to the tracking process, from within the merge process"""
 
     def _hook_initialization(self):
         """
         Hook that runs immediately before the merge process is about to start
         """
-        self._update_status(
-            MergeMessage(MergeStatus.MERGING, 0, "Indexing the original spreadsheet..."))
+        self._reporter.status(MergeStatus.INDEXING)
 
     def _hook_row_indexed(self, row_index):
         """
@@ -98,10 +97,18 @@ class NonblockingMerger(Merger):
             row_index (int): Index of the row that was just indexed pre-merge.
         """
         # The main sheet's max row amount is the "maximum" for indexing progress, because only the main sheet is indexed
-        progress = row_index
-        message_str = f"Indexed Rows:\n{progress}/{self._max_indexing_progress}"
-        self._update_status(
-            MergeMessage(MergeStatus.INDEXING, progress, message_str))
+        self._reporter.update(row_index)
+
+    def _hook_input_merging(self, input_index, file_path):
+        """
+        Hook that runs when the rows of the next new spreadsheet are about to be merged.
+
+        Args:
+            input_index (int): Index of the new spreadsheet, in the order the new spreadsheets are merged.
+            file_path (Path): Path of the new spreadsheet.
+        """
+        # Only shared along with the next progress update
+        self._input_index = input_index
 
     def _hook_row_merged(self, row_index):
         """
@@ -110,29 +117,106 @@ class NonblockingMerger(Merger):
         Args:
             row_index (int): Index of the row that was just merged
         """
-        progress = row_index + 1
-        message_str = f"Merged Rows:\n{progress}/{self._max_merging_progress}"
-        self._update_status(
-            MergeMessage(MergeStatus.MERGING, progress + self._max_indexing_progress, message_str))
+        # Rows with a duplicated key can each be merged, which merges more rows than the new sheets hold
+        progress = min(row_index + 1 + self._max_indexing_progress, self.max_progress)
+        if self._reporter.current_status != MergeStatus.MERGING:
+            self._reporter.status(MergeStatus.MERGING, progress)
+        else:
+            self._reporter.update(progress)
 
     def _hook_pre_saving(self):
         """
         Hook that runs right before saving the merged rows to a new file.
         """
-        self._update_status(
-            MergeMessage(MergeStatus.SAVING, self.max_progress, "Saving merged file..."))
+        self._reporter.status(MergeStatus.SAVING, self.max_progress)
 
     def _hook_success(self):
         """
         Hook that runs when the merge process completes successfully.
         """
-        self._update_status(
-            MergeMessage(MergeStatus.COMPLETE, self.max_progress, "Saving merged file..."))
+        self._reporter.status(MergeStatus.COMPLETE, self.max_progress)
+
+    def _format_progress(self, status: MergeStatus, progress: int, input_index: int) -> str:
+        if status == MergeStatus.INIT:
+            return "Initializing merging processing..."
+        elif status == MergeStatus.INDEXING:
+            if progress == 0:
+                return "Indexing the original spreadsheet..."
+            return f"Indexed Rows:\n{progress}/{self._max_indexing_progress}"
+        elif status == MergeStatus.MERGING:
+            progress_str = f"Merged Rows:\n{progress - self._max_indexing_progress}/{self._max_merging_progress}"
+            # Only name the merging spreadsheet if there is more than one
+            if len(self.new_file_paths) > 1 and input_index >= 0:
+                progress_str += (f"\n{self.new_file_paths[input_index].name} "
+                                 f"({input_index + 1}/{len(self.new_file_paths)})")
+            return progress_str
+        else:
+            return "Saving merged file..."
+
+
+class NonblockingMerger(_ProgressMerger):
+    def __init__(self, main_file_path: Path, new_file_path: Union[Path, Sequence[Path]],
+                 column_key: Union[str, Sequence[str]],
+                 merged_file_name: Optional[str] = None, engine: Union[MergeEngine, str] = MergeEngine.AUTO,
+                 use_key_index: Optional[bool] = None,
+                 precedence: Union[MergePrecedence, str] = MergePrecedence.LAST_WINS,
+                 duplicate_keys: Union[DuplicateKeyPolicy, str, None] = None,
+                 key_normalization: Optional[KeyNormalization] = None, compression_level: Optional[int] = None,
+                 profile_path: Optional[Path] = None,
+                 sheets: Optional[Sequence[Union[SheetMapping, SheetReference, tuple]]] = None,
+                 checkpoint_min_rows: Optional[int] = None):
+        # The workbooks are only loaded by the merge process. Until then, the spreadsheet files are only probed for
+        # what is needed to validate the column key and to track the merging progress.
+        # The merge process is a daemon process, which can not start any worker processes of its own
+        self._init_settings(main_file_path, new_file_path, column_key, merged_file_name, engine, use_key_index,
+                            precedence, parse_workers=0, duplicate_keys=duplicate_keys,
+                            key_normalization=key_normalization, compression_level=compression_level,
+                            profile_path=profile_path, sheets=sheets, checkpoint_min_rows=checkpoint_min_rows)
+        self._probe_files()
+        self._init_progress()
+
+        # The status, progress and merging new spreadsheet are shared as three numbers, and are only written as often
+        # as the progress reporter allows. The pipe is only used for passing along exceptions.
+        self._shared_progress = Array("q", 3)
+        self._nonblock_conn, self._merger_conn = Pipe()
+        self._merge_proc = Process(target=self._start_merge, daemon=True)
+
+    def merge(self):
+        self._merge_proc.start()
+
+    def _start_merge(self):
+        # Set up a termination handler for the new process in the case it needs to be cancelled
+        def termination_handler(*_):
+            LOG.error("STOPPING MERGE PROCESS")
+            self._clean_stop()
+            # Exiting unwinds the merge, so a save in progress removes its temporary file and leaves the target intact
+            exit(1)
+
+        signal.signal(signal.SIGTERM, termination_handler)
+
+        # Send initialization status before merging
+        self._start_reporting()
+
+        # Load the workbooks within the merge process, so they are never parsed or copied by the GUI process
+        try:
+            self._run_phase("load", self._load)
+        except BaseException as e:
+            self._hook_exception()
+            raise e from e
+
+        # Begin the blocking merge process on the new process
+        super().merge()
+
+    def _publish_progress(self, status: MergeStatus, progress: int):
+        with self._shared_progress.get_lock():
+            self._shared_progress[0] = _STATUSES.index(status)
+            self._shared_progress[1] = progress
+            self._shared_progress[2] = self._input_index
 
     def _hook_exception(self):
         exc_info = list(sys.exc_info())
         exc_info[2] = traceback.format_exc()
-        self._update_status(tuple(exc_info))
+        self._merger_conn.send(tuple(exc_info))
 
     def stop(self):
         if self._merge_proc.is_alive():
@@ -142,13 +226,13 @@ class NonblockingMerger(Merger):
     def is_stopped(self):
         return self._merge_proc.is_alive()
 
-    def get_status(self) -> Optional[MergeMessage]:
+    def get_status(self) -> MergeMessage:
         message: Optional[MessageType] = None
         while self._nonblock_conn.poll():
             message = self._nonblock_conn.recv()
 
         # If the message received is not of the expected type, then something has gone wrong
-        if not (isinstance(message, get_args(MessageType)) or message is None):
+        if not (isinstance(message, MessageType) or message is None):
             raise Exception(f"Received invalid status update during merge process. Message was: {message}")
 
         # An error occurred in the merge process
@@ -157,4 +241,8 @@ class NonblockingMerger(Merger):
             exc_type, exc, exc_traceback = message
             raise Exception(f"Failure occurred during merge: {exc}:\n\n{exc_traceback}")
 
-        return message
+        with self._shared_progress.get_lock():
+            status_index, progress, input_index = self._shared_progress[:]
+        status = _STATUSES[status_index]
+
+        return MergeMessage(status, progress, self._format_progress(status, progress, input_index))
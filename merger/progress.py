@@ -0,0 +1,49 @@
+import time
+from typing import Callable, Any
+
+
+class ProgressReporter:
+    """
+    Rate limits progress updates that are published for every row. An update is only published once both the given
+    amount of rows has been processed, and the given amount of time has passed since the last published update. Status
+    changes are always published immediately.
+    """
+
+    def __init__(self, publish: Callable[[Any, int], None], interval_rows: int = 1, interval_seconds: float = 0):
+        """
+        Args:
+            publish (Callable[[Any, int], None]): Called with the current status and progress value to publish them.
+            interval_rows (int): Minimum amount of progress between published updates.
+            interval_seconds (float): Minimum amount of time between published updates.
+        """
+        self._publish = publish
+        self._interval_rows = max(interval_rows, 1)
+        self._interval_seconds = interval_seconds
+
+        self._status = None
+        self._last_progress = 0
+        self._last_time = 0.0
+
+    @property
+    def current_status(self):
+        return self._status
+
+    def status(self, status, progress: int = 0):
+        """Publish a new status, along with its initial progress"""
+        self._status = status
+        self._send(progress)
+
+    def update(self, progress: int):
+        """Publish the progress of the current status, if enough rows and time have passed since the last update"""
+        # The row count is checked first, so the clock is only read once every interval of rows
+        if progress - self._last_progress < self._interval_rows:
+            return
+        if time.monotonic() - self._last_time < self._interval_seconds:
+            return
+
+        self._send(progress)
+
+    def _send(self, progress: int):
+        self._publish(self._status, progress)
+        self._last_progress = progress
+        self._last_time = time.monotonic()
@@ -0,0 +1,65 @@
+"""
+Selection of the sheets that are merged. Each sheet of the original spreadsheet that is merged into is paired with a
+sheet of the new spreadsheets, where either sheet is given by its name or by its index among the worksheets.
+"""
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence, Union
+
+from merger.exceptions import MergeException
+
+SheetReference = Union[str, int]
+"""Name of a sheet, or its index starting at 0"""
+
+
+class SheetMapping(NamedTuple):
+    main_sheet: SheetReference
+    """Sheet of the original spreadsheet"""
+    new_sheet: Optional[SheetReference] = None
+    """Sheet of each new spreadsheet that is merged into the main sheet. Defaults to the main sheet's name or index."""
+
+    @property
+    def new_reference(self) -> SheetReference:
+        return self.main_sheet if self.new_sheet is None else self.new_sheet
+
+    @classmethod
+    def parse(cls, text: str) -> "SheetMapping":
+        """
+        Parse a mapping of the form `MAIN` or `MAIN=NEW`, where a sheet that is a whole number is selected by its
+        index rather than by its name
+        """
+        main_sheet, separator, new_sheet = text.partition("=")
+        return cls(_parse_reference(main_sheet), _parse_reference(new_sheet) if separator else None)
+
+
+FIRST_SHEET = SheetMapping(0, 0)
+"""Merges the first sheet of each spreadsheet, which is what is merged unless any sheets are given"""
+
+
+def _parse_reference(text: str) -> SheetReference:
+    return int(text) if text.isdigit() else text
+
+
+def resolve_sheet(sheet_names: Sequence[str], sheet: SheetReference, file_path: Path) -> int:
+    """
+    Find the index of a sheet among the worksheets of a spreadsheet file. Names are matched exactly if possible, and
+    regardless of their case otherwise.
+
+    Args:
+        sheet_names (Sequence[str]): Names of the worksheets, in their order.
+        sheet (SheetReference): Name or index of the sheet.
+        file_path (Path): Path of the spreadsheet file, to report a missing sheet.
+    """
+    if isinstance(sheet, int):
+        if not 0 <= sheet < len(sheet_names):
+            raise MergeException(f"`{file_path}` has no sheet {sheet}, its sheets are numbered 0 to "
+                                 f"{len(sheet_names) - 1}.")
+        return sheet
+
+    if sheet in sheet_names:
+        return sheet_names.index(sheet)
+
+    folded_names = [name.casefold() for name in sheet_names]
+    if sheet.casefold() in folded_names:
+        return folded_names.index(sheet.casefold())
+
+    raise MergeException(f"`{file_path}` has no sheet named '{sheet}'.")
@@ -0,0 +1,42 @@
+import re
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence
+
+import pytest
+from openpyxl import Workbook
+
+
+def _understate_dimensions(file_path: Path):
+    """Rewrite the `<dimension>` of every worksheet to a single cell, like some applications that write spreadsheets"""
+    with zipfile.ZipFile(file_path) as source:
+        parts = [(info, source.read(info.filename)) for info in source.infolist()]
+
+    with zipfile.ZipFile(file_path, "w", zipfile.ZIP_DEFLATED) as target:
+        for info, data in parts:
+            if info.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            target.writestr(info, data)
+
+
+@pytest.fixture
+def understated_workbook(tmp_path: Path) -> Callable[..., Path]:
+    """
+    Creates a spreadsheet file with the given rows in its first sheet, along with the rows of any other sheets by their
+    title. Every sheet states a dimension of only its first cell.
+    """
+    def create(name: str, rows: Sequence[Sequence],
+               other_sheets: Optional[Dict[str, Sequence[Sequence]]] = None) -> Path:
+        file_path = tmp_path / name
+        wb = Workbook()
+        for row in rows:
+            wb.active.append(row)
+        for title, sheet_rows in (other_sheets or {}).items():
+            sheet = wb.create_sheet(title)
+            for row in sheet_rows:
+                sheet.append(row)
+        wb.save(file_path)
+        _understate_dimensions(file_path)
+        return file_path
+
+    return create
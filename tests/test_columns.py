@@ -0,0 +1,7 @@
+from merger._columns import read_columns
+
+
+def test_read_columns_past_understated_dimension(understated_workbook):
+    file_path = understated_workbook("new.xlsx", [["Id", "Name", "Extra"], [1, "a", "x"], [2, "b"], [3]])
+
+    assert read_columns(file_path, 2, (0, 2)) == [[1, 2, 3], ["x", None, None]]
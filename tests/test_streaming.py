@@ -0,0 +1,78 @@
+import re
+import zipfile
+
+import openpyxl
+import pytest
+
+from merger.merger import MergeEngine, Merger
+
+
+def _merged_rows(file_path) -> list:
+    wb = openpyxl.load_workbook(file_path)
+    try:
+        # The first row holds the merge timestamp
+        return [list(row) for row in wb.worksheets[0].iter_rows(min_row=2, values_only=True)]
+    finally:
+        wb.close()
+
+
+def _dimension(file_path, sheet_number: int = 1) -> str:
+    with zipfile.ZipFile(file_path) as archive:
+        sheet_xml = archive.read(f"xl/worksheets/sheet{sheet_number}.xml").decode()
+    return re.search(r'<dimension ref="([^"]*)"\s*/>', sheet_xml).group(1)
+
+
+@pytest.mark.parametrize("parse_workers", [0, 1])
+def test_merge_past_understated_dimension(understated_workbook, parse_workers: int):
+    main_path = understated_workbook("main.xlsx", [["Id", "Name", "Extra"], [1, "a", "x1"], [2, "b"], [3, "c", "x3"]])
+    new_path = understated_workbook("new.xlsx", [["Id", "Name"], [2, "B"], [4, "d"]])
+
+    # Merged in place, so that any row that is not read would be lost
+    merge = Merger(main_path, new_path, "Id", engine=MergeEngine.STREAMING, parse_workers=parse_workers)
+    merge.merge()
+
+    assert merge.result.inserted_rows == 1 and merge.result.updated_rows == 1
+    assert _merged_rows(main_path) == [["Id", "Name", "Extra"], [4, "d", None], [1, "a", "x1"], [2, "B", None],
+                                       [3, "c", "x3"]]
+    assert _dimension(main_path) == "A1:C6"
+
+
+def test_copy_sheet_past_understated_dimension(understated_workbook):
+    main_path = understated_workbook("main.xlsx", [["Id", "Name"], [1, "a"]],
+                                     {"Other": [["kept", "row", "wide"], [2], [3], [4]]})
+    new_path = understated_workbook("new.xlsx", [["Id", "Name"], [2, "b"]])
+
+    merge = Merger(main_path, new_path, "Id", merged_file_name="merged.xlsx", engine=MergeEngine.STREAMING)
+    merge.merge()
+
+    wb = openpyxl.load_workbook(merge.merged_file_path)
+    assert [list(row) for row in wb["Other"].iter_rows(values_only=True)] == [["kept", "row", "wide"], [2, None, None],
+                                                                              [3, None, None], [4, None, None]]
+    assert _dimension(merge.merged_file_path, 2) == "A1:C4"
+
+
+def test_row_heights_match_full_engine(tmp_path):
+    main_path = tmp_path / "main.xlsx"
+    wb = openpyxl.Workbook()
+    for row in [["Id", "Name"], [1, "a"], [2, "b"], [3, "c"]]:
+        wb.active.append(row)
+    wb.active.row_dimensions[2].height = 30
+    wb.active.row_dimensions[4].height = 40
+    wb.save(main_path)
+    new_path = tmp_path / "new.xlsx"
+    wb = openpyxl.Workbook()
+    for row in [["Id", "Name"], [4, "d"], [2, "B"]]:
+        wb.active.append(row)
+    wb.save(new_path)
+
+    heights = {}
+    for engine in (MergeEngine.FULL, MergeEngine.STREAMING):
+        merge = Merger(main_path, new_path, "Id", merged_file_name=f"{engine.value}.xlsx", engine=engine)
+        merge.merge()
+        sheet = openpyxl.load_workbook(merge.merged_file_path).worksheets[0]
+        heights[engine] = [(row[0].value, sheet.row_dimensions[row[0].row].height)
+                           for row in sheet.iter_rows(min_row=2)]
+
+    # Rows keep their heights as they move down, while new rows do not take on the height of the format row
+    assert heights[MergeEngine.FULL] == [("Id", None), (4, None), (1, 30), (2, None), (3, 40)]
+    assert heights[MergeEngine.STREAMING] == heights[MergeEngine.FULL]
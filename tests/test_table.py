@@ -0,0 +1,188 @@
+import random
+import shutil
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from merger._table import ColumnTable, MergePlan
+from merger.exceptions import MergeException
+from merger.merger import DuplicateKeyPolicy, MergeEngine, Merger
+
+
+def _values(plan: MergePlan) -> dict:
+    """Merged values of each updated row, by its position"""
+    return {position: changes.values_by_input for position, changes in plan.updates.items()}
+
+
+def _inserted_values(plan: MergePlan) -> list:
+    return [changes.values_by_input for changes in plan.inserted]
+
+
+def test_column_table_rows():
+    table = ColumnTable(["a", "b"], [[1, 2], ["x", "y"]])
+
+    assert len(table) == 2
+    assert list(table.rows()) == [("a", (1, "x")), ("b", (2, "y"))]
+
+
+def test_column_table_rows_without_other_columns():
+    assert list(ColumnTable(["a", "b"]).rows()) == [("a", ()), ("b", ())]
+
+
+def test_column_table_key_positions_keep_last_row():
+    assert ColumnTable(["a", "b", "a"]).key_positions() == {"a": 2, "b": 1}
+
+
+def test_merge_updates_inserts_and_leaves_unchanged_rows():
+    plan = MergePlan({"a": 0, "b": 1, "c": 2})
+    plan.merge(0, ColumnTable(["b", "d"], [[20, 40]]))
+
+    assert _values(plan) == {1: {0: (20,)}}
+    # Rows of the main sheet that no new row matched are not part of the plan at all
+    assert 0 not in plan.updates and 2 not in plan.updates
+    assert _inserted_values(plan) == [{0: (40,)}]
+
+
+def test_later_tables_update_inserted_rows():
+    plan = MergePlan({"a": 0})
+    plan.merge(0, ColumnTable(["b"], [[1]]))
+    plan.merge(1, ColumnTable(["b", "a"], [[2, 3]]))
+
+    assert len(plan.inserted) == 1
+    assert plan.inserted[0].values_by_input == {0: (1,), 1: (2,)}
+    assert plan.inserted[0].merged_count == 2
+    assert _values(plan) == {0: {1: (3,)}}
+
+
+def test_last_row_of_a_table_wins():
+    plan = MergePlan({"a": 0})
+    plan.merge(0, ColumnTable(["a", "a"], [[1, 2]]))
+
+    assert _values(plan) == {0: {0: (2,)}}
+    assert plan.updates[0].merged_count == 2
+
+
+@pytest.mark.parametrize("policy, expected_inserted", [
+    # The last inserted row is at the top of the merged sheet, so the first inserted row is the last one
+    (DuplicateKeyPolicy.LAST, [{0: (1,), 1: (3,)}, {0: (2,)}]),
+    (DuplicateKeyPolicy.FIRST, [{0: (1,)}, {0: (2,), 1: (3,)}]),
+    (DuplicateKeyPolicy.ALL, [{0: (1,), 1: (3,)}, {0: (2,), 1: (3,)}]),
+])
+def test_rows_with_the_same_new_key_in_one_table_are_each_inserted(policy: DuplicateKeyPolicy,
+                                                                   expected_inserted: list):
+    plan = MergePlan({}, duplicate_keys=policy)
+    plan.merge(0, ColumnTable(["b", "b"], [[1, 2]]))
+    plan.merge(1, ColumnTable(["b"], [[3]]))
+
+    assert _inserted_values(plan) == expected_inserted
+    assert plan.duplicate_inserted_keys() == {"b": 0}
+
+
+def test_rows_without_a_key_are_skipped():
+    plan = MergePlan({"a": 0})
+    # Blank rows at the end of a new sheet have no key
+    plan.merge(0, ColumnTable(["a", "b", None, None], [[1, 2, None, None]]))
+
+    assert _values(plan) == {0: {0: (1,)}}
+    assert _inserted_values(plan) == [{0: (2,)}]
+
+
+def test_merge_into_duplicate_positions():
+    # How the main sheet keys are planned by the 'all' duplicate key policy: the first row is in the key positions
+    plan = MergePlan({"a": 0, "b": 1}, {"a": [2, 3]})
+    plan.merge(0, ColumnTable(["a", "b"], [[1, 2]]))
+
+    assert _values(plan) == {0: {0: (1,)}, 1: {0: (2,)}, 2: {0: (1,)}, 3: {0: (1,)}}
+
+
+@pytest.fixture
+def duplicated_csv(tmp_path: Path):
+    main_path = tmp_path / "main.csv"
+    main_path.write_text("Id,Name\n1,a\n2,b\n1,c\n")
+    new_path = tmp_path / "new.csv"
+    new_path.write_text("Id,Name\n1,x\n2,b\n3,y\n,\n")
+    return main_path, new_path
+
+
+@pytest.mark.parametrize("policy, expected_rows, updated_rows", [
+    (DuplicateKeyPolicy.FIRST, ["1,x", "2,b", "1,c"], 1),
+    (DuplicateKeyPolicy.LAST, ["1,a", "2,b", "1,x"], 1),
+    (DuplicateKeyPolicy.ALL, ["1,x", "2,b", "1,x"], 2),
+])
+def test_duplicate_key_policies(duplicated_csv, policy: DuplicateKeyPolicy, expected_rows: list, updated_rows: int):
+    main_path, new_path = duplicated_csv
+    merge = Merger(main_path, new_path, "Id", merged_file_name=f"merged_{policy.value}.csv", duplicate_keys=policy)
+    merge.merge()
+
+    lines = merge.merged_file_path.read_text().splitlines()
+    # The new row is inserted right below the header, while the blank new row is not inserted at all
+    assert lines == ["Id,Name", "3,y", *expected_rows]
+    assert merge.result.inserted_rows == 1
+    assert merge.result.updated_rows == updated_rows
+    assert merge.result.unchanged_rows == 1
+
+
+def test_error_duplicate_key_policy(duplicated_csv):
+    main_path, new_path = duplicated_csv
+    merge = Merger(main_path, new_path, "Id", merged_file_name="merged.csv", duplicate_keys=DuplicateKeyPolicy.ERROR)
+
+    with pytest.raises(MergeException, match="rows 2 and 4"):
+        merge.merge()
+
+
+def _save_rows(file_path: Path, rows: list):
+    wb = openpyxl.Workbook()
+    for row in rows:
+        wb.active.append(row)
+    wb.save(file_path)
+
+
+def _rows_from_header(file_path: Path) -> list:
+    wb = openpyxl.load_workbook(file_path)
+    try:
+        rows = [list(row) for row in wb.active.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+    # Each merge adds its timestamp above the header
+    return rows[next(index for index, row in enumerate(rows) if row[0] == "Id"):]
+
+
+@pytest.mark.parametrize("engine", [MergeEngine.FULL, MergeEngine.STREAMING])
+@pytest.mark.parametrize("policy", [DuplicateKeyPolicy.FIRST, DuplicateKeyPolicy.LAST, DuplicateKeyPolicy.ALL])
+@pytest.mark.parametrize("seed", range(5))
+def test_merging_several_files_matches_separate_merges(tmp_path: Path, engine: MergeEngine,
+                                                       policy: DuplicateKeyPolicy, seed: int):
+    rng = random.Random(seed)
+    main_path = tmp_path / "main.xlsx"
+    # Few distinct keys, so that keys are duplicated within the main sheet and within each new sheet
+    _save_rows(main_path, [["Id", "A", "B"], *([rng.randrange(6), rng.randrange(100), None] for _ in range(6))])
+    new_paths = []
+    for file_index in range(3):
+        labels = rng.choice([["Id", "A"], ["Id", "B"], ["Id", "A", "B"]])
+        new_paths.append(tmp_path / f"new{file_index}.xlsx")
+        _save_rows(new_paths[-1], [labels, *([rng.randrange(12), *(rng.randrange(100) for _ in labels[1:])]
+                                             for _ in range(5))])
+
+    merge = Merger(main_path, new_paths, "Id", merged_file_name="merged.xlsx", engine=engine, duplicate_keys=policy)
+    merge.merge()
+
+    separate_path = tmp_path / "separate.xlsx"
+    shutil.copy(main_path, separate_path)
+    for new_path in new_paths:
+        Merger(separate_path, new_path, "Id", engine=engine, duplicate_keys=policy).merge()
+
+    assert _rows_from_header(merge.merged_file_path) == _rows_from_header(separate_path)
+
+
+def test_error_policy_refuses_new_keys_that_are_inserted_more_than_once(tmp_path: Path):
+    main_path = tmp_path / "main.xlsx"
+    _save_rows(main_path, [["Id", "A"], [1, "a"]])
+    new_paths = [tmp_path / "new0.xlsx", tmp_path / "new1.xlsx"]
+    _save_rows(new_paths[0], [["Id", "A"], [2, "b"], [2, "c"]])
+    _save_rows(new_paths[1], [["Id", "A"], [1, "d"]])
+
+    # The second file could not be merged separately either, since the first one inserted the key 2 twice
+    merge = Merger(main_path, new_paths, "Id", merged_file_name="merged.xlsx", duplicate_keys=DuplicateKeyPolicy.ERROR)
+    with pytest.raises(MergeException, match="'2' is used by more than one new row"):
+        merge.merge()